@@ -1,20 +1,23 @@
-import json
+import io
 import logging
 import pathlib as pl
+import subprocess
+import threading
 import urllib
 from copy import deepcopy
 
-# Word must be installed for this to work!!
-import docx2pdf
-from docx.shared import Cm
+from docx.shared import Cm, Length
 from docxtpl import DocxTemplate, InlineImage, RichText
 
+from src.config import get_config
+from src.utils.artifacts import atomic_path
+from src.utils.cache import get_cache_dir
+from src.utils.docx_converter import DEFAULT_BACKEND, convert_docx
 from src.utils.favicon_downloader import get_favicon_from_website
 from src.utils.make_id_from_title import make_id_from_title
 from src.utils.make_qrcode import make_qrcode
+from src.utils.prepare_image import DEFAULT_DPI, prepare_image
 
-with open("config.json", "r") as config_file:
-    config = json.load(config_file)
 
 
 def initLogger() -> logging.Logger:
@@ -56,6 +59,28 @@ def initLogger() -> logging.Logger:
 
 logger = initLogger()
 
+# Template bytes by path, kept while the file is unchanged, so a long-running
+# process (e.g. src.server) doesn't re-read every template for every document.
+_template_cache: dict[pl.Path, tuple[int, bytes]] = {}
+_template_cache_lock = threading.Lock()
+
+
+def load_template(template_path: pl.Path) -> DocxTemplate:
+    """
+    Returns a fresh DocxTemplate of template_path, read from memory if possible.
+
+    :param Path template_path: Path to the docx template.
+    :return DocxTemplate: The template, ready to render.
+    """
+    assert isinstance(template_path, pl.Path)
+    mtime_ns = template_path.stat().st_mtime_ns
+    with _template_cache_lock:
+        cached = _template_cache.get(template_path)
+        if cached is None or cached[0] != mtime_ns:
+            cached = (mtime_ns, template_path.read_bytes())
+            _template_cache[template_path] = cached
+    return DocxTemplate(io.BytesIO(cached[1]))
+
 
 if __name__ == "__main__":
     pass
@@ -71,6 +96,9 @@ class DocumentGenerator(object):
         The path to the DocxTemplate file.
     processContext : function, optional
         A function to process the context before rendering the template.
+    keep_docx : bool
+        Whether the rendered docx is saved to disk. Otherwise it is only kept in
+        memory and streamed to the converter. Defaults to config["keep_intermediates"].
 
     Methods:
     --------
@@ -86,14 +114,19 @@ class DocumentGenerator(object):
         output_dir: pl.Path,
         precontext: dict,
         overwrite: bool = False,
+        keep_docx: bool | None = None,
     ) -> None:
         logger.info(f"template_path: {template_path}, output_dir: {output_dir}")
         assert isinstance(template_path, pl.Path)
         assert isinstance(output_dir, pl.Path)
         self.template_path = template_path
+        if keep_docx is None:
+            keep_docx = get_config().get("keep_intermediates", False)
+        self.keep_docx = keep_docx
+        self.docx_bytes = None
         output_dir.mkdir(parents=True, exist_ok=True)
         self.output_dir = output_dir
-        self.template = DocxTemplate(str(template_path))
+        self.template = load_template(template_path)
         self.docx_path = self.generateDocx(
             output_dir / pl.Path(output_dir.stem + ".docx"), precontext, overwrite
         )
@@ -105,12 +138,34 @@ class DocumentGenerator(object):
         assert isinstance(precontext, dict)
         return deepcopy(precontext)
 
+    def inlineImage(
+        self, image_path: str | pl.Path, width: Length, height: Length | None = None
+    ) -> InlineImage:
+        """
+        Creates an InlineImage, resampled to the size it is placed at.
+
+        The resolution is taken from config["images"]["dpi"].
+        """
+        config = get_config()
+        images_config = config.get("images", {})
+        prepared_path = prepare_image(
+            pl.Path(image_path),
+            width.inches,
+            height.inches if height else None,
+            dpi=images_config.get("dpi", DEFAULT_DPI),
+            cache_dir=get_cache_dir("images", config),
+        )
+        return InlineImage(self.template, str(prepared_path), width, height)
+
     def generateDocx(
         self, output_path: pl.Path, precontext: dict, overwrite: bool = False
-    ) -> pl.Path:
+    ) -> pl.Path | None:
         """
         Renders the template with the context and saves it to the output_path.
 
+        Unless keep_docx is set, the docx is rendered to memory (docx_bytes) and
+        output_path is never written.
+
         Parameters:
         -----------
         output_path : Path
@@ -118,17 +173,16 @@ class DocumentGenerator(object):
 
         Returns:
         --------
-        Path
-            The path to the saved rendered template.
+        Path | None
+            The path to the saved rendered template, None if it is only kept in memory.
         """
         assert isinstance(precontext, dict)
         assert isinstance(output_path, pl.Path)
         assert isinstance(overwrite, bool)
-        if output_path.exists() and not overwrite:
+        if self.keep_docx and output_path.exists() and not overwrite:
             raise FileExistsError(
                 f"{output_path} exists, please set 'overwrite' to True."
             )
-        output_path.parent.mkdir(parents=True, exist_ok=True)
 
         self.context = deepcopy(precontext)
         print("\n")
@@ -136,9 +190,18 @@ class DocumentGenerator(object):
         self.context = self.processContext(self.context)
         # Hopefully this works when called multiple times
         self.template.render(self.context)
-        self.template.save(str(output_path))
-        self.docx_path = output_path
-        logger.info(f"[SUCCESS] {self.template_path} rendered to {self.docx_path}")
+        if self.keep_docx:
+            with atomic_path(output_path) as tmp_path:
+                self.template.save(str(tmp_path))
+            self.docx_path = output_path
+            logger.info(f"[SUCCESS] {self.template_path} rendered to {self.docx_path}")
+        else:
+            buffer = io.BytesIO()
+            self.template.save(buffer)
+            self.docx_bytes = buffer.getvalue()
+            # Nothing is written to output_path
+            self.docx_path = None
+            logger.info(f"[SUCCESS] {self.template_path} rendered in memory")
 
         return self.docx_path
 
@@ -151,7 +214,7 @@ class DocumentGenerator(object):
     ) -> pl.Path:
         # Make sure there is some kind of docx to work with or generate
         assert (
-            self.docx_path or precontext
+            self.docx_path or self.docx_bytes or precontext
         ), "Please provide a precontext or generate a docx first."
         assert (
             isinstance(precontext, dict) or precontext is None
@@ -173,12 +236,16 @@ class DocumentGenerator(object):
 
         print("\n")
         logger.info("Converting docx to pdf...")
+        config = get_config()
+        backend = config.get("converter", {}).get("backend", DEFAULT_BACKEND)
+        docx = self.docx_path if self.keep_docx else self.docx_bytes
         try:
-            docx2pdf.convert(str(self.docx_path), str(output_path))
+            convert_docx(docx, output_path, backend=backend)
             self.pdf_path = output_path
-        except SystemExit as e:
+        except (SystemExit, OSError, subprocess.CalledProcessError) as e:
             logger.error(
-                f"[ERROR] {self.docx_path} could not be converted to pdf at {output_path}"
+                f"[ERROR] {self.docx_path or self.template_path} could not be converted "
+                f"to pdf at {output_path}"
             )
             logger.error(e)
             return pl.Path(config["error_pdf"])
@@ -192,7 +259,7 @@ class DocumentGenerator(object):
 class CoverGenerator(DocumentGenerator):
     def processContext(self, context: dict) -> dict:
         assert isinstance(context, dict)
-        context["logo"] = InlineImage(self.template, context["logo_path"], Cm(10))
+        context["logo"] = self.inlineImage(context["logo_path"], Cm(10))
         color_keys = ["title", "subsection", "author", "year"]
         for reading in context["core_readings"]:
             reading["title"] = RichText(
@@ -212,7 +279,7 @@ class CoverGenerator(DocumentGenerator):
 class FurtherGenerator(DocumentGenerator):
     def processContext(self, context: dict) -> dict:
         ## Logo
-        context["logo"] = InlineImage(self.template, context["logo_path"], Cm(2))
+        context["logo"] = self.inlineImage(context["logo_path"], Cm(2))
 
         ## Id, Truncate links, QR codes, and thumbnails to context
         for reading in context["further_readings"]:
@@ -230,9 +297,7 @@ class FurtherGenerator(DocumentGenerator):
                 qr_code_dir = self.output_dir / pl.Path("qr_codes/")
                 qr_code_dir.mkdir(parents=True, exist_ok=True)
                 qr_code_path = make_qrcode(url, id, output_path=qr_code_dir)
-                reading["qr_code"] = InlineImage(
-                    self.template, str(qr_code_path), Cm(3)
-                )
+                reading["qr_code"] = self.inlineImage(qr_code_path, Cm(3))
                 ## Add thumbnails if needed
                 if not reading["thumbnail_path"]:
                     thumbnail_dir = self.output_dir / pl.Path("thumbnails/")
@@ -245,8 +310,8 @@ class FurtherGenerator(DocumentGenerator):
                     reading["thumbnail_path"]
                     and pl.Path(reading["thumbnail_path"]).exists()
                 ):
-                    reading["thumbnail"] = InlineImage(
-                        self.template, reading["thumbnail_path"], Cm(3), Cm(3)
+                    reading["thumbnail"] = self.inlineImage(
+                        reading["thumbnail_path"], Cm(3), Cm(3)
                     )
 
         return context
@@ -255,7 +320,7 @@ class FurtherGenerator(DocumentGenerator):
 class GuideGenerator(DocumentGenerator):
     def processContext(self, context: dict) -> dict:
         assert isinstance(context, dict)
-        context["logo"] = InlineImage(self.template, context["logo_path"], Cm(10))
+        context["logo"] = self.inlineImage(context["logo_path"], Cm(10))
         return context
 
 
@@ -264,7 +329,7 @@ class DeviceReadingGenerator(DocumentGenerator):
     def processContext(self, context: dict) -> dict:
         assert isinstance(context, dict)
         ## Logo
-        context["logo"] = InlineImage(self.template, context["logo_path"], Cm(2))
+        context["logo"] = self.inlineImage(context["logo_path"], Cm(2))
 
         ## Id, Truncate links, QR codes, and thumbnails to context
         reading = context["device_reading"]
@@ -282,7 +347,7 @@ class DeviceReadingGenerator(DocumentGenerator):
             qr_code_dir = self.output_dir / pl.Path("qr_codes/")
             qr_code_dir.mkdir(parents=True, exist_ok=True)
             qr_code_path = make_qrcode(url, id, output_path=qr_code_dir)
-            reading["qr_code"] = InlineImage(self.template, str(qr_code_path), Cm(3))
+            reading["qr_code"] = self.inlineImage(qr_code_path, Cm(3))
             ## Add thumbnails if needed
             if not reading["thumbnail_path"]:
                 thumbnail_dir = self.output_dir / pl.Path("thumbnails/")
@@ -295,8 +360,8 @@ class DeviceReadingGenerator(DocumentGenerator):
                 reading["thumbnail_path"]
                 and pl.Path(reading["thumbnail_path"]).exists()
             ):
-                reading["thumbnail"] = InlineImage(
-                    self.template, reading["thumbnail_path"], Cm(3), Cm(3)
+                reading["thumbnail"] = self.inlineImage(
+                    reading["thumbnail_path"], Cm(3), Cm(3)
                 )
 
         return context
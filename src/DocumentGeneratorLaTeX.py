@@ -3,9 +3,12 @@ import subprocess
 from copy import deepcopy
 import pathlib as pl
 import logging
-import json
 import urllib
-import shutil
+import tempfile
+
+from src.config import get_config
+from src.utils.artifacts import atomic_copy, atomic_write_text
+from src.utils.limits import limit
 
 
 def latex_escape(text):
@@ -50,8 +53,6 @@ def get_favicon_from_website(url, output_path):
     return favicon_path
 
 
-with open("config.json", "r") as config_file:
-    config = json.load(config_file)
 
 
 def initLogger() -> logging.Logger:
@@ -188,8 +189,7 @@ class DocumentGenerator(object):
         # Render the template
         rendered_tex = self.template.render(self.context)
         # Save the rendered template to output_path
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(rendered_tex)
+        atomic_write_text(output_path, rendered_tex)
         self.tex_path = output_path
         logger.info(f"[SUCCESS] {self.template_path} rendered to {self.tex_path}")
 
@@ -237,25 +237,36 @@ class DocumentGenerator(object):
             # For safety, we should run pdflatex in the output directory
             compile_dir = self.output_dir
             tex_filename = self.tex_path.name
-            command = ["pdflatex", "-interaction=nonstopmode", tex_filename]
-            # Run the command in the compile_dir
-            result = subprocess.run(
-                command,
-                cwd=str(compile_dir),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            if result.returncode != 0:
-                logger.error("[ERROR] pdflatex compilation failed.")
-                logger.error(result.stderr.decode())
-                return pl.Path(config.get("error_pdf", "error.pdf"))
+            # pdflatex writes the pdf as it goes, so it writes to a scratch directory
+            # and the finished pdf is moved into place
+            with tempfile.TemporaryDirectory() as build_dir:
+                command = [
+                    "pdflatex",
+                    "-interaction=nonstopmode",
+                    f"-output-directory={build_dir}",
+                    tex_filename,
+                ]
+                # Run the command in the compile_dir
+                with limit("latex"):
+                    result = subprocess.run(
+                        command,
+                        cwd=str(compile_dir),
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                    )
+                if result.returncode != 0:
+                    logger.error("[ERROR] pdflatex compilation failed.")
+                    logger.error(result.stderr.decode())
+                    return pl.Path(get_config().get("error_pdf", "error.pdf"))
+                built_pdf = pl.Path(build_dir) / self.tex_path.with_suffix(".pdf").name
+                atomic_copy(built_pdf, output_path)
             self.pdf_path = output_path
         except Exception as e:
             logger.error(
                 f"[ERROR] {self.tex_path} could not be compiled to pdf at {output_path}"
             )
             logger.error(e)
-            return pl.Path(config.get("error_pdf", "error.pdf"))
+            return pl.Path(get_config().get("error_pdf", "error.pdf"))
         logger.info(f"[SUCCESS] {self.template_path} compiled to {self.pdf_path}")
         return self.pdf_path
 
@@ -269,7 +280,7 @@ class CoverGenerator(DocumentGenerator):
         # Ensure that image paths are correct and accessible to LaTeX
         logo_src = pl.Path(context["logo_path"])
         logo_dst = self.output_dir / logo_src.name
-        shutil.copy(logo_src, logo_dst)
+        atomic_copy(logo_src, logo_dst)
         context["logo_path"] = logo_dst.name  # Relative to output_dir
 
         # For readings, prepare the text and colors
@@ -290,7 +301,7 @@ class FurtherGenerator(DocumentGenerator):
         ## Logo
         logo_src = pl.Path(context["logo_path"])
         logo_dst = self.output_dir / logo_src.name
-        shutil.copy(logo_src, logo_dst)
+        atomic_copy(logo_src, logo_dst)
         context["logo_path"] = logo_dst.name  # Relative to output_dir
 
         ## Id, Truncate links, QR codes, and thumbnails to context
@@ -310,7 +321,7 @@ class FurtherGenerator(DocumentGenerator):
                 qr_code_dir.mkdir(parents=True, exist_ok=True)
                 qr_code_path = makeQRCode(url, id, output_path=qr_code_dir)
                 qr_code_dst = self.output_dir / qr_code_path.name
-                shutil.copy(qr_code_path, qr_code_dst)
+                atomic_copy(qr_code_path, qr_code_dst)
                 reading["qr_code_path"] = qr_code_dst.name  # Relative to output_dir
 
                 ## Add thumbnails if needed
@@ -328,7 +339,7 @@ class FurtherGenerator(DocumentGenerator):
                 ):
                     thumbnail_src = pl.Path(reading["thumbnail_path"])
                     thumbnail_dst = self.output_dir / thumbnail_src.name
-                    shutil.copy(thumbnail_src, thumbnail_dst)
+                    atomic_copy(thumbnail_src, thumbnail_dst)
                     reading["thumbnail_path"] = (
                         thumbnail_dst.name
                     )  # Relative to output_dir
@@ -345,7 +356,7 @@ class GuideGenerator(DocumentGenerator):
         assert isinstance(context, dict)
         logo_src = pl.Path(context["logo_path"])
         logo_dst = self.output_dir / logo_src.name
-        shutil.copy(logo_src, logo_dst)
+        atomic_copy(logo_src, logo_dst)
         context["logo_path"] = logo_dst.name  # Relative to output_dir
         return context
 
@@ -356,7 +367,7 @@ class DeviceReadingGenerator(DocumentGenerator):
         ## Logo
         logo_src = pl.Path(context["logo_path"])
         logo_dst = self.output_dir / logo_src.name
-        shutil.copy(logo_src, logo_dst)
+        atomic_copy(logo_src, logo_dst)
         context["logo_path"] = logo_dst.name  # Relative to output_dir
 
         ## Id, Truncate links, QR codes, and thumbnails to context
@@ -376,7 +387,7 @@ class DeviceReadingGenerator(DocumentGenerator):
             qr_code_dir.mkdir(parents=True, exist_ok=True)
             qr_code_path = makeQRCode(url, id, output_path=qr_code_dir)
             qr_code_dst = self.output_dir / qr_code_path.name
-            shutil.copy(qr_code_path, qr_code_dst)
+            atomic_copy(qr_code_path, qr_code_dst)
             reading["qr_code_path"] = qr_code_dst.name  # Relative to output_dir
 
             ## Add thumbnails if needed
@@ -394,7 +405,7 @@ class DeviceReadingGenerator(DocumentGenerator):
             ):
                 thumbnail_src = pl.Path(reading["thumbnail_path"])
                 thumbnail_dst = self.output_dir / thumbnail_src.name
-                shutil.copy(thumbnail_src, thumbnail_dst)
+                atomic_copy(thumbnail_src, thumbnail_dst)
                 reading["thumbnail_path"] = thumbnail_dst.name  # Relative to output_dir
         else:
             reading["truncated_url"] = ""
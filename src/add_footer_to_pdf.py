@@ -1,24 +1,40 @@
 from pypdf import PdfWriter, PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+)
 from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
 import io
 import pathlib as pl
 from reportlab.pdfgen import canvas
 
+from src.utils.artifacts import atomic_open
+from src.utils.pdf_stream import StreamingPdfWriter, number
+
+FOOTER_FONT_RESOURCE = "/PMFooterFont"
+FOOTER_XOBJECT_RESOURCE = "/PMFooter"
+FOOTER_Y = 20
+
 
 def _create_footer_pdf(
     num_pages: int,
     footer_text="AISF Readings — Page {i} of {n}",
     font_name="Helvetica",
     font_size=8,
-    skip_pages=[1, 2],
+    skip_pages=(1, 2),
 ) -> PdfReader:
     assert isinstance(num_pages, int)
     packet = io.BytesIO()
     c = canvas.Canvas(packet, pagesize=letter)
     c.setFont(font_name, font_size)
 
+    skip_indices = {j - 1 for j in skip_pages}
     for i in range(num_pages):
-        if i not in list(map(lambda j: j - 1, skip_pages)):
+        if i not in skip_indices:
             footer = footer_text.format(i=i + 1, n=num_pages)
             footer_width = c.stringWidth(footer, font_name, font_size)
             footer_object = c.beginText((letter[0] - footer_width) / 2, 20)
@@ -54,7 +70,134 @@ def add_footer_to_pdf(
         pdf_writer.add_page(page)
 
     # Write the pages to a new PDF file
-    with open(str(output_pdf_path), "wb") as f_out:
+    with atomic_open(output_pdf_path) as f_out:
         pdf_writer.write(f_out)
 
-    return output_pdf_path
\ No newline at end of file
+    return output_pdf_path
+
+
+def _pdf_string(text: str) -> bytes:
+    """Encodes text as a literal pdf string for a WinAnsiEncoding font."""
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _stream(data: bytes, entries: dict | None = None) -> DecodedStreamObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    for key, value in (entries or {}).items():
+        stream[NameObject(key)] = value
+    return stream
+
+
+class FooterStamper:
+    """
+    Page hook for StreamingPdfWriter that stamps page number footers while merging.
+
+    The static part of the footer (everything before "{i}") is drawn by a single
+    form XObject shared by every page. Each page only gets a tiny content stream
+    that places that XObject and draws its own page number, if footer_text has one.
+    """
+
+    def __init__(
+        self,
+        writer: StreamingPdfWriter,
+        num_pages: int,
+        footer_text: str = "AISF Readings — Page {i} of {n}",
+        font_name: str = "Helvetica",
+        font_size: int = 8,
+        skip_pages: tuple[int, ...] = (1, 2),
+    ) -> None:
+        """
+        :param StreamingPdfWriter writer: Writer the footer objects are written to.
+        :param int num_pages: Total number of pages of the output, used for "{n}".
+        :param str footer_text: Footer template with "{i}" (page) and "{n}" (total) fields.
+        :param str font_name: Name of a standard pdf font, defaults to Helvetica.
+        :param int font_size: Font size of the footer, defaults to 8.
+        :param tuple[int, ...] skip_pages: 1-based pages without a footer, defaults to (1, 2).
+        """
+        self.font_name = font_name
+        self.font_size = font_size
+        self.skip_pages = frozenset(skip_pages)
+        prefix, numbered, suffix = footer_text.partition("{i}")
+        self.numbered = bool(numbered)
+        self.prefix = prefix.format(n=num_pages)
+        self.suffix = suffix.format(n=num_pages)
+        self.prefix_width = stringWidth(self.prefix, font_name, font_size)
+
+        font = writer.add_object(
+            DictionaryObject(
+                {
+                    NameObject("/Type"): NameObject("/Font"),
+                    NameObject("/Subtype"): NameObject("/Type1"),
+                    NameObject("/BaseFont"): NameObject(f"/{font_name}"),
+                    NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+                }
+            )
+        )
+        self.font = font
+        self.footer_xobject = writer.add_object(
+            _stream(
+                b"BT " + FOOTER_FONT_RESOURCE.encode() + f" {font_size} Tf 0 0 Td ".encode()
+                + _pdf_string(self.prefix) + b" Tj ET",
+                {
+                    "/Type": NameObject("/XObject"),
+                    "/Subtype": NameObject("/Form"),
+                    "/BBox": ArrayObject(
+                        [
+                            NumberObject(0),
+                            number(-font_size),
+                            number(round(self.prefix_width + 1, 2)),
+                            number(font_size * 2),
+                        ]
+                    ),
+                    "/Resources": DictionaryObject(
+                        {
+                            NameObject("/Font"): DictionaryObject(
+                                {NameObject(FOOTER_FONT_RESOURCE): font}
+                            )
+                        }
+                    ),
+                },
+            )
+        )
+        # Isolate the original page content from the footer's graphics state
+        self.save_state = writer.add_object(_stream(b"q\n"))
+        self.restore_state = writer.add_object(_stream(b"\nQ\n"))
+        self.writer = writer
+
+    def __call__(
+        self, page_number: int, page: DictionaryObject, box: tuple[float, float, float, float]
+    ) -> None:
+        if page_number in self.skip_pages:
+            return
+        page_text = f"{page_number}{self.suffix}" if self.numbered else ""
+        width = self.prefix_width + stringWidth(page_text, self.font_name, self.font_size)
+        x = round(box[0] + (box[2] - box[0] - width) / 2, 2)
+        y = box[1] + FOOTER_Y
+        data = f"q 0 g 1 0 0 1 {x} {y} cm ".encode() + FOOTER_XOBJECT_RESOURCE.encode() + b" Do"
+        if page_text:
+            data += (
+                b" BT "
+                + FOOTER_FONT_RESOURCE.encode()
+                + f" {self.font_size} Tf {round(self.prefix_width, 2)} 0 Td ".encode()
+                + _pdf_string(page_text)
+                + b" Tj ET"
+            )
+        footer = self.writer.add_object(_stream(data + b" Q"))
+
+        resources = page.get("/Resources")
+        if not isinstance(resources, DictionaryObject):
+            resources = page[NameObject("/Resources")] = DictionaryObject()
+        for key, name, ref in (
+            ("/Font", FOOTER_FONT_RESOURCE, self.font),
+            ("/XObject", FOOTER_XOBJECT_RESOURCE, self.footer_xobject),
+        ):
+            entries = resources.get(key)
+            if not isinstance(entries, DictionaryObject):
+                entries = resources[NameObject(key)] = DictionaryObject()
+            entries[NameObject(name)] = ref
+
+        page[NameObject("/Contents")] = ArrayObject(
+            [self.save_state, *page.get("/Contents", []), self.restore_state, footer]
+        )
@@ -3,16 +3,26 @@ from pathlib import Path
 from typing import Any
 
 import dotenv
-import requests
 from airtable import airtable
 
+from src.utils.artifacts import atomic_write_bytes, atomic_write_text
+from src.utils.http import get_session
 from src.utils.make_id_from_title import make_id_from_title
 
-env = dotenv.dotenv_values("secrets/.env")
-API_KEY = env["AIRTABLE_API_KEY"]
 BASE_ID = "app6h2R2QQuhvFYVq"
-assert API_KEY and isinstance(API_KEY, str)
-mopman = airtable.Airtable(BASE_ID, API_KEY)
+
+_client: airtable.Airtable | None = None
+
+
+def get_client() -> airtable.Airtable:
+    """Returns the Airtable client, reading the API key from secrets/.env on first use."""
+    global _client
+    if _client is None:
+        env = dotenv.dotenv_values("secrets/.env")
+        api_key = env["AIRTABLE_API_KEY"]
+        assert api_key and isinstance(api_key, str)
+        _client = airtable.Airtable(BASE_ID, api_key)
+    return _client
 
 at_map = {
     "curriculum": "📚 curriculum",
@@ -63,12 +73,10 @@ def getPrecontextForCurriculum(
         assert isinstance(file_path, Path)
         assert file_path.suffix == ""
         file_path.parent.mkdir(parents=True, exist_ok=True)
-        request = requests.get(url)
+        request = get_session().get(url)
         file_type = request.headers["Content-Type"].split("/")[-1]
         real_file_path = file_path.with_suffix("." + file_type)
-        with open(str(real_file_path), mode="wb") as f:
-            f.write(request.content)
-        return real_file_path
+        return atomic_write_bytes(real_file_path, request.content)
 
     def getFromRecord(
         record: dict[str, Any] | airtable.Record,
@@ -99,6 +107,7 @@ def getPrecontextForCurriculum(
 
         return record["fields"][at_map[field]]
 
+    mopman = get_client()
     curriculum = mopman.get(at_map["curriculum"], curriculum_id)
     curriculum_name = getFromRecord(curriculum, "name")
     output_dir = output_dir / make_id_from_title(curriculum_name)
@@ -214,8 +223,7 @@ def getPrecontextForCurriculum(
     }
 
     ## Save Context
-    with open(output_dir / Path("precontext.json"), "w") as outfile:
-        json.dump(precontext, outfile, indent=4)
+    atomic_write_text(output_dir / Path("precontext.json"), json.dumps(precontext, indent=4))
 
     return precontext
 
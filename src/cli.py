@@ -1,19 +1,36 @@
 """CLI tool for generating curriculum packets and TA guides."""
 
 import json
+from functools import cache
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import click
-from rich.console import Console
 
-from src.main import (
-    check_output_permissions,
-    getPrecontext,
-    process_curriculum,
+from src.job_queue import (
+    DEFAULT_LEASE_SECONDS,
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_POLL_SECONDS,
+    QUEUE_FILE,
+    JobQueue,
+    run_worker,
 )
+from src.journal import RunJournal
+from src.utils.make_id_from_title import make_id_from_title
 
-console = Console()
+if TYPE_CHECKING:
+    from rich.console import Console
+
+# The generators, rich and their dependencies are imported by the commands that
+# need them, so `packetmaker --help` and quick commands start fast and don't need
+# secrets/.env or config.json.
+
+
+@cache
+def get_console() -> "Console":
+    from rich.console import Console
+
+    return Console()
 
 
 @click.group()
@@ -38,13 +55,15 @@ def cli() -> None:
 )
 def generate(curriculum_id: str, output_dir: Path, config: Path) -> None:
     """Generate curriculum packets and TA guides for a specific curriculum."""
+    from src.main import getPrecontext
+
     try:
         with Path.open(config) as f:
             config_data: dict[str, Any] = json.load(f)
 
         output_dir.mkdir(parents=True, exist_ok=True)
 
-        with console.status("Getting precontext..."):
+        with get_console().status("Getting precontext..."):
             precontext = getPrecontext(curriculum_id, output_dir, option_num=1)
             if not precontext:
                 raise click.ClickException("Failed to get precontext")
@@ -62,8 +81,50 @@ def generate(curriculum_id: str, output_dir: Path, config: Path) -> None:
     default=Path("config.json"),
     help="Path to config file",
 )
-def generate_all(config: Path) -> None:
+@click.option(
+    "--skip-preflight",
+    is_flag=True,
+    help="Start generating without checking all curricula first",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of curricula to generate at the same time, in separate processes",
+)
+@click.option(
+    "--full-rebuild",
+    is_flag=True,
+    help=(
+        "Regenerate every artifact, even those unchanged since the last build. With "
+        "pdf.incremental, a packet is still only updated in place if its changed parts kept "
+        "their page counts; otherwise it is always merged again in full"
+    ),
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the last run, skipping every stage it finished whose outputs are unchanged",
+)
+@click.option(
+    "--pipeline",
+    is_flag=True,
+    help="Download the next curricula while the current ones render (see src/pipeline.py)",
+)
+def generate_all(
+    config: Path,
+    skip_preflight: bool,
+    jobs: int,
+    full_rebuild: bool,
+    resume: bool,
+    pipeline: bool,
+) -> None:
     """Generate packets for all curricula specified in config."""
+    from src.main import check_output_permissions, process_curriculum
+    from src.pipeline import generate_pipelined
+    from src.preflight import PreflightError, check_config, run_preflight
+
     try:
         with Path.open(config) as f:
             config_data: dict[str, Any] = json.load(f)
@@ -71,10 +132,325 @@ def generate_all(config: Path) -> None:
         base_output_dir = Path(config_data["output_dir"])
         check_output_permissions(base_output_dir)
 
-        for curriculum, details in config_data["curriculum"].items():
-            if details["make_packet"]:
+        curricula = {
+            curriculum: details
+            for curriculum, details in config_data["curriculum"].items()
+            if details["make_packet"]
+        }
+        unfinished = dict(curricula)
+        fetched = {}
+        if resume:
+            for curriculum in curricula:
+                journal = RunJournal(
+                    base_output_dir / Path(make_id_from_title(curriculum)), resume=True
+                )
+                if journal.finished():
+                    del unfinished[curriculum]
+                elif (entry := journal.lookup("precontext")) is not None:
+                    fetched[curriculum] = entry["result"]
+            click.echo(
+                f"Resuming: {len(curricula) - len(unfinished)} of {len(curricula)} "
+                "curricula already generated."
+            )
+
+        if pipeline:
+            # Precontexts are fetched and checked as the pipeline goes
+            problems = check_config(config_data)
+            if problems:
+                raise PreflightError(problems)
+            results = generate_pipelined(
+                curricula,
+                base_output_dir,
+                config_data,
+                jobs,
+                full_rebuild,
+                resume,
+                on_result=_log_result,
+            )
+            _print_results(results, f"Generated {len(results)} curricula in a pipeline")
+            return
+
+        precontexts = fetched
+        if not skip_preflight:
+            with get_console().status("Running preflight checks..."):
+                precontexts = run_preflight(
+                    {**config_data, "curriculum": unfinished}, base_output_dir, fetched
+                )
+
+        if jobs == 1:
+            for curriculum, details in curricula.items():
                 click.echo(f"Generating packet for {curriculum}...")
-                process_curriculum(curriculum, details, base_output_dir)
+                process_curriculum(
+                    curriculum,
+                    details,
+                    base_output_dir,
+                    precontexts.get(curriculum),
+                    full_rebuild=full_rebuild,
+                    resume=resume,
+                )
+            return
+
+        results = _generate_parallel(
+            curricula, base_output_dir, precontexts, jobs, config_data, full_rebuild, resume
+        )
+        _print_results(results, f"Generated {len(results)} curricula with {jobs} jobs")
+
+    except Exception as e:
+        raise click.ClickException(str(e))
+
+
+def _log_result(result: dict[str, Any]) -> None:
+    status = "done" if result["ok"] else "FAILED"
+    get_console().log(f"{result['curriculum']}: {status} in {result['seconds']:.1f}s")
+
+
+def _print_results(results: list[dict[str, Any]], title: str) -> None:
+    """Prints a table of job results, and fails if any curriculum failed."""
+    from rich.table import Table
+
+    table = Table(title=title)
+    table.add_column("Curriculum")
+    table.add_column("Result")
+    table.add_column("Time", justify="right")
+    table.add_column("Log")
+    for result in results:
+        table.add_row(
+            result["curriculum"],
+            "[green]ok[/green]" if result["ok"] else f"[red]{result['error']}[/red]",
+            f"{result['seconds']:.1f}s",
+            str(result["log"]),
+        )
+    get_console().print(table)
+    failed = [result["curriculum"] for result in results if not result["ok"]]
+    if failed:
+        raise click.ClickException(f"{len(failed)} curricula failed: {', '.join(failed)}")
+
+
+def _generate_parallel(
+    curricula: dict[str, dict],
+    base_output_dir: Path,
+    precontexts: dict[str, dict[str, Any]],
+    jobs: int,
+    config_data: dict[str, Any],
+    full_rebuild: bool = False,
+    resume: bool = False,
+) -> list[dict[str, Any]]:
+    """Generates curricula in worker processes that share network and converter limits."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    from src.main import run_curriculum_job
+    from src.utils.limits import init_limits, make_limits
+
+    results = []
+    with multiprocessing.Manager() as manager:
+        semaphores = make_limits(manager, config_data)
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_limits, initargs=(semaphores,)
+        ) as executor:
+            futures = [
+                executor.submit(
+                    run_curriculum_job,
+                    curriculum,
+                    details,
+                    base_output_dir,
+                    precontexts.get(curriculum),
+                    full_rebuild,
+                    resume,
+                )
+                for curriculum, details in curricula.items()
+            ]
+            with get_console().status(f"Generating {len(futures)} curricula..."):
+                for future in as_completed(futures):
+                    result = future.result()
+                    _log_result(result)
+                    results.append(result)
+    return sorted(results, key=lambda result: list(curricula).index(result["curriculum"]))
+
+
+@cli.command()
+@click.option(
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    default=Path("config.json"),
+    help="Path to config file",
+)
+def preflight(config: Path) -> None:
+    """Check the config and every selected curriculum without generating anything."""
+    from src.preflight import run_preflight
+
+    try:
+        with Path.open(config) as f:
+            config_data: dict[str, Any] = json.load(f)
+
+        with get_console().status("Running preflight checks..."):
+            precontexts = run_preflight(config_data, Path(config_data["output_dir"]))
+
+        click.echo(f"Preflight passed for {len(precontexts)} curricula.")
 
     except Exception as e:
         raise click.ClickException(str(e))
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on")
+@click.option("--port", type=int, default=8000, help="Port to listen on")
+@click.option(
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    default=Path("config.json"),
+    help="Path to config file",
+)
+def serve(host: str, port: int, config: Path) -> None:
+    """Run the HTTP generation service (see src/server.py)."""
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIServer, make_server
+
+    from src.server import create_app
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    app = create_app(config)
+    with make_server(host, port, app, server_class=ThreadingWSGIServer) as server:
+        click.echo(f"Serving on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            app.close()
+
+
+def _open_queue(config_data: dict[str, Any], queue_path: Path | None) -> JobQueue:
+    queue_config = config_data.get("queue", {})
+    return JobQueue(
+        queue_path or Path(config_data["output_dir"]) / Path(QUEUE_FILE),
+        lease_seconds=queue_config.get("lease_seconds", DEFAULT_LEASE_SECONDS),
+        max_attempts=queue_config.get("max_attempts", DEFAULT_MAX_ATTEMPTS),
+    )
+
+
+@cli.group()
+def queue() -> None:
+    """Queue curricula for workers on several machines (see src/job_queue.py)."""
+
+
+@queue.command("submit")
+@click.argument("curricula", nargs=-1)
+@click.option(
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    default=Path("config.json"),
+    help="Path to config file",
+)
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Queue file on shared storage, defaults to queue.sqlite in the output directory",
+)
+@click.option("--full-rebuild", is_flag=True, help="Regenerate every artifact")
+def queue_submit(
+    curricula: tuple[str, ...], config: Path, queue_path: Path | None, full_rebuild: bool
+) -> None:
+    """Queue the given curricula, or all those with make_packet in config."""
+    with Path.open(config) as f:
+        config_data: dict[str, Any] = json.load(f)
+    unknown = [curriculum for curriculum in curricula if curriculum not in config_data["curriculum"]]
+    if unknown:
+        raise click.ClickException(f"Unknown curricula: {', '.join(unknown)}")
+    names = curricula or [
+        curriculum
+        for curriculum, details in config_data["curriculum"].items()
+        if details["make_packet"]
+    ]
+    job_queue = _open_queue(config_data, queue_path)
+    for curriculum in names:
+        job_id = job_queue.submit(curriculum, config_data["curriculum"][curriculum], full_rebuild)
+        click.echo(f"{job_id}: {curriculum}")
+
+
+@queue.command("status")
+@click.option(
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    default=Path("config.json"),
+    help="Path to config file",
+)
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Queue file on shared storage, defaults to queue.sqlite in the output directory",
+)
+def queue_status(config: Path, queue_path: Path | None) -> None:
+    """Show every job of the queue."""
+    from rich.table import Table
+
+    with Path.open(config) as f:
+        config_data: dict[str, Any] = json.load(f)
+    table = Table(title="Jobs")
+    for column in ("ID", "Curriculum", "Status", "Worker", "Attempts", "Error"):
+        table.add_column(column)
+    for job in _open_queue(config_data, queue_path).jobs():
+        table.add_row(
+            str(job["id"]),
+            job["curriculum"],
+            job["status"],
+            job["worker"] or "",
+            str(job["attempts"]),
+            job["error"] or "",
+        )
+    get_console().print(table)
+
+
+@cli.command()
+@click.option(
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    default=Path("config.json"),
+    help="Path to config file",
+)
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Queue file on shared storage, defaults to queue.sqlite in the output directory",
+)
+@click.option(
+    "--max-jobs", type=click.IntRange(min=1), default=None, help="Stop after this many jobs"
+)
+@click.option("--exit-when-empty", is_flag=True, help="Stop once the queue is empty")
+def worker(
+    config: Path, queue_path: Path | None, max_jobs: int | None, exit_when_empty: bool
+) -> None:
+    """Generate queued curricula until stopped."""
+    from src.main import check_output_permissions, run_curriculum_job
+
+    with Path.open(config) as f:
+        config_data: dict[str, Any] = json.load(f)
+    base_output_dir = Path(config_data["output_dir"])
+    check_output_permissions(base_output_dir)
+
+    def run_job(job: dict[str, Any]) -> dict[str, Any]:
+        # A requeued job continues from the journal of the worker that crashed
+        return run_curriculum_job(
+            job["curriculum"],
+            job["details"],
+            base_output_dir,
+            full_rebuild=job["full_rebuild"],
+            resume=job["attempts"] > 0,
+        )
+
+    count = run_worker(
+        _open_queue(config_data, queue_path),
+        run_job,
+        poll_seconds=config_data.get("queue", {}).get("poll_seconds", DEFAULT_POLL_SECONDS),
+        max_jobs=max_jobs,
+        exit_when_empty=exit_when_empty,
+    )
+    click.echo(f"Worker ran {count} jobs.")
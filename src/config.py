@@ -0,0 +1,47 @@
+"""
+config.py
+Loads config.json on first use instead of at import time.
+
+Modules used to read config.json when they were imported, so even
+`packetmaker --help` needed one in the working directory. get_config reads it
+the first time it is needed and keeps it for the rest of the process.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Any
+
+CONFIG_PATH = Path("config.json")
+
+_configs: dict[Path, dict[str, Any]] = {}
+_lock = threading.Lock()
+_default_path = CONFIG_PATH
+
+
+def set_config_path(path: Path) -> None:
+    """
+    Makes get_config return the config at path by default, for the rest of the process.
+
+    :param Path path: Path to the config file, e.g. the --config of a service.
+    """
+    global _default_path
+    assert isinstance(path, Path)
+    _default_path = path
+
+
+def get_config(path: Path | None = None) -> dict[str, Any]:
+    """
+    Returns the loaded config, reading it on the first call.
+
+    :param Path | None path: Path to the config file, defaults to the one set with
+        set_config_path, CONFIG_PATH unless set.
+    :return dict[str, Any]: The config. Shared by every caller, don't modify it.
+    """
+    path = path or _default_path
+    assert isinstance(path, Path)
+    with _lock:
+        if path not in _configs:
+            with open(path, "r") as config_file:
+                _configs[path] = json.load(config_file)
+        return _configs[path]
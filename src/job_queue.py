@@ -0,0 +1,279 @@
+"""
+job_queue.py
+A queue of curriculum jobs in a SQLite file, shared by workers on several machines.
+
+Put the file on storage every build machine mounts (next to the shared output
+directory), submit jobs with `packetmaker queue submit`, and start
+`packetmaker worker` on every machine. No broker is needed: workers claim jobs
+in a transaction, and hold a lease on each job they run, renewed by a heartbeat.
+A job whose lease ran out (its worker crashed or lost the share) is handed to
+the next worker that asks, up to max_attempts times.
+
+The database uses SQLite's rollback journal rather than WAL, which needs shared
+memory and doesn't work over network filesystems.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("MopMan")
+
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_SECONDS = 5.0
+QUEUE_FILE = "queue.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    curriculum TEXT NOT NULL,
+    details TEXT NOT NULL,
+    full_rebuild INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    log TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+def worker_name() -> str:
+    """Returns a name for this worker that is unique across machines."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """Curriculum jobs, claimed by workers with leases."""
+
+    def __init__(
+        self,
+        path: Path,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        """
+        :param Path path: SQLite file of the queue, created if missing.
+        :param float lease_seconds: How long a claimed job stays with its worker without
+            a heartbeat, defaults to DEFAULT_LEASE_SECONDS.
+        :param int max_attempts: Claims of a job before it is failed, defaults to
+            DEFAULT_MAX_ATTEMPTS.
+        """
+        assert isinstance(path, Path)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(path, timeout=60)
+        try:
+            db.execute("PRAGMA journal_mode=DELETE")
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # A connection per transaction, so the queue can be used from any thread
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            # Takes the write lock right away, so two workers can't claim the same job
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def submit(self, curriculum: str, details: dict[str, Any], full_rebuild: bool = False) -> int:
+        """
+        Queues a curriculum, unless it is already queued or running.
+
+        :param str curriculum: Name of the curriculum.
+        :param dict[str, Any] details: Its entry in config["curriculum"].
+        :param bool full_rebuild: Regenerate every artifact, defaults to False.
+        :return int: ID of the job.
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT id FROM jobs WHERE curriculum = ? AND status IN ('queued', 'running')",
+                (curriculum,),
+            ).fetchone()
+            if row is not None:
+                return row["id"]
+            return db.execute(
+                "INSERT INTO jobs (curriculum, details, full_rebuild, submitted) VALUES (?, ?, ?, ?)",
+                (curriculum, json.dumps(details), int(full_rebuild), time.time()),
+            ).lastrowid
+
+    def _expire_leases(self, db: sqlite3.Connection, now: float) -> None:
+        expired = db.execute(
+            "SELECT id, curriculum, worker, attempts FROM jobs "
+            "WHERE status = 'running' AND lease_until < ?",
+            (now,),
+        ).fetchall()
+        for job in expired:
+            if job["attempts"] >= self.max_attempts:
+                logger.error(
+                    f"[ERROR] Job {job['id']} ({job['curriculum']}) failed {job['attempts']} times."
+                )
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', finished = ?, "
+                    "error = 'lease expired too many times' WHERE id = ?",
+                    (now, job["id"]),
+                )
+            else:
+                logger.warning(
+                    f"Requeuing job {job['id']}, its worker {job['worker']} stopped responding."
+                )
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL WHERE id = ?",
+                    (job["id"],),
+                )
+
+    def claim(self, worker: str) -> dict[str, Any] | None:
+        """
+        Claims the oldest queued job, first requeuing jobs whose lease ran out.
+
+        :param str worker: Name of the claiming worker.
+        :return dict[str, Any] | None: The job, None if the queue is empty.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            self._expire_leases(db, now)
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, started = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row["id"]),
+            )
+        job = dict(row)
+        job["details"] = json.loads(job["details"])
+        job["full_rebuild"] = bool(job["full_rebuild"])
+        return job
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """
+        Renews the lease of a running job.
+
+        :return bool: False if the job isn't this worker's anymore.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def finish(
+        self, job_id: int, worker: str, error: str | None = None, log: str | None = None
+    ) -> bool:
+        """
+        Marks a job of this worker as done, or failed if error is given.
+
+        :return bool: False if the job isn't this worker's anymore.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ?, log = ?, lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                ("failed" if error else "done", time.time(), error, log, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def jobs(self) -> list[dict[str, Any]]:
+        """Returns every job, oldest first."""
+        with self._transaction() as db:
+            return [dict(row) for row in db.execute("SELECT * FROM jobs ORDER BY id").fetchall()]
+
+
+class _Heartbeat(threading.Thread):
+    """Renews the lease of a job until stopped."""
+
+    def __init__(self, queue: JobQueue, job_id: int, worker: str) -> None:
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker = worker
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker):
+                    logger.warning(f"Lost the lease of job {self.job_id}, another worker may redo it.")
+                    return
+            except sqlite3.Error as e:
+                # The share may be back before the lease runs out
+                logger.warning(f"Heartbeat of job {self.job_id} failed: {e}")
+
+
+def run_worker(
+    queue: JobQueue,
+    run_job: Callable[[dict[str, Any]], dict[str, Any]],
+    worker: str | None = None,
+    poll_seconds: float = DEFAULT_POLL_SECONDS,
+    max_jobs: int | None = None,
+    exit_when_empty: bool = False,
+) -> int:
+    """
+    Claims and runs jobs until stopped.
+
+    :param JobQueue queue: Queue to take jobs from.
+    :param Callable run_job: Runs a claimed job and returns a result like
+        main.run_curriculum_job.
+    :param str | None worker: Name of this worker, defaults to worker_name().
+    :param float poll_seconds: Wait between polls of an empty queue, defaults to
+        DEFAULT_POLL_SECONDS.
+    :param int | None max_jobs: Stop after this many jobs, defaults to None.
+    :param bool exit_when_empty: Stop once the queue is empty, defaults to False.
+    :return int: Number of jobs run.
+    """
+    worker = worker or worker_name()
+    count = 0
+    while max_jobs is None or count < max_jobs:
+        job = queue.claim(worker)
+        if job is None:
+            if exit_when_empty:
+                break
+            time.sleep(poll_seconds)
+            continue
+        logger.info(
+            f"Worker {worker}: job {job['id']}, {job['curriculum']} (attempt {job['attempts'] + 1})."
+        )
+        heartbeat = _Heartbeat(queue, job["id"], worker)
+        heartbeat.start()
+        try:
+            result = run_job(job)
+            error, log = result["error"], result.get("log")
+        except Exception as e:
+            logger.exception(e)
+            error, log = f"{type(e).__name__}: {e}", None
+        finally:
+            heartbeat.stopped.set()
+            heartbeat.join()
+        if not queue.finish(job["id"], worker, error, str(log) if log else None):
+            logger.warning(f"Job {job['id']} was taken over by another worker, result dropped.")
+        count += 1
+    return count
@@ -0,0 +1,115 @@
+"""
+journal.py
+Checkpoints of a curriculum's run, so a crashed run can be resumed.
+
+Every stage that finishes (the fetched precontext, the cover, each TA guide,
+the packet, ...) is appended to journal.jsonl in the curriculum's output
+directory, with the hashes of the files it wrote. A resumed run reuses a stage
+only if all of those files are still there and unchanged, so at most the
+stages that were in progress when the run died are redone.
+
+Usage:
+    journal = RunJournal(output_dir, resume=True)
+    entry = journal.lookup("cover")
+    if entry is None:
+        journal.record("cover", generate_cover(...))
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from src.utils.cache import hash_file
+
+JOURNAL_FILE = "journal.jsonl"
+# Stage recorded once everything of the curriculum was generated.
+DONE = "done"
+
+
+class RunJournal:
+    """Append-only record of the stages a run of one curriculum finished."""
+
+    def __init__(self, output_dir: Path, resume: bool = False) -> None:
+        """
+        :param Path output_dir: Output directory of the curriculum.
+        :param bool resume: Keep the stages of the previous run, defaults to False
+            to start a new journal.
+        """
+        assert isinstance(output_dir, Path)
+        self.path = output_dir / Path(JOURNAL_FILE)
+        self._lock = threading.Lock()
+        self.entries: dict[str, dict[str, Any]] = {}
+        if resume:
+            self.entries = self._load()
+        else:
+            self.path.unlink(missing_ok=True)
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        entries = {}
+        if not self.path.exists():
+            return entries
+        data = self.path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # Drops the line being written when the run died, so the next record
+            # starts on a line of its own
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+            data = data[:end]
+        for line in data.decode().splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry["stage"]] = entry
+        return entries
+
+    def record(self, stage: str, result: Any, outputs: list[Path] | None = None) -> None:
+        """
+        Appends a finished stage to the journal, and syncs it to disk.
+
+        :param str stage: Name of the stage, e.g. a task name of main.build_graph.
+        :param Any result: What the stage returned. Must be a Path, None or JSON serializable.
+        :param list[Path] | None outputs: Files the stage wrote, defaults to result
+            if it is a Path.
+        """
+        if outputs is None:
+            outputs = [result] if isinstance(result, Path) else []
+        entry = {
+            "stage": stage,
+            "time": time.time(),
+            "is_path": isinstance(result, Path),
+            "result": str(result) if isinstance(result, Path) else result,
+            "outputs": {str(path): hash_file(Path(path)) for path in outputs},
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self.entries[stage] = entry
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def lookup(self, stage: str) -> dict[str, Any] | None:
+        """
+        Returns the entry of a stage if it finished and its outputs are unchanged.
+
+        :param str stage: Name of the stage.
+        :return dict[str, Any] | None: The entry, with the stage's result under "result".
+        """
+        entry = self.entries.get(stage)
+        if entry is None:
+            return None
+        for path, sha256 in entry["outputs"].items():
+            if not Path(path).is_file() or hash_file(Path(path)) != sha256:
+                return None
+        if entry["is_path"]:
+            return {**entry, "result": Path(entry["result"])}
+        return entry
+
+    def finished(self) -> bool:
+        """Whether the journaled run generated everything, with its outputs unchanged."""
+        return self.lookup(DONE) is not None
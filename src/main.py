@@ -19,24 +19,43 @@ Configuration:
     output directories, and generation options.
 """
 
-import json
+import logging
 import os
 import subprocess
+import time
+from collections.abc import Callable
+from contextlib import ExitStack, redirect_stdout
 from copy import deepcopy
 from pathlib import Path
+from threading import Lock, current_thread, main_thread
 from typing import Any
 
 from src.packet.cover import generate_cover
-from src.packet.packet import generate_packet
+from src.packet.packet import generate_packet, packet_paths
 from src.packet.further_readings import generate_further_readings
-from src.packet.device_readings import generate_device_readings
+from src.packet.device_readings import device_reading_dir, generate_device_reading
 from src.airtable.airtable_api import getPrecontextForCurriculum
-from src.ta_guide import generate_ta_guides
+from src.config import get_config
+from src.journal import DONE, RunJournal
+from src.planner import (
+    Plan,
+    attachment_paths,
+    is_artifact,
+    load_build_state,
+    plan_rebuild,
+    save_build_state,
+    stale_outputs,
+    ta_guide_artifact,
+)
+from src.scheduler import Scheduler, Task
+from src.ta_guide import generate_ta_guide, open_shared_ta_guides
 from src.DocumentGenerator import logger
 from src.utils.make_id_from_title import make_id_from_title
 from src.utils.adjust_logo import adjust_logo
+from src.utils.cache import get_cache_dir
+from src.utils.limits import ensure_limits, limit
+from src.utils.reading_time import add_reading_times
 
-config = json.load(open("config.json", "r"))
 
 
 def check_permissions(path: Path) -> bool:
@@ -64,58 +83,291 @@ def getPrecontext(
     :return dict[str, Any]: Precontext data.
     """
     if option_num == 1:
-        precontext = getPrecontextForCurriculum(
-            curriculum_id, output_dir / Path("precontext")
-        )
+        with limit("network"):
+            precontext = getPrecontextForCurriculum(
+                curriculum_id, output_dir / Path("precontext")
+            )
         return precontext
     elif option_num == 2:
         raise NotImplementedError("Option 2 not implemented")
 
 
-def main(curriculum_id: str, output_dir: Path = Path("./output/")) -> None:
+def main(
+    curriculum_id: str,
+    output_dir: Path = Path("./output/"),
+    precontext: dict[str, Any] | None = None,
+    full_rebuild: bool = False,
+    resume: bool = False,
+) -> dict[str, Path | None]:
     """
     Main function to generate curriculum packets and TA guides.
 
     This function orchestrates the entire process of generating curriculum packets
     and TA guides, including fetching precontext data, adjusting the logo, generating
     cover pages, device readings, further readings, merging PDFs, and creating TA guides.
+    The stages run as a task graph (see build_graph), independent ones concurrently.
+    With config["planner"]["enabled"], only artifacts affected by changes since the
+    last build are regenerated (see planner.py). Every finished stage is checkpointed
+    in a journal (see journal.py), so a crashed run can be resumed. With the planner,
+    outputs of the last build whose artifact is gone, like the TA guide of a removed
+    cohort, are deleted too.
 
     :param str curriculum_id: ID of the curriculum to generate for.
     :param Path output_dir: Directory to save the generated files, defaults to "./output/".
+    :param dict[str, Any] | None precontext: Precontext already fetched (e.g. by preflight),
+        defaults to None to fetch it.
+    :param bool full_rebuild: Regenerate everything even if it didn't change, defaults to False.
+    :param bool resume: Skip the stages the last run finished, if their outputs are
+        unchanged, defaults to False.
+    :return dict[str, Path | None]: Output of every artifact (cover, packet, TA guides, ...),
+        by name.
     """
     assert isinstance(curriculum_id, str)
     assert isinstance(output_dir, Path)
+    config = get_config()
     output_dir.mkdir(parents=True, exist_ok=True)
+    ensure_limits(config)
+    journal = RunJournal(output_dir, resume=resume)
+    done = journal.lookup(DONE)
+    if done is not None:
+        logger.info(f"[SKIP] {output_dir} was already generated.")
+        return {name: Path(path) for name, path in done["result"].items()}
+
+    if precontext is None:
+        entry = journal.lookup("precontext")
+        if entry is not None:
+            logger.info("[SKIP] precontext of the last run reused.")
+            precontext = entry["result"]
+        else:
+            print("\n")
+            logger.info("Getting precontext...")
+            precontext = getPrecontext(curriculum_id, output_dir, option_num=1)
+            assert precontext is not None
+            logger.info("[SUCCESS] precontext collected.")
+    if journal.lookup("precontext") is None:
+        attachments = [path for path in attachment_paths(precontext) if path.is_file()]
+        journal.record("precontext", precontext, attachments)
+
+    state = load_build_state(output_dir)
+    plan = None
+    if config.get("planner", {}).get("enabled", False):
+        if full_rebuild:
+            plan = Plan(full=True)
+        else:
+            plan = plan_rebuild(state, precontext, config)
+            plan.companions["packet"] = packet_paths(precontext, output_dir, config)
+        logger.info(str(plan))
+
+    with ExitStack() as stack:
+        scheduler = build_graph(precontext, output_dir, stack, plan, journal)
+        results = scheduler.run()
+    logger.info(scheduler.report())
+    outputs = {name: result for name, result in results.items() if is_artifact(name)}
+    if plan is not None:
+        for path in stale_outputs(state, precontext, outputs):
+            logger.info(f"Removing {path}, it is no longer generated.")
+            path.unlink(missing_ok=True)
+    save_build_state(output_dir, precontext, config, outputs)
+    paths = {name: path for name, path in outputs.items() if path is not None}
+    journal.record(DONE, {name: str(path) for name, path in paths.items()}, list(paths.values()))
+    return outputs
+
+
+def build_graph(
+    precontext: dict[str, Any],
+    output_dir: Path,
+    stack: ExitStack,
+    plan: Plan | None = None,
+    journal: RunJournal | None = None,
+) -> Scheduler:
+    """
+    Builds the task graph that generates everything for one curriculum.
+
+    The logo and reading times are prepared first. The cover, every device reading
+    and the further readings page then run concurrently, and the packet is merged
+    once they are all done. TA guides only need the logo, so each cohort's guide
+    starts right away instead of waiting for the packet.
+
+    Artifacts the plan doesn't need return their output from the last build
+    instead, unless an artifact they are built from was regenerated. Artifacts
+    the journal has as finished and unchanged are not generated again either.
+
+    :param dict[str, Any] precontext: Precontext of the curriculum.
+    :param Path output_dir: Directory to save the generated files.
+    :param ExitStack stack: Keeps files shared by tasks open until the run is over.
+    :param Plan | None plan: Artifacts to regenerate, defaults to None for all of them.
+    :param RunJournal | None journal: Journal to checkpoint finished artifacts in,
+        defaults to None.
+    :return Scheduler: The graph, ready to run.
+    """
+    config = get_config()
+    generate = config["generate"]
+    scheduler = Scheduler(max_workers=config.get("scheduler", {}).get("max_workers"))
+    # Artifacts regenerated by this build, and those actually generated by this run
+    rebuilt: set[str] = set()
+    ran: set[str] = set()
+
+    def planned(
+        name: str, fn: Callable[[dict[str, Any]], Any], built_from: tuple[str, ...] = ()
+    ) -> Callable[[dict[str, Any]], Any]:
+        def run(deps: dict[str, Any]) -> Any:
+            previous = plan.reusable(name) if plan is not None else None
+            if previous is not None and not rebuilt.intersection(built_from):
+                logger.info(f"[SKIP] {name} unchanged, keeping {previous}")
+                return previous
+            rebuilt.add(name)
+            entry = journal.lookup(name) if journal is not None else None
+            if entry is not None and not ran.intersection(built_from):
+                logger.info(f"[SKIP] {name} finished by the last run, keeping {entry['result']}")
+                return entry["result"]
+            ran.add(name)
+            result = fn(deps)
+            if journal is not None:
+                journal.record(name, result)
+            return result
+
+        return run
+
+    def fix_logo(deps: dict[str, Any]) -> str:
+        logger.info("Fixing logo...")
+        logo_path = adjust_logo(
+            Path(precontext["logo_path"]),
+            output_path=output_dir,
+            cache_dir=get_cache_dir("logos", config),
+        )
+        logger.info(f"[SUCCESS] logo fixed. {logo_path}")
+        return str(logo_path)
+
+    scheduler.add(Task("logo", fix_logo, inputs=[Path(precontext["logo_path"])]))
+
+    context_deps = ["logo"]
+    if config.get("reading_time", {}).get("enabled", False):
+
+        def estimate(deps: dict[str, Any]) -> dict[str, Any]:
+            logger.info("Estimating reading times...")
+            times = {"core_readings": deepcopy(precontext["core_readings"])}
+            add_reading_times(times, config)
+            logger.info(f"[SUCCESS] {times['total_reading_time_min']} minutes of core readings.")
+            return times
+
+        scheduler.add(Task("reading_times", estimate))
+        context_deps.append("reading_times")
+
+    def make_context(deps: dict[str, Any]) -> dict[str, Any]:
+        context = deepcopy(precontext)
+        context["logo_path"] = deps["logo"]
+        context.update(deps.get("reading_times", {}))
+        return context
+
+    scheduler.add(Task("context", make_context, deps=context_deps))
+    scheduler.add(
+        Task(
+            "cover",
+            planned("cover", lambda deps: generate_cover(deps["context"], output_dir, config)),
+            deps=["context"],
+            outputs=[output_dir / Path("Cover")],
+        )
+    )
+    scheduler.add(
+        Task(
+            "further",
+            planned(
+                "further", lambda deps: generate_further_readings(deps["context"], output_dir, config)
+            ),
+            deps=["context"],
+            outputs=[output_dir / Path("Further")],
+        )
+    )
 
-    print("\n")
-    logger.info("Getting precontext...")
-    precontext = getPrecontext(curriculum_id, output_dir, option_num=1)
-    assert precontext is not None
-    logger.info("[SUCCESS] precontext collected.")
-
-    ## Fix Logo
-    print("\n")
-    logger.info("Fixing logo...")
-    precontext = deepcopy(precontext)
-    logo_path = Path(precontext["logo_path"])
-    precontext["logo_path"] = str(adjust_logo(logo_path, output_path=output_dir))
-    logger.info(f"[SUCCESS] logo fixed. {precontext['logo_path']}")
-
-    cover_pdf_path = generate_cover(precontext, output_dir, config)
-    device_reading_paths = generate_device_readings(precontext, output_dir, config)
-    further_pdf_path = generate_further_readings(precontext, output_dir, config)
-
-    _ = generate_packet(
-        precontext,
-        output_dir,
-        cover_pdf_path,
-        device_reading_paths,
-        further_pdf_path,
-        config,
-        logger,
+    device_tasks: dict[int, str] = {}
+    if generate["device_readings"]:
+        for i, reading in enumerate(precontext["core_readings"]):
+            if not reading["trimmed_pdf"] and not reading["read_on_device"]:
+                raise ValueError(
+                    f"Reading {reading['title']} has no trimmed pdf and is not labeled as read_on_device."
+                )
+            if not reading["read_on_device"]:
+                continue
+            name = f"device_reading:{make_id_from_title(reading['title'])}"
+            scheduler.add(
+                Task(
+                    name,
+                    planned(
+                        name,
+                        lambda deps, i=i: generate_device_reading(
+                            deps["context"], deps["context"]["core_readings"][i], output_dir, config
+                        ),
+                    ),
+                    deps=["context"],
+                    outputs=[device_reading_dir(reading, output_dir)],
+                )
+            )
+            device_tasks[i] = name
+
+    def make_packet(deps: dict[str, Any]) -> Path | None:
+        context = deepcopy(deps["context"])
+        for i, name in device_tasks.items():
+            context["core_readings"][i]["trimmed_pdf"] = deps[name]
+        return generate_packet(
+            context,
+            output_dir,
+            deps["cover"],
+            [deps[name] for name in device_tasks.values()] if generate["device_readings"] else None,
+            deps["further"],
+            config,
+            logger,
+        )
+
+    scheduler.add(
+        Task(
+            "packet",
+            planned("packet", make_packet, ("cover", "further", *device_tasks.values())),
+            deps=["context", "cover", "further", *device_tasks.values()],
+        )
     )
 
-    generate_ta_guides(precontext, output_dir, config, logger)
+    def kept(name: str) -> bool:
+        """Whether an artifact built from no other artifact is reused instead of generated."""
+        if plan is not None and plan.reusable(name) is not None:
+            return True
+        return journal is not None and journal.lookup(name) is not None
+
+    if generate["tas_guides"]:
+        ta_guide_dir = output_dir / Path("TA Guides")
+        guides = {ta_guide_artifact(cohort): cohort for cohort in precontext["cohorts"]}
+        # The shared guides are only opened if some guide is generated
+        shared_deps = []
+        if not all(kept(name) for name in guides):
+            scheduler.add(
+                Task(
+                    "ta_guides_shared",
+                    lambda deps: open_shared_ta_guides(precontext, stack),
+                    inputs=[Path(precontext["base_ta_guide_pdf"])],
+                )
+            )
+            shared_deps.append("ta_guides_shared")
+        # The shared guides are read by one cohort at a time
+        merge_lock = Lock()
+        for name, cohort in guides.items():
+
+            def make_guide(deps: dict[str, Any], cohort: dict[str, Any] = cohort) -> Path:
+                context = deepcopy(precontext)
+                context["logo_path"] = deps["logo"]
+                guide_path = generate_ta_guide(
+                    context, cohort, output_dir, config, deps["ta_guides_shared"], merge_lock
+                )
+                logger.info(f"[SUCCESS] {guide_path}")
+                return guide_path
+
+            scheduler.add(
+                Task(
+                    name,
+                    planned(name, make_guide),
+                    deps=["logo", *shared_deps],
+                    outputs=[ta_guide_dir],
+                )
+            )
+    return scheduler
 
 
 def check_output_permissions(output_dir: Path) -> None:
@@ -125,12 +377,97 @@ def check_output_permissions(output_dir: Path) -> None:
         )
 
 
-def process_curriculum(curriculum: str, details: dict, base_output_dir: Path) -> None:
+def process_curriculum(
+    curriculum: str,
+    details: dict,
+    base_output_dir: Path,
+    precontext: dict[str, Any] | None = None,
+    open_output: bool = True,
+    full_rebuild: bool = False,
+    resume: bool = False,
+) -> None:
     if details["make_packet"]:
         curriculum_id = details["record_id"]
         output_dir = base_output_dir / Path(make_id_from_title(curriculum))
-        main(curriculum_id, output_dir=output_dir)
-        open_output_directory(output_dir)
+        main(
+            curriculum_id,
+            output_dir=output_dir,
+            precontext=precontext,
+            full_rebuild=full_rebuild,
+            resume=resume,
+        )
+        if open_output:
+            open_output_directory(output_dir)
+
+
+def run_curriculum_job(
+    curriculum: str,
+    details: dict,
+    base_output_dir: Path,
+    precontext: dict[str, Any] | None = None,
+    full_rebuild: bool = False,
+    resume: bool = False,
+) -> dict[str, Any]:
+    """
+    Generates one curriculum in a worker process of a parallel run.
+
+    Its log and output go to generate.log in its output directory instead of the
+    console, so the logs of curricula running at the same time don't interleave.
+    This swaps the MopMan logger's handlers and redirects sys.stdout for the whole
+    process, so it must run in the main thread of a process running one job at a
+    time, like a worker of a ProcessPoolExecutor or a queue worker.
+
+    :param str curriculum: Name of the curriculum.
+    :param dict details: Its entry in config["curriculum"].
+    :param Path base_output_dir: Directory the curricula are generated in.
+    :param dict[str, Any] | None precontext: Precontext from preflight, defaults to None.
+    :param bool full_rebuild: Regenerate everything, defaults to False.
+    :param bool resume: Resume the last run of the curriculum, defaults to False.
+    :return dict[str, Any]: curriculum, ok, seconds, error and log path of the job.
+    """
+    assert current_thread() is main_thread()
+    output_dir = base_output_dir / Path(make_id_from_title(curriculum))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log_path = output_dir / Path("generate.log")
+    # Log records and printed output share one file object, so they can't overwrite
+    # each other
+    log = open(log_path, "a")
+    handler = logging.StreamHandler(log)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    console_handlers = list(logger.handlers)
+    for console_handler in console_handlers:
+        logger.removeHandler(console_handler)
+    logger.addHandler(handler)
+
+    start = time.perf_counter()
+    error = None
+    try:
+        with redirect_stdout(log):
+            process_curriculum(
+                curriculum,
+                details,
+                base_output_dir,
+                precontext,
+                open_output=False,
+                full_rebuild=full_rebuild,
+                resume=resume,
+            )
+    except Exception as e:
+        logger.exception(e)
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+        log.close()
+        for console_handler in console_handlers:
+            logger.addHandler(console_handler)
+    return {
+        "curriculum": curriculum,
+        "ok": error is None,
+        "seconds": time.perf_counter() - start,
+        "error": error,
+        "log": log_path,
+    }
 
 
 def open_output_directory(output_dir: Path) -> None:
@@ -138,6 +475,7 @@ def open_output_directory(output_dir: Path) -> None:
 
 
 def run_curriculum_generation() -> None:
+    config = get_config()
     base_output_dir = Path(config["output_dir"])
     check_output_permissions(base_output_dir)
 
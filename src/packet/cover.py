@@ -1,6 +1,8 @@
 from typing import Any
 from pathlib import Path
 from src.DocumentGenerator import CoverGenerator
+from src.progress_bar.vector_progress_bar import render_progress_bars, stamp_progress_bar
+from src.utils.cache import get_cache_dir
 
 def generate_cover(precontext: dict[str, Any], output_dir: Path, config: dict[str, Any]) -> Path | None:
     if config["generate"]["cover"]:
@@ -10,4 +12,12 @@ def generate_cover(precontext: dict[str, Any], output_dir: Path, config: dict[st
             precontext,
             overwrite=True,
         )
-        return cover.pdf_path
\ No newline at end of file
+        bar_config = config.get("progress_bar", {})
+        # Never stamp the shared error pdf a failed conversion falls back to
+        if bar_config.get("enabled", False) and cover.pdf_path != Path(config["error_pdf"]):
+            bar_path = render_progress_bars(
+                {precontext["curriculum_name"]: precontext["core_readings"]},
+                get_cache_dir("progress_bars", config),
+            )[precontext["curriculum_name"]]
+            stamp_progress_bar(cover.pdf_path, bar_path, tuple(bar_config["box"]))
+        return cover.pdf_path
@@ -4,6 +4,24 @@ from copy import deepcopy
 from src.DocumentGenerator import DeviceReadingGenerator
 from src.utils.make_id_from_title import make_id_from_title
 
+def device_reading_dir(reading: dict[str, Any], output_dir: Path) -> Path:
+    return output_dir / Path(f"Device Readings/{make_id_from_title(reading['title'])}")
+
+def generate_device_reading(
+    precontext: dict[str, Any], reading: dict[str, Any], output_dir: Path, config: dict[str, Any]
+) -> Path:
+    # Create a new context for each device reading
+    device_reading_context = deepcopy(precontext)
+    device_reading_context["device_reading"] = reading
+
+    device_reading = DeviceReadingGenerator(
+        Path(config["templates"]["device_reading"]),
+        device_reading_dir(reading, output_dir),
+        device_reading_context,
+        overwrite=True,
+    )
+    return device_reading.pdf_path
+
 def generate_device_readings(
     precontext: dict[str, Any], output_dir: Path, config: dict[str, Any]
 ) -> list[Path] | None:
@@ -17,19 +35,10 @@ def generate_device_readings(
             if not reading["read_on_device"]:
                 continue
 
-            # Create a new context for each device reading
-            device_reading_context = deepcopy(precontext)
-            device_reading_context["device_reading"] = reading
-
-            device_reading = DeviceReadingGenerator(
-                Path(config["templates"]["device_reading"]),
-                output_dir
-                / Path(f"Device Readings/{make_id_from_title(reading['title'])}"),
-                device_reading_context,
-                overwrite=True,
+            reading["trimmed_pdf"] = generate_device_reading(
+                precontext, reading, output_dir, config
             )
-            reading["trimmed_pdf"] = device_reading.pdf_path
-            device_reading_paths.append(device_reading.pdf_path)
+            device_reading_paths.append(reading["trimmed_pdf"])
 
         return device_reading_paths
-    return None
\ No newline at end of file
+    return None
@@ -2,9 +2,22 @@ from typing import Any
 from pathlib import Path
 import logging
 from src.utils.make_id_from_title import make_id_from_title
-from src.utils.pdf_helpers import mergePdfs
+from src.utils.pdf_helpers import MergeVariant, mergePdfVariants, mergePdfs
+from src.utils.pdf_index import estimate_merged_size, get_pdf_index
+from src.utils.pdf_optimize import linearize_pdf, optimize_pdf
 from src.add_footer_to_pdf import add_footer_to_pdf
 
+def packet_paths(
+    precontext: dict[str, Any], output_dir: Path, config: dict[str, Any]
+) -> list[Path]:
+    """Returns the path of every packet variant in config, the first being the main one."""
+    packet_name = make_id_from_title(precontext["curriculum_name"])
+    profiles = config.get("pdf", {}).get("variants") or {"print": {}}
+    return [
+        output_dir / Path(packet_name + profile.get("suffix", "") + ".pdf")
+        for profile in profiles.values()
+    ]
+
 def generate_packet(
     precontext: dict[str, Any],
     output_dir: Path,
@@ -23,21 +36,83 @@ def generate_packet(
             Path(reading["trimmed_pdf"]) for reading in precontext["core_readings"]
         ]
 
-        packet_path = mergePdfs(
+        pdf_paths = (
             ([cover_pdf_path] if cover_pdf_path else [])
             + reading_pdf_paths
             + (device_reading_paths or [])
-            + ([further_pdf_path] if further_pdf_path else []),
-            output_path=output_dir
-            / Path(make_id_from_title(precontext["curriculum_name"]) + ".pdf"),
+            + ([further_pdf_path] if further_pdf_path else [])
         )
 
-        packet_path = add_footer_to_pdf(
-            packet_path,
-            packet_path,
-            footer_text=precontext["program_name"] + " Readings — Page {i} of {n}",
+        index = get_pdf_index(config)
+        num_pages, num_bytes = estimate_merged_size(pdf_paths, index)
+        logger.info(f"Packet will have {num_pages} pages (at most {num_bytes / 1e6:.1f} MB)")
+
+        # Each variant is written from the same parsed readings. Only "print" is
+        # configured by default. A smaller packet for screens can be added to
+        # config["pdf"]["variants"], e.g.
+        #   "screen": {"image_dpi": 150, "linearize": true, "merge_on_odd": false,
+        #              "suffix": " (screen)"}
+        # Linearizing needs the "pdf" extra, and several variants disable incremental updates.
+        pdf_config = config.get("pdf", {})
+        profiles = pdf_config.get("variants") or {"print": {}}
+        variants = [
+            MergeVariant(
+                output_path,
+                merge_on_odd=profile.get("merge_on_odd", True),
+                footer_text=profile.get(
+                    "footer_text", "{program} Readings — Page {i} of {n}"
+                ).replace("{program}", precontext["program_name"]),
+                image_dpi=profile.get("image_dpi"),
+                keep_links=profile.get("keep_links", True),
+            )
+            for output_path, profile in zip(
+                packet_paths(precontext, output_dir, config), profiles.values()
+            )
+        ]
+        incremental = pdf_config.get("streaming_merge", False) and pdf_config.get(
+            "incremental", False
         )
+        if incremental and len(variants) > 1:
+            logger.info(
+                f"Incremental updates need a single packet variant, merging all {len(variants)}."
+            )
+            incremental = False
+        if incremental:
+            variant = variants[0]
+            mergePdfs(
+                pdf_paths,
+                variant.output_path,
+                merge_on_odd=variant.merge_on_odd,
+                streaming=True,
+                footer_text=variant.footer_text,
+                index=index,
+                incremental=True,
+            )
+        elif pdf_config.get("streaming_merge", False):
+            # Merge and stamp footers in one pass, writing each variant once
+            mergePdfVariants(pdf_paths, variants, index=index)
+        else:
+            for variant in variants:
+                mergePdfs(pdf_paths, variant.output_path, merge_on_odd=variant.merge_on_odd)
+                add_footer_to_pdf(
+                    variant.output_path, variant.output_path, footer_text=variant.footer_text
+                )
+
+        for variant, profile in zip(variants, profiles.values()):
+            # Optimizing and linearizing rewrite the whole packet, defeating incremental
+            # updates. Each is opted into per variant, defaulting to the pdf setting.
+            if profile.get("optimize", pdf_config.get("optimize", False)) and not incremental:
+                report = optimize_pdf(
+                    variant.output_path,
+                    variant.output_path,
+                    object_streams=pdf_config.get("object_streams", False),
+                )
+                logger.info(f"{variant.output_path.name} optimized: {report}")
+            if profile.get("linearize", pdf_config.get("linearize", False)) and not incremental:
+                linearize_pdf(variant.output_path, variant.output_path)
+        index.save()
 
+        packet_path = variants[0].output_path
         logger.info(f"[SUCCESS] Packet created. {packet_path}")
         return packet_path
     return None
\ No newline at end of file
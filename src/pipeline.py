@@ -0,0 +1,208 @@
+"""
+pipeline.py
+Generates many curricula with network and CPU work overlapping.
+
+Normally a curriculum's precontext and attachments are downloaded, then it is
+rendered, then the next one is downloaded. Here fetching and rendering are two
+asyncio stages connected by a bounded queue: while curriculum N renders,
+curriculum N+1 (and up to `prefetch` more) is already downloading. Fetches run
+on a thread pool and renders on a process pool, so the event loop only moves
+work between them. When the renderers fall behind, the full queue makes the
+fetchers wait, so precontexts don't pile up.
+
+A run takes about max(network time, render time) instead of their sum.
+
+Usage:
+    results = asyncio.run(pipeline(names, fetch, render, fetch_executor, render_executor))
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("MopMan")
+
+DEFAULT_PREFETCH = 2
+
+
+def _failure(name: str, error: BaseException, start: float) -> dict[str, Any]:
+    return {
+        "curriculum": name,
+        "ok": False,
+        "seconds": time.perf_counter() - start,
+        "error": f"{type(error).__name__}: {error}",
+        "log": None,
+    }
+
+
+async def pipeline(
+    names: list[str],
+    fetch: Callable[[str], Any],
+    render: Callable[[str, Any], dict[str, Any]],
+    fetch_executor: Executor,
+    render_executor: Executor,
+    fetch_workers: int = 1,
+    render_workers: int = 1,
+    prefetch: int = DEFAULT_PREFETCH,
+    on_result: Callable[[dict[str, Any]], None] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Fetches and renders every item, overlapping the two stages.
+
+    :param list[str] names: Items to process, e.g. curriculum names.
+    :param Callable[[str], Any] fetch: Fetches what an item needs. Runs on fetch_executor.
+    :param Callable[[str, Any], dict[str, Any]] render: Renders an item from what was
+        fetched, returning a result like main.run_curriculum_job. Runs on render_executor,
+        so must be picklable for a process pool.
+    :param Executor fetch_executor: Executor for fetches, usually threads.
+    :param Executor render_executor: Executor for renders, usually processes.
+    :param int fetch_workers: Fetches running at once, defaults to 1.
+    :param int render_workers: Renders running at once, defaults to 1.
+    :param int prefetch: Fetched items that may wait for a renderer, defaults to DEFAULT_PREFETCH.
+    :param Callable | None on_result: Called with each result as it comes in, defaults to None.
+    :return list[dict[str, Any]]: A result per item, in the order of names.
+    """
+    loop = asyncio.get_running_loop()
+    pending: asyncio.Queue[str] = asyncio.Queue()
+    for name in names:
+        pending.put_nowait(name)
+    fetched: asyncio.Queue[tuple[str, Any, float] | None] = asyncio.Queue(maxsize=prefetch)
+    results: dict[str, dict[str, Any]] = {}
+
+    def finish(result: dict[str, Any]) -> None:
+        results[result["curriculum"]] = result
+        if on_result is not None:
+            on_result(result)
+
+    async def fetcher() -> None:
+        while not pending.empty():
+            name = pending.get_nowait()
+            start = time.perf_counter()
+            try:
+                payload = await loop.run_in_executor(fetch_executor, fetch, name)
+            except Exception as e:
+                logger.error(f"[ERROR] Fetching {name} failed: {e}")
+                finish(_failure(name, e, start))
+                continue
+            # Waits here while the renderers are behind
+            await fetched.put((name, payload, time.perf_counter() - start))
+
+    async def renderer() -> None:
+        while (item := await fetched.get()) is not None:
+            name, payload, fetch_seconds = item
+            start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(render_executor, render, name, payload)
+            except Exception as e:
+                result = _failure(name, e, start)
+            finish({**result, "fetch_seconds": fetch_seconds})
+
+    renderers = [asyncio.create_task(renderer()) for _ in range(render_workers)]
+    await asyncio.gather(*(fetcher() for _ in range(fetch_workers)))
+    for _ in renderers:
+        await fetched.put(None)
+    await asyncio.gather(*renderers)
+    return [results[name] for name in names]
+
+
+def generate_pipelined(
+    curricula: dict[str, dict],
+    base_output_dir: Path,
+    config: dict[str, Any],
+    jobs: int = 1,
+    full_rebuild: bool = False,
+    resume: bool = False,
+    on_result: Callable[[dict[str, Any]], None] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Generates curricula with pipeline, fetching in threads and rendering in jobs processes.
+
+    Each precontext is checked like in preflight as soon as it is fetched, and a
+    curriculum with problems fails on its own instead of stopping the run.
+
+    :param dict[str, dict] curricula: Entries of config["curriculum"] to generate, by name.
+    :param Path base_output_dir: Directory the curricula are generated in.
+    :param dict[str, Any] config: Loaded config.json.
+    :param int jobs: Curricula rendered at once, defaults to 1.
+    :param bool full_rebuild: Regenerate every artifact, defaults to False.
+    :param bool resume: Resume the last run of each curriculum, defaults to False.
+    :param Callable | None on_result: Called with each result as it comes in, defaults to None.
+    :return list[dict[str, Any]]: Results of main.run_curriculum_job, in order.
+    """
+    import multiprocessing
+
+    from src.journal import RunJournal
+    from src.main import getPrecontext, run_curriculum_job
+    from src.preflight import PreflightError, check_precontext
+    from src.utils.limits import init_limits, limit_sizes, make_limits
+    from src.utils.make_id_from_title import make_id_from_title
+
+    def fetch(name: str) -> dict[str, Any]:
+        output_dir = base_output_dir / Path(make_id_from_title(name))
+        if resume:
+            entry = RunJournal(output_dir, resume=True).lookup("precontext")
+            if entry is not None:
+                return entry["result"]
+        precontext = getPrecontext(curricula[name]["record_id"], output_dir, option_num=1)
+        if not precontext:
+            raise PreflightError([f"{name}: could not get precontext"])
+        problems = check_precontext(precontext, config)
+        if problems:
+            raise PreflightError([f"{name}: {problem}" for problem in problems])
+        return precontext
+
+    render = partial(
+        _render,
+        base_output_dir=base_output_dir,
+        curricula=curricula,
+        full_rebuild=full_rebuild,
+        resume=resume,
+        job=run_curriculum_job,
+    )
+    fetch_workers = limit_sizes(config)["network"]
+    start = time.perf_counter()
+    with multiprocessing.Manager() as manager:
+        semaphores = make_limits(manager, config)
+        # Fetches in this process share the limits with the renderers
+        init_limits(semaphores)
+        with ThreadPoolExecutor(max_workers=fetch_workers) as fetch_executor, ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_limits, initargs=(semaphores,)
+        ) as render_executor:
+            results = asyncio.run(
+                pipeline(
+                    list(curricula),
+                    fetch,
+                    render,
+                    fetch_executor,
+                    render_executor,
+                    fetch_workers=fetch_workers,
+                    render_workers=jobs,
+                    prefetch=max(jobs, DEFAULT_PREFETCH),
+                    on_result=on_result,
+                )
+            )
+        init_limits({})
+    fetching = sum(result.get("fetch_seconds", 0.0) for result in results)
+    rendering = sum(result["seconds"] for result in results if "fetch_seconds" in result)
+    logger.info(
+        f"Pipeline: {len(results)} curricula in {time.perf_counter() - start:.1f}s "
+        f"({fetching:.1f}s fetching, {rendering:.1f}s rendering)."
+    )
+    return results
+
+
+def _render(
+    name: str,
+    precontext: dict[str, Any],
+    base_output_dir: Path,
+    curricula: dict[str, dict],
+    full_rebuild: bool,
+    resume: bool,
+    job: Callable[..., dict[str, Any]],
+) -> dict[str, Any]:
+    return job(name, curricula[name], base_output_dir, precontext, full_rebuild, resume)
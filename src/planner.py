@@ -0,0 +1,325 @@
+"""
+planner.py
+Plans which artifacts of a curriculum have to be regenerated.
+
+After a successful build, the precontext it was built from is saved with the
+hashes of its attachments, templates and config (build_state.json). The next
+build diffs its fresh precontext against that state, and maps every change to
+the artifacts depending on it. Artifacts are named like the tasks building them
+in main.build_graph: "cover", "further", "packet", "device_reading:<id>" and
+"ta_guide:<id>".
+
+Example: a new cohort only needs its own TA guide, a retitled further reading
+only the further readings page and the packet.
+"""
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from src.utils.artifacts import atomic_write_text
+from src.utils.cache import hash_bytes, hash_file
+from src.utils.make_id_from_title import make_id_from_title
+
+BUILD_STATE_VERSION = 1
+BUILD_STATE_FILE = "build_state.json"
+# Precontext fields shown on every document.
+SHARED_FIELDS = (
+    "curriculum_name",
+    "program_long_name",
+    "program_name",
+    "time_period",
+    "chron_info",
+    "title",
+    "subtitle",
+    "color_primary",
+    "color_primary_faded",
+    "color_secondary",
+)
+# Precontext fields that hold paths of attachments, compared by content.
+ATTACHMENT_FIELDS = ("logo_path", "meeting_ta_guide_pdf", "base_ta_guide_pdf")
+# Config entries that don't change any output.
+IGNORED_CONFIG_KEYS = (
+    "cache_dir",
+    "concurrency",
+    "curriculum",
+    "keep_intermediates",
+    "output_dir",
+    "planner",
+    "queue",
+    "scheduler",
+    "server",
+)
+
+
+def device_reading_artifact(reading: dict[str, Any]) -> str:
+    return f"device_reading:{make_id_from_title(reading['title'])}"
+
+
+def ta_guide_artifact(cohort: dict[str, Any]) -> str:
+    return f"ta_guide:{make_id_from_title(cohort['name'])}"
+
+
+def is_artifact(name: str) -> bool:
+    """Whether a task of main.build_graph builds an artifact the planner tracks."""
+    return name in ("cover", "further", "packet") or name.startswith(("device_reading:", "ta_guide:"))
+
+
+def _all_artifacts(precontext: dict[str, Any]) -> set[str]:
+    artifacts = {"cover", "further", "packet"}
+    artifacts |= {
+        device_reading_artifact(r) for r in precontext["core_readings"] if r.get("read_on_device")
+    }
+    artifacts |= {ta_guide_artifact(cohort) for cohort in precontext["cohorts"]}
+    return artifacts
+
+
+def _hash_path(path: str | Path | None) -> str | None:
+    if not path or not Path(path).is_file():
+        return None
+    return hash_file(Path(path))
+
+
+def _config_hash(config: dict[str, Any]) -> str:
+    relevant = {k: v for k, v in config.items() if k not in IGNORED_CONFIG_KEYS}
+    return hash_bytes(json.dumps(relevant, sort_keys=True, default=str).encode())
+
+
+def file_hashes(precontext: dict[str, Any], config: dict[str, Any]) -> dict[str, str | None]:
+    """
+    Hashes every file the outputs of a precontext are built from.
+
+    Attachments are downloaded to the same paths on every fetch, so they are
+    compared by content rather than by path.
+
+    :param dict[str, Any] precontext: Precontext of the curriculum.
+    :param dict[str, Any] config: Loaded config.json.
+    :return dict[str, str | None]: Hashes by "attachment:", "reading:" and "template:" keys.
+    """
+    hashes = {f"attachment:{key}": _hash_path(precontext.get(key)) for key in ATTACHMENT_FIELDS}
+    for reading in precontext["core_readings"]:
+        hashes[f"reading:{_reading_key(reading)}"] = _hash_path(reading.get("trimmed_pdf"))
+    for name, template in config["templates"].items():
+        hashes[f"template:{name}"] = _hash_path(template)
+    hashes["config"] = _config_hash(config)
+    return hashes
+
+
+def attachment_paths(precontext: dict[str, Any]) -> list[Path]:
+    """Returns the downloaded attachments of a precontext: logo, TA guides and trimmed pdfs."""
+    paths = [precontext.get(key) for key in ATTACHMENT_FIELDS]
+    paths += [reading.get("trimmed_pdf") for reading in precontext["core_readings"]]
+    return [Path(path) for path in paths if path]
+
+
+def _reading_key(reading: dict[str, Any]) -> str:
+    return make_id_from_title(f"{reading['title']}{reading.get('subsection', '')}")
+
+
+def save_build_state(
+    output_dir: Path,
+    precontext: dict[str, Any],
+    config: dict[str, Any],
+    outputs: dict[str, Path | None],
+) -> Path:
+    """
+    Records what a successful build of output_dir was built from and what it made.
+
+    :param Path output_dir: Output directory of the curriculum.
+    :param dict[str, Any] precontext: Precontext the build used, as fetched.
+    :param dict[str, Any] config: Loaded config.json.
+    :param dict[str, Path | None] outputs: Output of every artifact, by name.
+    :return Path: Path of the saved state.
+    """
+    state = {
+        "version": BUILD_STATE_VERSION,
+        "precontext": precontext,
+        "hashes": file_hashes(precontext, config),
+        "outputs": {name: str(path) for name, path in outputs.items() if path is not None},
+    }
+    return atomic_write_text(
+        output_dir / Path(BUILD_STATE_FILE), json.dumps(state, indent=4, default=str)
+    )
+
+
+def stale_outputs(
+    state: dict[str, Any] | None, precontext: dict[str, Any], outputs: dict[str, Path | None]
+) -> list[Path]:
+    """
+    Returns the outputs of the last build whose artifact no longer exists.
+
+    These are e.g. the TA guides of cohorts or the device readings of readings
+    removed from the precontext since. Outputs of stages that were only disabled
+    in the config are not included, nor are paths this build produced again.
+
+    :param dict[str, Any] | None state: State from load_build_state, None if there is none.
+    :param dict[str, Any] precontext: Precontext of this build.
+    :param dict[str, Path | None] outputs: Output of every artifact of this build, by name.
+    :return list[Path]: Outputs to remove.
+    """
+    if state is None:
+        return []
+    everything = _all_artifacts(precontext)
+    produced = {Path(path) for path in outputs.values() if path is not None}
+    return [
+        Path(path)
+        for name, path in state.get("outputs", {}).items()
+        if name not in everything and Path(path) not in produced
+    ]
+
+
+def load_build_state(output_dir: Path) -> dict[str, Any] | None:
+    """Returns the state saved by the last successful build, if there is one."""
+    path = output_dir / Path(BUILD_STATE_FILE)
+    if not path.exists():
+        return None
+    try:
+        state = json.loads(path.read_text())
+    except ValueError:
+        return None
+    return state if state.get("version") == BUILD_STATE_VERSION else None
+
+
+@dataclass
+class Change:
+    description: str
+    artifacts: set[str]
+
+
+@dataclass
+class Plan:
+    """The changes since the last build, and the artifacts they require."""
+
+    changes: list[Change] = field(default_factory=list)
+    full: bool = False
+    outputs: dict[str, str] = field(default_factory=dict)
+    # Other files an artifact writes besides its output, e.g. the packet's variants.
+    # It is only kept if they all still exist.
+    companions: dict[str, list[Path]] = field(default_factory=dict)
+
+    @property
+    def artifacts(self) -> set[str]:
+        artifacts = set().union(*(change.artifacts for change in self.changes))
+        # The packet is merged from the cover, further readings and device readings
+        if any(a == "cover" or a == "further" or a.startswith("device_reading:") for a in artifacts):
+            artifacts.add("packet")
+        return artifacts
+
+    def needs(self, artifact: str) -> bool:
+        """Whether artifact has to be (re)generated."""
+        return self.full or artifact in self.artifacts
+
+    def reusable(self, artifact: str) -> Path | None:
+        """Returns the output of artifact from the last build, if it can be kept."""
+        if self.needs(artifact) or artifact not in self.outputs:
+            return None
+        path = Path(self.outputs[artifact])
+        if not path.exists() or not all(p.exists() for p in self.companions.get(artifact, [])):
+            return None
+        return path
+
+    def __str__(self) -> str:
+        if self.full:
+            reason = self.changes[0].description if self.changes else "requested"
+            return f"Full rebuild ({reason})."
+        if not self.changes:
+            return "Nothing changed since the last build."
+        lines = [f"{len(self.changes)} change(s), regenerating {', '.join(sorted(self.artifacts))}:"]
+        lines += [f"  - {change.description}" for change in self.changes]
+        return "\n".join(lines)
+
+
+def plan_rebuild(
+    state: dict[str, Any] | None, precontext: dict[str, Any], config: dict[str, Any]
+) -> Plan:
+    """
+    Diffs a fresh precontext against the last build and plans what to regenerate.
+
+    :param dict[str, Any] | None state: State from load_build_state, None if there is none.
+    :param dict[str, Any] precontext: The freshly fetched precontext.
+    :param dict[str, Any] config: Loaded config.json.
+    :return Plan: Changes and the artifacts to regenerate.
+    """
+    if state is None:
+        return Plan([Change("no previous build", set())], full=True)
+    old = state["precontext"]
+    old_hashes = state["hashes"]
+    new_hashes = file_hashes(precontext, config)
+    everything = _all_artifacts(precontext)
+    device_readings = {a for a in everything if a.startswith("device_reading:")}
+    ta_guides = {a for a in everything if a.startswith("ta_guide:")}
+    changes = []
+
+    if old_hashes.get("config") != new_hashes["config"]:
+        return Plan([Change("config changed", everything)], full=True)
+
+    template_artifacts = {
+        "cover": {"cover"},
+        "device_reading": device_readings,
+        "further_reading": {"further"},
+        "tas_guide": ta_guides,
+    }
+    for name, artifacts in template_artifacts.items():
+        if old_hashes.get(f"template:{name}") != new_hashes.get(f"template:{name}"):
+            changes.append(Change(f"template '{name}' changed", set(artifacts)))
+
+    for key in SHARED_FIELDS:
+        if old.get(key) != precontext.get(key):
+            changes.append(Change(f"{key} changed", everything))
+    if old_hashes.get("attachment:logo_path") != new_hashes["attachment:logo_path"]:
+        changes.append(Change("logo changed", everything))
+    for key in ("meeting_ta_guide_pdf", "base_ta_guide_pdf"):
+        if old_hashes.get(f"attachment:{key}") != new_hashes[f"attachment:{key}"]:
+            changes.append(Change(f"{key} changed", set(ta_guides)))
+
+    # Core readings are listed on the cover and in TA guides, and merged into the packet
+    old_readings = {_reading_key(r): r for r in old["core_readings"]}
+    new_readings = {_reading_key(r): r for r in precontext["core_readings"]}
+    listing = {"cover", "packet"} | ta_guides
+    if list(old_readings) != list(new_readings):
+        added = new_readings.keys() - old_readings.keys()
+        removed = old_readings.keys() - new_readings.keys()
+        artifacts = set(listing)
+        artifacts |= {
+            device_reading_artifact(new_readings[k]) for k in added if new_readings[k].get("read_on_device")
+        }
+        description = "core readings " + ", ".join(
+            part
+            for part in (
+                f"added ({', '.join(sorted(added))})" if added else "",
+                f"removed ({', '.join(sorted(removed))})" if removed else "",
+                "reordered" if not added and not removed else "",
+            )
+            if part
+        )
+        changes.append(Change(description, artifacts))
+    for key in new_readings.keys() & old_readings.keys():
+        new, old_reading = new_readings[key], old_readings[key]
+        fields = [
+            f for f in new if f != "trimmed_pdf" and new.get(f) != old_reading.get(f)
+        ]
+        if fields:
+            artifacts = set(listing)
+            if new.get("read_on_device") or old_reading.get("read_on_device"):
+                artifacts.add(device_reading_artifact(new))
+            changes.append(Change(f"core reading '{key}' edited ({', '.join(fields)})", artifacts))
+        if old_hashes.get(f"reading:{key}") != new_hashes.get(f"reading:{key}"):
+            artifacts = {"packet"}
+            # Reading times, shown on the cover's progress bar, come from the pdf
+            if config.get("progress_bar", {}).get("enabled", False):
+                artifacts.add("cover")
+            changes.append(Change(f"trimmed pdf of '{key}' changed", artifacts))
+
+    if old["further_readings"] != precontext["further_readings"]:
+        changes.append(Change("further readings changed", {"further", "packet"}))
+
+    old_cohorts = {ta_guide_artifact(c): c for c in old["cohorts"]}
+    for cohort in precontext["cohorts"]:
+        artifact = ta_guide_artifact(cohort)
+        if artifact not in old_cohorts:
+            changes.append(Change(f"cohort '{cohort['name']}' added", {artifact}))
+        elif old_cohorts[artifact] != cohort:
+            changes.append(Change(f"cohort '{cohort['name']}' edited", {artifact}))
+
+    return Plan(changes, outputs=state.get("outputs", {}))
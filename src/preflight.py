@@ -0,0 +1,169 @@
+"""
+preflight.py
+Checks everything a run needs before any expensive stage starts.
+
+Problems with the config, templates, precontexts and attachments of every
+selected curriculum are collected and reported together, instead of failing
+one by one halfway through a run.
+"""
+
+from pathlib import Path
+from typing import Any
+
+from src.main import getPrecontext
+from src.utils.docx_converter import DEFAULT_BACKEND
+from src.utils.make_id_from_title import make_id_from_title
+
+# Template each generation stage needs, keyed by its config["generate"] option.
+STAGE_TEMPLATES = {
+    "cover": "cover",
+    "device_readings": "device_reading",
+    "further_readings": "further_reading",
+    "tas_guides": "tas_guide",
+}
+CONVERTER_BACKENDS = ("docx2pdf", "libreoffice", "unoserver")
+VARIANT_OPTIONS = ("footer_text", "image_dpi", "keep_links", "linearize", "merge_on_odd", "suffix")
+
+
+class PreflightError(Exception):
+    """Raised when preflight finds problems. Holds all of them."""
+
+    def __init__(self, problems: list[str]) -> None:
+        self.problems = problems
+        super().__init__(
+            f"Preflight found {len(problems)} problem(s):\n"
+            + "\n".join(f"  - {problem}" for problem in problems)
+        )
+
+
+def _missing(path: str | Path | None) -> bool:
+    return not path or not Path(path).is_file()
+
+
+def check_config(config: dict[str, Any]) -> list[str]:
+    """
+    Checks the config and the templates of every enabled stage.
+
+    :param dict[str, Any] config: Loaded config.json.
+    :return list[str]: Problems found, empty if there are none.
+    """
+    problems = []
+    for key in ("curriculum", "generate", "output_dir", "templates", "error_pdf"):
+        if key not in config:
+            problems.append(f"config: missing '{key}'")
+    if problems:
+        return problems
+
+    for stage, template in STAGE_TEMPLATES.items():
+        if not config["generate"].get(stage):
+            continue
+        template_path = config["templates"].get(template)
+        if _missing(template_path):
+            problems.append(f"config: template '{template}' not found at {template_path}")
+    if _missing(config["error_pdf"]):
+        problems.append(f"config: error_pdf not found at {config['error_pdf']}")
+
+    backend = config.get("converter", {}).get("backend", DEFAULT_BACKEND)
+    if backend not in CONVERTER_BACKENDS:
+        problems.append(f"config: unknown converter backend '{backend}'")
+
+    variants = config.get("pdf", {}).get("variants", {})
+    for name, profile in variants.items():
+        for option in profile:
+            if option not in VARIANT_OPTIONS:
+                problems.append(f"config: unknown option '{option}' in pdf variant '{name}'")
+    suffixes = [profile.get("suffix", "") for profile in variants.values()]
+    if len(set(suffixes)) != len(suffixes):
+        problems.append("config: pdf variants need different suffixes")
+
+    for curriculum, details in config["curriculum"].items():
+        if "record_id" not in details or "make_packet" not in details:
+            problems.append(f"config: curriculum '{curriculum}' needs record_id and make_packet")
+    return problems
+
+
+def check_precontext(precontext: dict[str, Any], config: dict[str, Any]) -> list[str]:
+    """
+    Checks that a precontext has everything the enabled stages will use.
+
+    :param dict[str, Any] precontext: Precontext of a curriculum.
+    :param dict[str, Any] config: Loaded config.json.
+    :return list[str]: Problems found, empty if there are none.
+    """
+    generate = config["generate"]
+    problems = []
+
+    if _missing(precontext.get("logo_path")):
+        problems.append(f"logo not found at '{precontext.get('logo_path')}'")
+
+    # Only device readings and packets use the readings' pdfs
+    readings = precontext.get("core_readings", [])
+    if not generate.get("device_readings") and not generate.get("packet"):
+        readings = []
+    for reading in readings:
+        title = reading.get("title")
+        if reading.get("trimmed_pdf"):
+            if _missing(reading["trimmed_pdf"]):
+                problems.append(f"trimmed pdf of '{title}' not found at {reading['trimmed_pdf']}")
+        elif not reading.get("read_on_device"):
+            problems.append(
+                f"reading '{title}' has no trimmed pdf and is not labeled as read_on_device"
+            )
+        elif not generate.get("device_readings"):
+            problems.append(
+                f"reading '{title}' is read_on_device but device readings are disabled"
+            )
+
+    if generate.get("tas_guides"):
+        if not precontext.get("cohorts"):
+            problems.append("TA guides enabled but the program has no cohorts")
+        if _missing(precontext.get("base_ta_guide_pdf")):
+            problems.append(
+                f"base TA guide not found at '{precontext.get('base_ta_guide_pdf')}'"
+            )
+        meeting_ta_guide_pdf = precontext.get("meeting_ta_guide_pdf")
+        if meeting_ta_guide_pdf and _missing(meeting_ta_guide_pdf):
+            problems.append(f"meeting TA guide not found at {meeting_ta_guide_pdf}")
+    return problems
+
+
+def run_preflight(
+    config: dict[str, Any],
+    base_output_dir: Path,
+    fetched: dict[str, dict[str, Any]] | None = None,
+) -> dict[str, dict[str, Any]]:
+    """
+    Fetches and checks the precontext of every curriculum selected in the config.
+
+    :param dict[str, Any] config: Loaded config.json.
+    :param Path base_output_dir: Directory the curricula are generated in.
+    :param dict[str, dict[str, Any]] | None fetched: Precontexts already fetched by name,
+        e.g. by a run being resumed. They are checked but not fetched again. Defaults to None.
+    :raises PreflightError: If any problem was found, listing all of them.
+    :return dict[str, dict[str, Any]]: Precontexts by curriculum name, to reuse in the run.
+    """
+    problems = check_config(config)
+    if problems:
+        raise PreflightError(problems)
+
+    precontexts = {}
+    for curriculum, details in config["curriculum"].items():
+        if not details["make_packet"]:
+            continue
+        output_dir = base_output_dir / Path(make_id_from_title(curriculum))
+        try:
+            precontext = (fetched or {}).get(curriculum) or getPrecontext(
+                details["record_id"], output_dir, option_num=1
+            )
+        except Exception as e:
+            problems.append(f"{curriculum}: could not get precontext ({e})")
+            continue
+        if not precontext:
+            problems.append(f"{curriculum}: could not get precontext")
+            continue
+        problems += [f"{curriculum}: {problem}" for problem in check_precontext(precontext, config)]
+        precontexts[curriculum] = precontext
+
+    if problems:
+        raise PreflightError(problems)
+    return precontexts
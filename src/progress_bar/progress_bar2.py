@@ -1,8 +1,11 @@
 import json
+import pathlib
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib.path import Path
 
+from src.utils.reading_time import DEFAULT_READING_TIME, estimate_reading_times
+
 
 # Load the JSON data
 def load_json_data(filepath):
@@ -11,10 +14,16 @@ def load_json_data(filepath):
     return data
 
 
-# Estimate reading time
-def estimate_reading_time(readings):
-    # Placeholder for reading times
-    return [30 for _ in readings]
+# Estimate reading time, unless it was already added to the precontext
+def estimate_reading_time(readings, config=None):
+    missing = [
+        reading for reading in readings
+        if "reading_time_min" not in reading and reading.get("trimmed_pdf")
+    ]
+    estimates = estimate_reading_times([pathlib.Path(r["trimmed_pdf"]) for r in missing], config)
+    for reading, estimate in zip(missing, estimates):
+        reading["reading_time_min"] = estimate["minutes"]
+    return [reading.get("reading_time_min", DEFAULT_READING_TIME) for reading in readings]
 
 
 # Function to create a rectangle with rounded corners
@@ -51,9 +60,9 @@ def rounded_rect(start_x, width, height, radius):
 
 
 # Generate the progress bar with custom-rounded corners
-def generate_progress_bar(data, output_path):
+def generate_progress_bar(data, output_path, config=None):
     core_readings = data["core_readings"]
-    reading_times = estimate_reading_time(core_readings)
+    reading_times = estimate_reading_time(core_readings, config)
     total_time = sum(reading_times)
 
     # Define a list of colors to cycle through for each block
@@ -98,4 +107,5 @@ if __name__ == "__main__":
     json_filepath = "./progress_bar/precontext.json"
     output_image_path = "./progress_bar/progress_bar.png"
     json_data = load_json_data(json_filepath)
-    generate_progress_bar(json_data, output_image_path)
+    config = load_json_data("config.json")
+    generate_progress_bar(json_data, output_image_path, config)
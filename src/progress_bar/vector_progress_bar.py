@@ -0,0 +1,156 @@
+"""
+vector_progress_bar.py
+Draws reading progress bars as vector PDF and SVG.
+
+Each core reading is a rounded block, as wide as its share of the total reading
+time, labeled with its title and minutes. Bars are cached by their readings and
+times, so re-rendering an unchanged curriculum is free.
+"""
+
+import json
+from pathlib import Path
+from typing import Any
+from xml.sax.saxutils import escape
+
+from pypdf import PdfReader, PdfWriter, Transformation
+from reportlab.lib.colors import HexColor
+from reportlab.pdfgen import canvas
+
+from src.utils.artifacts import atomic_open, atomic_path, atomic_write_text
+from src.utils.cache import hash_bytes
+from src.utils.reading_time import DEFAULT_READING_TIME
+
+COLORS = ["#B48BFF", "#FFC107", "#03A9F4", "#4CAF50", "#FF5722"]
+# Size of the bar in points, the 12x4 inch figure of progress_bar.py.
+WIDTH = 864
+HEIGHT = 288
+BAR_BOTTOM = 72
+BAR_HEIGHT = 72
+RADIUS = 12
+GAP = 4
+FONT_NAME = "Helvetica"
+FONT_SIZE = 9
+MAX_LABEL_CHARS = 40
+
+
+def _blocks(readings: list[dict[str, Any]]) -> list[tuple[float, float, str, str]]:
+    """Returns the x, width, color and label of the block of every reading."""
+    times = [reading.get("reading_time_min") or DEFAULT_READING_TIME for reading in readings]
+    total = sum(times) or 1
+    blocks = []
+    x = 0.0
+    for i, (reading, minutes) in enumerate(zip(readings, times)):
+        width = WIDTH * minutes / total
+        title = str(reading["title"])
+        if len(title) > MAX_LABEL_CHARS:
+            title = title[: MAX_LABEL_CHARS - 1] + "…"
+        blocks.append((x, width, COLORS[i % len(COLORS)], f"{title} ({minutes} min)"))
+        x += width
+    return blocks
+
+
+def progress_bar_key(readings: list[dict[str, Any]]) -> str:
+    """Returns a cache key for the bar of readings, from their titles and times."""
+    return hash_bytes(
+        json.dumps(
+            [[str(r["title"]), r.get("reading_time_min") or DEFAULT_READING_TIME] for r in readings]
+        ).encode()
+    )
+
+
+def draw_progress_bar(c: canvas.Canvas, readings: list[dict[str, Any]]) -> None:
+    """Draws the bar of readings on the current page of c."""
+    for x, width, color, label in _blocks(readings):
+        c.setFillColor(HexColor(color))
+        c.roundRect(
+            x + GAP / 2, BAR_BOTTOM, max(width - GAP, 1), BAR_HEIGHT, RADIUS, stroke=0, fill=1
+        )
+        c.saveState()
+        c.translate(x + width / 2, BAR_BOTTOM + BAR_HEIGHT + 8)
+        c.rotate(45)
+        c.setFillColorRGB(0, 0, 0)
+        c.setFont(FONT_NAME, FONT_SIZE)
+        c.drawString(0, 0, label)
+        c.restoreState()
+
+
+def progress_bar_svg(readings: list[dict[str, Any]]) -> str:
+    """
+    Draws the bar of readings as an SVG document.
+
+    :param list[dict[str, Any]] readings: Core readings, with "title" and "reading_time_min".
+    :return str: The SVG.
+    """
+    top = HEIGHT - BAR_BOTTOM - BAR_HEIGHT  # SVG's y axis points down
+    elements = []
+    for x, width, color, label in _blocks(readings):
+        elements.append(
+            f'<rect x="{x + GAP / 2:.2f}" y="{top}" width="{max(width - GAP, 1):.2f}" '
+            f'height="{BAR_HEIGHT}" rx="{RADIUS}" fill="{color}"/>'
+        )
+        label_x, label_y = x + width / 2, top - 8
+        elements.append(
+            f'<text x="{label_x:.2f}" y="{label_y}" transform="rotate(-45 {label_x:.2f} {label_y})" '
+            f'font-family="{FONT_NAME}" font-size="{FONT_SIZE}">{escape(label)}</text>'
+        )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}">' + "".join(elements) + "</svg>\n"
+    )
+
+
+def render_progress_bars(
+    bars: dict[str, list[dict[str, Any]]], cache_dir: Path, svg: bool = False
+) -> dict[str, Path]:
+    """
+    Renders the progress bars of many curricula at once, skipping cached ones.
+
+    :param dict[str, list[dict[str, Any]]] bars: Core readings of each curriculum, by name.
+    :param Path cache_dir: Directory the bars are cached in.
+    :param bool svg: Also write an SVG next to each pdf, defaults to False.
+    :return dict[str, Path]: Pdf of the bar of each curriculum, by name.
+    """
+    assert isinstance(cache_dir, Path)
+    paths = {}
+    for name, readings in bars.items():
+        key = progress_bar_key(readings)
+        pdf_path = cache_dir / f"{key}.pdf"
+        if not pdf_path.exists():
+            with atomic_path(pdf_path) as tmp_path:
+                c = canvas.Canvas(str(tmp_path), pagesize=(WIDTH, HEIGHT), invariant=True)
+                draw_progress_bar(c, readings)
+                c.showPage()
+                c.save()
+        svg_path = pdf_path.with_suffix(".svg")
+        if svg and not svg_path.exists():
+            atomic_write_text(svg_path, progress_bar_svg(readings))
+        paths[name] = pdf_path
+    return paths
+
+
+def stamp_progress_bar(
+    pdf_path: Path, bar_path: Path, box: tuple[float, float, float, float], page_index: int = 0
+) -> Path:
+    """
+    Draws a rendered bar onto a page of a pdf, e.g. the cover, in place.
+
+    The bar keeps its aspect ratio and is scaled to fit box.
+
+    :param Path pdf_path: Pdf to stamp.
+    :param Path bar_path: Bar rendered by render_progress_bars.
+    :param tuple[float, float, float, float] box: x, y, width and height in points the
+        bar is fit into, measured from the bottom left of the page.
+    :param int page_index: Page to stamp, defaults to 0.
+    :return Path: pdf_path.
+    """
+    x, y, width, height = box
+    scale = min(width / WIDTH, height / HEIGHT)
+    with atomic_open(pdf_path) as f:
+        reader = PdfReader(pdf_path)
+        writer = PdfWriter(clone_from=reader)
+        bar = PdfReader(bar_path).pages[0]
+        writer.pages[page_index].merge_transformed_page(
+            bar, Transformation().scale(scale).translate(x, y)
+        )
+        writer.write(f)
+    return pdf_path
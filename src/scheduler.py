@@ -0,0 +1,180 @@
+"""
+scheduler.py
+Runs the stages of a build as a graph of tasks.
+
+Each task names the tasks it depends on and gets their results. A task starts as
+soon as all of its dependencies have finished, on a thread pool, so independent
+stages (e.g. TA guides and the packet) run at the same time. After a run, the
+critical path (the chain of dependent tasks that determined the total time) can
+be reported.
+
+Usage:
+    scheduler = Scheduler()
+    scheduler.add(Task("precontext", lambda deps: fetch()))
+    scheduler.add(Task("cover", lambda deps: make_cover(deps["precontext"]), deps=["precontext"]))
+    results = scheduler.run()
+    logger.info(scheduler.report())
+"""
+
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("MopMan")
+
+
+@dataclass
+class Task:
+    """
+    A unit of work in the build graph.
+
+    fn is called with the results of deps, by task name. inputs and outputs are
+    the files the task reads and writes, where they are known up front.
+    """
+
+    name: str
+    fn: Callable[[dict[str, Any]], Any]
+    deps: list[str] = field(default_factory=list)
+    inputs: list[Path] = field(default_factory=list)
+    outputs: list[Path] = field(default_factory=list)
+    start: float | None = None
+    end: float | None = None
+
+    @property
+    def duration(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class SchedulerError(Exception):
+    """Raised when the task graph is invalid."""
+
+
+class Scheduler:
+    """Runs a graph of Tasks concurrently, respecting their dependencies."""
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        """
+        :param int | None max_workers: Tasks run at once, defaults to the
+            ThreadPoolExecutor default.
+        """
+        self.max_workers = max_workers
+        self.tasks: dict[str, Task] = {}
+        self.results: dict[str, Any] = {}
+
+    def add(self, task: Task) -> Task:
+        """Adds a task to the graph. Its dependencies may be added later."""
+        assert isinstance(task, Task)
+        if task.name in self.tasks:
+            raise SchedulerError(f"Task '{task.name}' was added twice")
+        self.tasks[task.name] = task
+        return task
+
+    def _check(self) -> None:
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise SchedulerError(f"Task '{task.name}' depends on unknown task '{dep}'")
+        # Kahn's algorithm: every task must be reachable without a cycle
+        remaining = {name: len(task.deps) for name, task in self.tasks.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        seen = 0
+        while ready:
+            name = ready.pop()
+            seen += 1
+            for dependent in self._dependents(name):
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if seen != len(self.tasks):
+            raise SchedulerError("The task graph has a cycle")
+
+    def _dependents(self, name: str) -> list[str]:
+        return [task.name for task in self.tasks.values() if name in task.deps]
+
+    def _run_task(self, task: Task) -> Any:
+        task.start = time.perf_counter()
+        try:
+            return task.fn({dep: self.results[dep] for dep in task.deps})
+        finally:
+            task.end = time.perf_counter()
+
+    def run(self) -> dict[str, Any]:
+        """
+        Runs every task once its dependencies are done.
+
+        If a task fails, no new tasks are started, the running ones are waited for
+        and the first error is raised.
+
+        :raises SchedulerError: If a dependency is unknown or the graph has a cycle.
+        :return dict[str, Any]: The result of every task, by name.
+        """
+        self._check()
+        remaining = {name: set(task.deps) for name, task in self.tasks.items()}
+        running: dict[Future, str] = {}
+        error: BaseException | None = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            def submit_ready() -> None:
+                for name, deps in list(remaining.items()):
+                    if not deps:
+                        del remaining[name]
+                        running[executor.submit(self._run_task, self.tasks[name])] = name
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        logger.error(f"[ERROR] Task '{name}' failed: {future.exception()}")
+                        error = error or future.exception()
+                        continue
+                    self.results[name] = future.result()
+                    for deps in remaining.values():
+                        deps.discard(name)
+                if error is None:
+                    submit_ready()
+
+        if error is not None:
+            raise error
+        return self.results
+
+    def critical_path(self) -> list[Task]:
+        """
+        Returns the chain of tasks that determined when the run finished.
+
+        Walks back from the task that finished last, each time to the dependency
+        that finished last.
+
+        :return list[Task]: The tasks of the critical path, in order.
+        """
+        finished = [task for task in self.tasks.values() if task.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda task: task.end)]
+        while path[-1].deps:
+            deps = [self.tasks[dep] for dep in path[-1].deps if self.tasks[dep].end is not None]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda task: task.end))
+        return path[::-1]
+
+    def report(self) -> str:
+        """Describes the total time and the critical path of the last run."""
+        finished = [task for task in self.tasks.values() if task.end is not None]
+        if not finished:
+            return "No tasks ran."
+        total = max(task.end for task in finished) - min(task.start for task in finished)
+        busy = sum(task.duration for task in finished)
+        lines = [
+            f"{len(finished)} tasks in {total:.1f}s ({busy:.1f}s of work). Critical path:"
+        ]
+        lines += [f"  {task.name}: {task.duration:.1f}s" for task in self.critical_path()]
+        return "\n".join(lines)
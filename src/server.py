@@ -0,0 +1,318 @@
+"""
+server.py
+HTTP service that generates curricula on request, keeping its state warm.
+
+A CLI run re-imports the document libraries, re-reads the templates and opens
+new connections every time. The service does all of that once: templates stay
+cached in memory (DocumentGenerator.load_template), downloads share one HTTP
+session (utils.http), the pdf index stays loaded, and with the "unoserver"
+converter a LibreOffice instance is kept running. Regenerating a meeting then
+only costs the render work itself.
+
+Endpoints:
+    GET  /health                        Status of the service.
+    POST /jobs                          {"curriculum_id": "rec...", "full_rebuild": false}
+    GET  /jobs                          Every job.
+    GET  /jobs/<id>                     Status and outputs of a job.
+    GET  /jobs/<id>/download            The packet of a finished job,
+                                        ?artifact=<name> for another output.
+
+Usage:
+    packetmaker serve --port 8000
+    gunicorn 'src.server:app' --workers=1 --threads=4 --bind=0.0.0.0:8000
+
+Jobs are kept in memory, so the service must run as a single process.
+
+The endpoints have no authentication: anyone who can reach the service can start
+jobs and download every packet. The Docker image listens on 0.0.0.0, so only
+expose it on a trusted network or behind an authenticating proxy.
+"""
+
+import json
+import logging
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs
+
+from src.utils.make_id_from_title import make_id_from_title
+
+logger = logging.getLogger("MopMan")
+
+DEFAULT_MAX_JOBS = 1
+MAX_BODY_BYTES = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+STATUS_TEXT = {
+    200: "200 OK",
+    202: "202 Accepted",
+    400: "400 Bad Request",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    409: "409 Conflict",
+}
+
+
+@dataclass
+class Job:
+    """A request to generate one curriculum."""
+
+    curriculum_id: str
+    curriculum: str
+    full_rebuild: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"  # queued, running, done or failed
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    error: str | None = None
+    outputs: dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def generate_job(job: Job, config: dict[str, Any]) -> dict[str, Path | None]:
+    """Generates the curriculum of job into the output directory of config."""
+    from src.main import main
+
+    output_dir = Path(config["output_dir"]) / Path(make_id_from_title(job.curriculum))
+    return main(job.curriculum_id, output_dir=output_dir, full_rebuild=job.full_rebuild)
+
+
+class GenerationService:
+    """WSGI app that runs generation jobs in the background."""
+
+    def __init__(
+        self,
+        config: dict[str, Any],
+        run_job: Callable[[Job, dict[str, Any]], dict[str, Path | None]] = generate_job,
+    ) -> None:
+        """
+        :param dict[str, Any] config: Loaded config.json.
+        :param Callable run_job: Generates a job and returns its outputs by artifact name,
+            defaults to generate_job.
+        """
+        self.config = config
+        self.run_job = run_job
+        self.jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._converter: subprocess.Popen | None = None
+
+    def warm_up(self) -> None:
+        """Loads templates and the pdf index, and starts the converter server if used."""
+        from src.DocumentGenerator import load_template
+        from src.utils.pdf_index import get_pdf_index
+
+        for template in self.config["templates"].values():
+            if Path(template).suffix == ".docx" and Path(template).exists():
+                load_template(Path(template))
+        get_pdf_index(self.config)
+        backend = self.config.get("converter", {}).get("backend")
+        if backend == "unoserver" and self._converter is None and shutil.which("unoserver"):
+            # Exits right away if a unoserver is already listening, which is fine
+            self._converter = subprocess.Popen(
+                ["unoserver"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        logger.info("[SUCCESS] Generation service warmed up.")
+
+    def close(self) -> None:
+        """Waits for running jobs and stops the converter server."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._converter is not None:
+            self._converter.terminate()
+
+    def _curriculum_name(self, curriculum_id: str) -> str:
+        for name, details in self.config["curriculum"].items():
+            if details["record_id"] == curriculum_id:
+                return name
+        return curriculum_id
+
+    def submit(self, curriculum_id: str, full_rebuild: bool = False) -> tuple[Job, bool]:
+        """
+        Queues a job, unless the same curriculum is already queued or running.
+
+        :param str curriculum_id: Airtable record ID of the curriculum.
+        :param bool full_rebuild: Regenerate every artifact, defaults to False.
+        :return tuple[Job, bool]: The job, and whether it was newly created.
+        """
+        with self._lock:
+            for job in self.jobs.values():
+                if job.curriculum_id == curriculum_id and job.status in ("queued", "running"):
+                    return job, False
+            job = Job(curriculum_id, self._curriculum_name(curriculum_id), full_rebuild)
+            self.jobs[job.id] = job
+            if self._executor is None:
+                max_jobs = self.config.get("server", {}).get("max_jobs", DEFAULT_MAX_JOBS)
+                self._executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def _run(self, job: Job) -> None:
+        job.status = "running"
+        job.started = time.time()
+        logger.info(f"Job {job.id}: generating {job.curriculum}...")
+        try:
+            outputs = self.run_job(job, self.config)
+            job.outputs = {name: str(path) for name, path in outputs.items() if path is not None}
+            job.status = "done"
+            logger.info(f"[SUCCESS] Job {job.id} done in {time.time() - job.started:.1f}s.")
+        except Exception as e:
+            logger.exception(e)
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+
+    def __call__(
+        self, environ: dict[str, Any], start_response: Callable[..., Any]
+    ) -> Iterable[bytes]:
+        method = environ["REQUEST_METHOD"]
+        parts = [part for part in environ.get("PATH_INFO", "/").split("/") if part]
+
+        if parts == ["health"]:
+            if method != "GET":
+                return self._error(start_response, 405, "Use GET")
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return self._json(start_response, 200, {"status": "ok", "jobs": counts})
+        if parts == ["jobs"]:
+            if method == "GET":
+                return self._json(
+                    start_response, 200, [job.to_dict() for job in self.jobs.values()]
+                )
+            if method == "POST":
+                return self._post_job(environ, start_response)
+            return self._error(start_response, 405, "Use GET or POST")
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            if method != "GET":
+                return self._error(start_response, 405, "Use GET")
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return self._error(start_response, 404, f"No job {parts[1]}")
+            if len(parts) == 2:
+                return self._json(start_response, 200, job.to_dict())
+            if parts[2] == "download":
+                return self._download(job, environ, start_response)
+        return self._error(start_response, 404, "Not found")
+
+    def _post_job(
+        self, environ: dict[str, Any], start_response: Callable[..., Any]
+    ) -> Iterable[bytes]:
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if length > MAX_BODY_BYTES:
+            return self._error(start_response, 400, "Request body too large")
+        try:
+            body = json.loads(environ["wsgi.input"].read(length) or b"{}")
+        except ValueError:
+            return self._error(start_response, 400, "Request body is not JSON")
+        curriculum_id = body.get("curriculum_id") if isinstance(body, dict) else None
+        if not isinstance(curriculum_id, str) or not make_id_from_title(curriculum_id):
+            return self._error(start_response, 400, "curriculum_id must be a string")
+        job, created = self.submit(curriculum_id, bool(body.get("full_rebuild", False)))
+        return self._json(
+            start_response,
+            202 if created else 200,
+            job.to_dict(),
+            [("Location", f"/jobs/{job.id}")],
+        )
+
+    def _download(
+        self, job: Job, environ: dict[str, Any], start_response: Callable[..., Any]
+    ) -> Iterable[bytes]:
+        if job.status != "done":
+            return self._error(start_response, 409, f"Job {job.id} is {job.status}")
+        artifact = parse_qs(environ.get("QUERY_STRING", "")).get("artifact", ["packet"])[0]
+        if artifact not in job.outputs or not Path(job.outputs[artifact]).exists():
+            return self._error(start_response, 404, f"Job {job.id} has no output '{artifact}'")
+        path = Path(job.outputs[artifact])
+        start_response(
+            STATUS_TEXT[200],
+            [
+                ("Content-Type", "application/pdf"),
+                ("Content-Length", str(path.stat().st_size)),
+                ("Content-Disposition", f'attachment; filename="{path.name}"'),
+            ],
+        )
+        file = open(path, "rb")
+        if "wsgi.file_wrapper" in environ:
+            return environ["wsgi.file_wrapper"](file, CHUNK_SIZE)
+        return _iter_file(file)
+
+    def _json(
+        self,
+        start_response: Callable[..., Any],
+        status: int,
+        data: Any,
+        headers: list[tuple[str, str]] | None = None,
+    ) -> list[bytes]:
+        body = json.dumps(data).encode()
+        start_response(
+            STATUS_TEXT[status],
+            [("Content-Type", "application/json"), ("Content-Length", str(len(body)))]
+            + (headers or []),
+        )
+        return [body]
+
+    def _error(
+        self, start_response: Callable[..., Any], status: int, message: str
+    ) -> list[bytes]:
+        return self._json(start_response, status, {"error": message})
+
+
+def _iter_file(file: Any) -> Iterable[bytes]:
+    with file:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+
+
+def create_app(config_path: Path = Path("config.json"), warm: bool = True) -> GenerationService:
+    """
+    Creates the service from a config file.
+
+    The config also becomes the one generation reads (see config.get_config), so the
+    artifacts are built with the config the service serves them from.
+
+    :param Path config_path: Path to config.json, defaults to "config.json".
+    :param bool warm: Warm up templates and caches right away, defaults to True.
+    :return GenerationService: The WSGI app.
+    """
+    from src.config import get_config, set_config_path
+
+    set_config_path(config_path)
+    service = GenerationService(get_config(config_path))
+    if warm:
+        service.warm_up()
+    return service
+
+
+class _LazyApp:
+    """Creates the service on the first request, so importing this module is cheap."""
+
+    def __init__(self) -> None:
+        self._app: GenerationService | None = None
+        self._lock = threading.Lock()
+
+    def __call__(
+        self, environ: dict[str, Any], start_response: Callable[..., Any]
+    ) -> Iterable[bytes]:
+        with self._lock:
+            if self._app is None:
+                self._app = create_app()
+        return self._app(environ, start_response)
+
+
+# Entry point for gunicorn
+app = _LazyApp()
@@ -1,47 +1,86 @@
+from contextlib import AbstractContextManager, ExitStack
 from copy import deepcopy
 from pathlib import Path
 from typing import Any
 import logging
 
+from pypdf import PdfReader
+
 from src.DocumentGenerator import GuideGenerator
 from src.utils.pdf_helpers import mergePdfs
+from src.utils.pdf_optimize import linearize_pdf
+from src.utils.pdf_stream import open_pdf
 from src.utils.make_id_from_title import make_id_from_title
 
+def open_shared_ta_guides(precontext: dict[str, Any], stack: ExitStack) -> list[PdfReader]:
+    """
+    Opens the meeting and base TA guides, which are the same for every cohort, once.
+
+    :param dict[str, Any] precontext: Precontext of the curriculum.
+    :param ExitStack stack: Keeps the guides open until it is closed.
+    :return list[PdfReader]: Readers to append to every cohort's guide, in order.
+    """
+    meeting_ta_guide_pdf = (
+        [stack.enter_context(open_pdf(Path(precontext["meeting_ta_guide_pdf"])))]
+        if precontext["meeting_ta_guide_pdf"]
+        else []
+    )
+    base_ta_guide_pdf = stack.enter_context(open_pdf(Path(precontext["base_ta_guide_pdf"])))
+    return meeting_ta_guide_pdf + [base_ta_guide_pdf]
+
+def generate_ta_guide(
+    precontext: dict[str, Any],
+    cohort: dict[str, Any],
+    output_dir: Path,
+    config: dict[str, Any],
+    shared_pdfs: list[PdfReader],
+    merge_lock: AbstractContextManager | None = None,
+) -> Path:
+    """
+    Generates the TA guide of one cohort.
+
+    :param dict[str, Any] precontext: Precontext of the curriculum.
+    :param dict[str, Any] cohort: The cohort.
+    :param Path output_dir: Output directory of the curriculum.
+    :param dict[str, Any] config: Loaded config.json.
+    :param list[PdfReader] shared_pdfs: Guides from open_shared_ta_guides.
+    :param AbstractContextManager | None merge_lock: Lock held while reading shared_pdfs, which can't be
+        read by several threads at once, defaults to None.
+    :return Path: The merged guide.
+    """
+    ta_guide_output_dir = output_dir / Path("TA Guides")
+    pdf_config = config.get("pdf", {})
+
+    cohort_context = deepcopy(precontext)
+    cohort_context["cohort"] = cohort
+    guide_name = f'{make_id_from_title(cohort["name"])} n{cohort["num_members"]}'
+    guide_dir = ta_guide_output_dir / Path(guide_name)
+
+    guide = GuideGenerator(
+        Path(config["templates"]["tas_guide"]), guide_dir, cohort_context, overwrite=True
+    )
+
+    # Not streamed: the streaming merge drops the base guide's bookmarks and links
+    with merge_lock or ExitStack():
+        guide_path = mergePdfs(
+            [guide.pdf_path] + shared_pdfs,
+            output_path=ta_guide_output_dir / Path(guide_name + ".pdf"),
+        )
+    if pdf_config.get("linearize", False):
+        linearize_pdf(guide_path, guide_path)
+    return guide_path
+
 def generate_ta_guides(precontext: dict[str, Any], output_dir: Path, config: dict[str, Any], logger: logging.Logger) -> None:
     if config["generate"]["tas_guides"]:
         print("\n")
         logger.info("Generating TA guides. This may take a while...")
-        guide_template_path = Path(config["templates"]["tas_guide"])
-        ta_guide_output_dir = output_dir / Path("TA Guides")
-
-        for cohort in precontext["cohorts"]:
-            logger.info(f"Making {cohort['name']}")
-            cohort_context = deepcopy(precontext)
-            cohort_context["cohort"] = cohort
-            guide_name = f'{make_id_from_title(cohort["name"])} n{cohort["num_members"]}'
-            guide_dir = ta_guide_output_dir / Path(guide_name)
-
-            guide = GuideGenerator(
-                guide_template_path, guide_dir, cohort_context, overwrite=True
-            )
-
-            meeting_ta_guide_pdf = (
-                [Path(precontext["meeting_ta_guide_pdf"])]
-                if precontext["meeting_ta_guide_pdf"]
-                else []
-            )
-
-            guide_pdfs = (
-                [guide.pdf_path]
-                + meeting_ta_guide_pdf
-                + [Path(precontext["base_ta_guide_pdf"])]
-            )
-
-            guide_path = mergePdfs(
-                guide_pdfs,
-                output_path=ta_guide_output_dir / Path(guide_name + ".pdf"),
-            )
-
-            logger.info(f"[SUCCESS] {guide_path}")
-
-        logger.info("[SUCCESS] All TA guides generated.")
\ No newline at end of file
+
+        # The meeting and base guides are the same for every cohort, parse them once
+        with ExitStack() as stack:
+            shared_pdfs = open_shared_ta_guides(precontext, stack)
+            for cohort in precontext["cohorts"]:
+                logger.info(f"Making {cohort['name']}")
+                guide_path = generate_ta_guide(precontext, cohort, output_dir, config, shared_pdfs)
+                logger.info(f"[SUCCESS] {guide_path}")
+
+        logger.info("[SUCCESS] All TA guides generated.")
@@ -1,31 +1,127 @@
+import logging
+from functools import cache
 from pathlib import Path
 
 from PIL import Image, ImageChops
 
+from src.utils.artifacts import atomic_copy, atomic_path
+from src.utils.cache import hash_file
 
-def adjust_logo(logo_path: Path, output_path: Path = Path("./")) -> Path:
+try:
+    import numpy as np
+except ImportError:  # numpy is optional (the "images" extra), Pillow is used instead
+    np = None
+
+logger = logging.getLogger("MopMan")
+
+# A pixel belongs to the logo if any channel differs from the background by more than this.
+DIFF_THRESHOLD = 100
+# Pixels more transparent than this are treated as background.
+ALPHA_THRESHOLD = 0
+# Rasters with more pixels than this use numpy (when installed) to find the bounding box.
+NUMPY_MIN_PIXELS = 1_000_000
+
+
+@cache
+def _warn_without_numpy() -> None:
+    logger.warning(
+        "numpy is not installed, trimming large logos with Pillow, which is slower. "
+        "Install the 'images' extra: pip install 'mopman-packetmaker[images]'"
+    )
+
+
+def _alpha_bbox(im: Image.Image) -> tuple[int, int, int, int] | None:
+    """Bounding box of the non-transparent pixels, without building a background image."""
+    alpha = im.getchannel("A")
+    if np is not None and im.width * im.height >= NUMPY_MIN_PIXELS:
+        return _mask_bbox(np.asarray(alpha) > ALPHA_THRESHOLD, channels=1)
+    return alpha.point(lambda a: 255 if a > ALPHA_THRESHOLD else 0).getbbox()
+
+
+def _color_bbox(im: Image.Image) -> tuple[int, int, int, int] | None:
+    """Bounding box of the pixels that differ from the top left (background) pixel."""
+    if np is not None and im.width * im.height >= NUMPY_MIN_PIXELS:
+        arr = np.asarray(im)
+        height, width = arr.shape[:2]
+        channels = arr.shape[2] if arr.ndim == 3 else 1
+        # Compare rows of interleaved channels against a tiled background row,
+        # which is much faster than broadcasting over a short channel axis.
+        rows = arr.reshape(height, width * channels)
+        bg = arr[0, 0].astype(np.int16).reshape(-1)
+        low = np.tile(np.clip(bg - DIFF_THRESHOLD, 0, 255).astype(np.uint8), width)
+        high = np.tile(np.clip(bg + DIFF_THRESHOLD, 0, 255).astype(np.uint8), width)
+        mask = rows < low
+        mask |= rows > high
+        return _mask_bbox(mask, channels)
+    bg = Image.new(im.mode, im.size, im.getpixel((0, 0)))
+    diff = ImageChops.difference(im, bg)
+    diff = ImageChops.add(diff, diff, 2.0, -DIFF_THRESHOLD)
+    return diff.getbbox(alpha_only=False)
+
+
+def _mask_bbox(mask, channels: int) -> tuple[int, int, int, int] | None:
+    """Bounding box of a (height, width * channels) boolean mask."""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask[rows[0] : rows[-1] + 1].any(axis=0)) // channels
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def trim(im: Image.Image) -> Image.Image | None:
+    """
+    Crops away the uniform (or transparent) border around a logo.
+
+    :param Image.Image im: Logo to trim.
+    :return Image.Image | None: The cropped logo, or None if the image is blank.
+    """
+    if im.mode in ("P", "LA", "PA") or (im.mode != "RGBA" and "transparency" in im.info):
+        im = im.convert("RGBA")
+    if np is None and im.width * im.height >= NUMPY_MIN_PIXELS:
+        _warn_without_numpy()
+    if im.mode == "RGBA" and im.getpixel((0, 0))[3] <= ALPHA_THRESHOLD:
+        bbox = _alpha_bbox(im)
+    else:
+        bbox = _color_bbox(im)
+    if bbox:
+        return im.crop(bbox)
+
+
+def adjust_logo(
+    logo_path: Path, output_path: Path = Path("./"), cache_dir: Path | None = None
+) -> Path:
+    """
+    Trims the border around a logo and saves it next to the other outputs.
+
+    Cropped logos are cached in cache_dir by the hash of the original, so the
+    same org logo is only trimmed once across curricula and runs.
+
+    :param Path logo_path: Logo to trim.
+    :param Path output_path: Directory to save the cropped logo in, defaults to "./".
+    :param Path | None cache_dir: Directory of previously cropped logos, defaults to None.
+    :return Path: Path to the cropped logo.
+    """
     assert isinstance(logo_path, Path)
     assert isinstance(output_path, Path)
-
-    def trim(im):
-        bg = Image.new(im.mode, im.size, im.getpixel((0, 0)))
-        diff = ImageChops.difference(im, bg)
-        diff = ImageChops.add(diff, diff, 2.0, -100)
-        bbox = diff.getbbox()
-        if bbox:
-            return im.crop(bbox)
+    assert cache_dir is None or isinstance(cache_dir, Path)
 
     if "cropped" in logo_path.stem:
         return logo_path
-    else:
-        im = Image.open(str(logo_path))
-        im = trim(im)
-        cropped_logo_path = output_path / Path(
-            f"{logo_path.stem}_cropped{logo_path.suffix}"
-        )
-        assert im is not None
-        im.save(str(cropped_logo_path))
-        return cropped_logo_path
-
 
+    cropped_logo_path = output_path / Path(f"{logo_path.stem}_cropped{logo_path.suffix}")
+    cached_logo_path = None
+    if cache_dir:
+        cached_logo_path = cache_dir / f"{hash_file(logo_path)}{logo_path.suffix}"
+        if cached_logo_path.exists():
+            return atomic_copy(cached_logo_path, cropped_logo_path)
 
+    with Image.open(str(logo_path)) as im:
+        cropped = trim(im)
+        assert cropped is not None
+        if cropped.mode == "RGBA" and logo_path.suffix.lower() in (".jpg", ".jpeg"):
+            cropped = cropped.convert("RGB")
+        with atomic_path(cropped_logo_path) as tmp_path:
+            cropped.save(str(tmp_path))
+    if cached_logo_path:
+        atomic_copy(cropped_logo_path, cached_logo_path)
+    return cropped_logo_path
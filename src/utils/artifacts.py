@@ -0,0 +1,175 @@
+"""
+artifacts.py
+Atomic, locked writes of generated files.
+
+Every stage writes its outputs through these helpers, so runs and workers
+sharing an output directory can't see or clobber each other's half-written
+files:
+
+- A file is written to a temporary file next to it, synced, and renamed over
+  the real path, so the path holds either the old or the new file, never a
+  partial one. A failed write leaves the old file in place.
+- While it is written, the file is locked, across threads and processes, so
+  two writers (e.g. two runs of the same curriculum) take turns. The lock is a
+  file named after the path in LOCK_DIR, locked with flock where available, so
+  output directories stay free of lock files.
+
+Usage:
+    atomic_write_text(output_dir / "precontext.json", json.dumps(precontext))
+
+    with atomic_path(pdf_path) as tmp_path:
+        writer.write(str(tmp_path))  # may read pdf_path in the meantime
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only hold within this process
+    fcntl = None
+
+
+# Shared by every process on the machine, whatever their working directory.
+LOCK_DIR = Path(tempfile.gettempdir()) / "packetmaker-locks"
+
+
+@dataclass
+class _Lock:
+    thread_lock: threading.RLock = field(default_factory=threading.RLock)
+    depth: int = 0
+    fd: int | None = None
+    # Threads holding or waiting for the lock. It is dropped from _locks at 0.
+    users: int = 0
+
+
+_locks: dict[Path, _Lock] = {}
+_locks_lock = threading.Lock()
+
+
+def lock_path(path: Path) -> Path:
+    """Returns the lock file of path, a resolved path."""
+    digest = hashlib.sha256(str(path).encode()).hexdigest()[:16]
+    return LOCK_DIR / f"{path.name}.{digest}.lock"
+
+
+@contextmanager
+def artifact_lock(path: Path) -> Iterator[None]:
+    """
+    Holds the lock of path, for other threads and processes. Reentrant within a thread.
+
+    :param Path path: The artifact to lock. Its directory is created if missing.
+    """
+    assert isinstance(path, Path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    key = path.resolve()
+    with _locks_lock:
+        lock = _locks.setdefault(key, _Lock())
+        lock.users += 1
+    try:
+        with lock.thread_lock:
+            if lock.depth == 0 and fcntl is not None:
+                LOCK_DIR.mkdir(parents=True, exist_ok=True)
+                lock.fd = os.open(lock_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(lock.fd, fcntl.LOCK_EX)
+            lock.depth += 1
+            try:
+                yield
+            finally:
+                lock.depth -= 1
+                if lock.depth == 0 and lock.fd is not None:
+                    fcntl.flock(lock.fd, fcntl.LOCK_UN)
+                    os.close(lock.fd)
+                    lock.fd = None
+    finally:
+        # Long-running services lock many paths, only keep the locks in use
+        with _locks_lock:
+            lock.users -= 1
+            if lock.users == 0:
+                del _locks[key]
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """
+    Yields a temporary path to write path's new content to, and replaces path with it.
+
+    The temporary path keeps path's suffix, for writers that pick the format from it.
+    path stays locked and readable with its old content until the block exits. If the
+    block raises, path is left untouched.
+
+    :param Path path: The artifact to write.
+    :yield Path: Where to write it.
+    """
+    assert isinstance(path, Path)
+    with artifact_lock(path):
+        tmp_path = path.with_name(
+            f".{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{path.suffix}"
+        )
+        try:
+            yield tmp_path
+            if not tmp_path.exists():
+                raise FileNotFoundError(f"Nothing was written to {tmp_path} for {path}")
+            with open(tmp_path, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            _fsync_dir(path.parent)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+
+@contextmanager
+def atomic_open(path: Path, mode: str = "wb", **kwargs: Any) -> Iterator[IO]:
+    """
+    Opens a file that replaces path once it is closed without an error.
+
+    :param Path path: The artifact to write.
+    :param str mode: A write mode, defaults to "wb".
+    :param kwargs: Passed to open, e.g. encoding.
+    :yield IO: The open file.
+    """
+    assert "w" in mode
+    with atomic_path(path) as tmp_path, open(tmp_path, mode, **kwargs) as f:
+        yield f
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> Path:
+    """Atomically replaces path with data. Returns path."""
+    with atomic_open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def atomic_write_text(path: Path, text: str, encoding: str = "utf-8") -> Path:
+    """Atomically replaces path with text. Returns path."""
+    with atomic_open(path, "w", encoding=encoding) as f:
+        f.write(text)
+    return path
+
+
+def atomic_copy(source: Path, path: Path) -> Path:
+    """Atomically replaces path with a copy of source. Returns path."""
+    with atomic_path(path) as tmp_path:
+        shutil.copyfile(source, tmp_path)
+    return path
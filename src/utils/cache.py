@@ -0,0 +1,47 @@
+import hashlib
+from pathlib import Path
+from typing import Any
+
+DEFAULT_CACHE_DIR = Path(".cache/")
+
+
+def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Computes the SHA-256 hex digest of a file's contents.
+
+    :param Path path: File to hash.
+    :param int chunk_size: Number of bytes read at a time, defaults to 1 MiB.
+    :return str: Hex digest of the file contents.
+    """
+    assert isinstance(path, Path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Computes the SHA-256 hex digest of some bytes.
+
+    :param bytes data: Data to hash.
+    :return str: Hex digest of data.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_cache_dir(name: str, config: dict[str, Any] | None = None) -> Path:
+    """
+    Returns (and creates) a named cache directory shared across runs.
+
+    The root is taken from config["cache_dir"] when set, otherwise ".cache/".
+
+    :param str name: Name of the cache, e.g. "images".
+    :param dict[str, Any] | None config: Loaded config.json, defaults to None.
+    :return Path: Directory for the cache.
+    """
+    root = Path((config or {}).get("cache_dir", DEFAULT_CACHE_DIR))
+    cache_dir = root / name
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
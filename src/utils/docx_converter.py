@@ -0,0 +1,101 @@
+"""
+docx_converter.py
+Converts rendered docx documents to pdf.
+
+The docx can be given either as a path or as the bytes of an in-memory document.
+Backends that read from stdin ("unoserver") get the bytes streamed to them
+directly. The others need a file, so the bytes are spilled to a temporary
+directory just for the conversion.
+
+Backends:
+    docx2pdf     Microsoft Word through docx2pdf (Word must be installed!!)
+    libreoffice  soffice --headless --convert-to pdf
+    unoserver    unoconvert talking to a running unoserver, reads the docx from stdin
+"""
+
+import shutil
+import subprocess
+import tempfile
+from contextlib import AbstractContextManager
+from pathlib import Path
+
+from src.utils.artifacts import artifact_lock, atomic_path
+from src.utils.limits import limit
+
+DEFAULT_BACKEND = "docx2pdf"
+# Word and a soffice sharing one user profile can only convert one document at a time,
+# across every process of the machine. unoserver queues concurrent requests itself.
+SINGLE_INSTANCE_BACKENDS = ("docx2pdf", "libreoffice")
+
+
+def _backend_lock(backend: str) -> AbstractContextManager[None]:
+    # A lock file in the temp directory is shared by every run and worker of this machine
+    return artifact_lock(Path(tempfile.gettempdir()) / f"packetmaker-{backend}")
+
+
+def _convert_docx2pdf(docx_path: Path, output_path: Path) -> None:
+    import docx2pdf
+
+    docx2pdf.convert(str(docx_path), str(output_path))
+
+
+def _convert_libreoffice(docx_path: Path, output_path: Path) -> None:
+    with tempfile.TemporaryDirectory() as out_dir:
+        subprocess.run(
+            ["soffice", "--headless", "--convert-to", "pdf", "--outdir", out_dir, str(docx_path)],
+            check=True,
+            capture_output=True,
+        )
+        shutil.move(Path(out_dir) / f"{docx_path.stem}.pdf", output_path)
+
+
+def _convert_unoserver(docx: Path | bytes, output_path: Path) -> None:
+    if isinstance(docx, Path):
+        docx = docx.read_bytes()
+    subprocess.run(
+        # The format of stdin is detected from its content
+        ["unoconvert", "--convert-to", "pdf", "-", str(output_path)],
+        input=docx,
+        check=True,
+        capture_output=True,
+    )
+
+
+_FILE_BACKENDS = {
+    "docx2pdf": _convert_docx2pdf,
+    "libreoffice": _convert_libreoffice,
+}
+
+
+def convert_docx(
+    docx: Path | bytes, output_path: Path, backend: str = DEFAULT_BACKEND
+) -> Path:
+    """
+    Converts a docx to pdf.
+
+    :param Path | bytes docx: Path to the docx, or the bytes of an in-memory docx.
+    :param Path output_path: Path to save the pdf to.
+    :param str backend: Conversion backend, defaults to DEFAULT_BACKEND.
+    :raises ValueError: If the backend is unknown.
+    :return Path: output_path.
+    """
+    assert isinstance(docx, (Path, bytes))
+    assert isinstance(output_path, Path)
+    if backend != "unoserver" and backend not in _FILE_BACKENDS:
+        raise ValueError(f"Unknown docx conversion backend: {backend}")
+
+    # Converters write their output piece by piece, so they write to a temporary file
+    with atomic_path(output_path) as tmp_path:
+        if backend == "unoserver":
+            with limit("converter"):
+                _convert_unoserver(docx, tmp_path)
+        elif isinstance(docx, Path):
+            with limit("converter"), _backend_lock(backend):
+                _FILE_BACKENDS[backend](docx, tmp_path)
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                docx_path = Path(tmp_dir) / output_path.with_suffix(".docx").name
+                docx_path.write_bytes(docx)
+                with limit("converter"), _backend_lock(backend):
+                    _FILE_BACKENDS[backend](docx_path, tmp_path)
+    return output_path
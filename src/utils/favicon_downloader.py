@@ -5,6 +5,15 @@ import requests
 from bs4 import BeautifulSoup, Tag
 from PIL import Image
 
+from src.utils.artifacts import atomic_path, atomic_write_bytes
+from src.utils.limits import limit
+
+# Suffixes of links that are never HTML pages, so there is no <head> to look in.
+NON_HTML_SUFFIXES = (".pdf", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".zip", ".mp4", ".mp3")
+# Upper bound on how much of a page is read while looking for </head>.
+MAX_HEAD_BYTES = 256 * 1024
+CHUNK_SIZE = 8 * 1024
+
 def _get_favicon_url(base_url: str, soup: BeautifulSoup) -> str | None:
     """
     Extracts the favicon URL from a BeautifulSoup object.
@@ -42,51 +51,109 @@ def _get_favicon_url(base_url: str, soup: BeautifulSoup) -> str | None:
 def _download_favicon(favicon_url: str, output_path: Path) -> Path | None:
     try:
         # Send a GET request to the favicon URL
-        response = requests.get(favicon_url)
+        with limit("network"):
+            response = requests.get(favicon_url)
 
         # Check if the request was successful
         if response.status_code == 200:
             # Save the favicon as a .ico file and png
-            ico_path = f"{output_path}.ico"
-            with open(ico_path, "wb") as f:
-                f.write(response.content)
-            Image.open(ico_path).save(f"{output_path}.png")
+            ico_path = atomic_write_bytes(Path(f"{output_path}.ico"), response.content)
+            with atomic_path(Path(f"{output_path}.png")) as png_path:
+                Image.open(ico_path).save(png_path)
         else:
             print("Failed to retrieve favicon. Status code:", response.status_code)
     except Exception as e:
         print("An error occurred:", str(e))
 
 
+def _is_html_content_type(content_type: str | None) -> bool:
+    """
+    Checks whether a Content-Type header describes an HTML document.
+
+    A missing header is treated as HTML since some servers omit it for pages.
+
+    :param str | None content_type: Value of the Content-Type header.
+    :return bool: True if the response may contain a <head> to parse.
+    """
+    if not content_type:
+        return True
+    mime_type = content_type.split(";")[0].strip().lower()
+    return mime_type in ("text/html", "application/xhtml+xml")
+
+
+def _read_html_head(response: requests.Response, max_bytes: int = MAX_HEAD_BYTES) -> str:
+    """
+    Reads a streamed response only until the end of its <head> element.
+
+    The body is consumed chunk by chunk and reading stops as soon as "</head>"
+    (or the start of <body>) has been seen, or after max_bytes, so the size of
+    the linked document does not matter.
+
+    :param requests.Response response: A response opened with stream=True.
+    :param int max_bytes: Maximum number of bytes to read, defaults to MAX_HEAD_BYTES.
+    :return str: The decoded HTML up to and including the end of the head.
+    """
+    head = b""
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        # Only search the new chunk plus a small overlap for split tags.
+        search_start = max(len(head) - len(b"</head>"), 0)
+        head += chunk
+        lowered = head[search_start:].lower()
+        end = lowered.find(b"</head>")
+        if end == -1:
+            end = lowered.find(b"<body")
+        if end != -1:
+            head = head[: search_start + end] + b"</head>"
+            break
+        if len(head) >= max_bytes:
+            break
+    encoding = response.encoding or "utf-8"
+    return head.decode(encoding, errors="replace")
+
+
 def get_favicon_from_website(url, output_path: Path = Path("./")) -> Path | None:
+    """
+    Downloads the favicon of the website hosting url.
+
+    Only the <head> of the page is downloaded and parsed. Links that are not HTML
+    (e.g. PDFs), either by their suffix or their Content-Type, are never parsed and
+    fall back to "/favicon.ico" on the same host.
+
+    :param str url: URL of the page to get the favicon of.
+    :param Path output_path: Path (without suffix) to save the favicon to.
+    :return Path | None: Path to the favicon png, or None if it could not be found.
+    """
     assert isinstance(output_path, Path)
     output_path = Path(output_path)  # todo: use Path instead lol
     try:
-        # Send a GET request to the website
-        response = requests.get(url)
+        # Get the base URL
+        parsed_url = urllib.parse.urlparse(url)
+        base_url = parsed_url.scheme + "://" + parsed_url.hostname
 
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Parse the HTML using BeautifulSoup
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            # Get the base URL
-            base_url = (
-                urllib.parse.urlparse(url).scheme
-                + "://"
-                + urllib.parse.urlparse(url).hostname
-            )
-
-            # Get the favicon URL
-            favicon_url = _get_favicon_url(base_url, soup)
-            # Download the favicon
-            if favicon_url:
-                _download_favicon(favicon_url, output_path)
-                return output_path.with_suffix(".png")
-            else:
-                print("No favicon URL found.")
-                return None
+        if parsed_url.path.lower().endswith(NON_HTML_SUFFIXES):
+            # No page to parse, go straight to the default location
+            favicon_url = urllib.parse.urljoin(base_url, "/favicon.ico")
+        else:
+            # Stream the website so only its head is downloaded
+            with limit("network"), requests.get(url, stream=True) as response:
+                # Check if the request was successful
+                if response.status_code != 200:
+                    print("Failed to retrieve website. Status code:", response.status_code)
+                    return None
+                if _is_html_content_type(response.headers.get("Content-Type")):
+                    # Parse the head using BeautifulSoup
+                    soup = BeautifulSoup(_read_html_head(response), "html.parser")
+                    # Get the favicon URL
+                    favicon_url = _get_favicon_url(base_url, soup)
+                else:
+                    favicon_url = urllib.parse.urljoin(base_url, "/favicon.ico")
+
+        # Download the favicon
+        if favicon_url:
+            _download_favicon(favicon_url, output_path)
+            return output_path.with_suffix(".png")
         else:
-            print("Failed to retrieve website. Status code:", response.status_code)
+            print("No favicon URL found.")
             return None
     except Exception as e:
         print("An error occurred:", str(e))
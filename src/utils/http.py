@@ -0,0 +1,30 @@
+"""
+http.py
+One requests session shared by every download of a process.
+
+Reusing the session keeps connections to Airtable's attachment servers alive
+between downloads, instead of a new TCP and TLS handshake for every file.
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.utils.limits import NETWORK_LIMIT
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Returns the shared session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=NETWORK_LIMIT * 2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
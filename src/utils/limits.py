@@ -0,0 +1,188 @@
+"""
+limits.py
+Concurrency limits shared by every process of a run.
+
+Each class of work gets its own limit, sized from the machine: network
+requests, docx conversions (one at a time with Word or soffice, several with
+unoserver), pdflatex runs and pdf merges. On top of that, work that needs a lot of memory reserves an
+estimate of it from a shared memory budget before it starts, so e.g. several
+big merges don't run at once and push the machine into swap.
+
+Every size can be overridden in config["concurrency"]: "converter", "latex",
+"merge", "network" and "memory_mb", or "memory_fraction" of the available
+memory used as the budget.
+
+Curricula generated in parallel worker processes still share the same limits.
+
+Usage:
+    with multiprocessing.Manager() as manager:
+        semaphores = make_limits(manager, config)
+        ProcessPoolExecutor(initializer=init_limits, initargs=(semaphores,))
+
+    # or in a single process
+    ensure_limits(config)
+
+    # in any process
+    with limit("network"):
+        requests.get(url)
+    with limit("merge", memory_mb=merge_memory_mb(paths)):
+        mergePdfs(paths, output_path)
+"""
+
+import math
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from multiprocessing.managers import SyncManager
+from pathlib import Path
+from typing import Any
+
+NETWORK_LIMIT = 4
+# Memory a single instance of a stage needs, in MB.
+STAGE_MEMORY_MB = {"converter": 400, "latex": 250}
+MERGE_MB_PER_INPUT_MB = 3
+STREAMING_MERGE_MB_PER_INPUT_MB = 1
+DEFAULT_MEMORY_FRACTION = 0.75
+FALLBACK_MEMORY_MB = 4096
+# The memory budget is reserved in units of this size.
+MEMORY_UNIT_MB = 64
+
+_semaphores: dict[str, Any] = {}
+_setup_lock = threading.Lock()
+
+
+def available_memory_mb() -> int:
+    """Returns the memory available for new processes, in MB."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        # No MemAvailable (e.g. macOS): assume half of the physical memory is free
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20 // 2
+    except (ValueError, OSError, AttributeError):
+        return FALLBACK_MEMORY_MB
+
+
+def limit_sizes(
+    config: dict[str, Any] | None = None,
+    cpu_count: int | None = None,
+    memory_mb: int | None = None,
+) -> dict[str, int]:
+    """
+    Sizes every limit from the CPU count and available memory, then config["concurrency"].
+
+    :param dict[str, Any] | None config: Loaded config.json, defaults to None.
+    :param int | None cpu_count: CPUs to size for, defaults to os.cpu_count().
+    :param int | None memory_mb: Available memory in MB, defaults to available_memory_mb().
+    :return dict[str, int]: Size of every limit by name, and the memory budget as "memory_mb".
+    """
+    from src.utils.docx_converter import DEFAULT_BACKEND, SINGLE_INSTANCE_BACKENDS
+
+    overrides = dict((config or {}).get("concurrency", {}))
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if memory_mb is None:
+        memory_mb = available_memory_mb()
+    budget = int(memory_mb * overrides.pop("memory_fraction", DEFAULT_MEMORY_FRACTION))
+    backend = (config or {}).get("converter", {}).get("backend", DEFAULT_BACKEND)
+    sizes = {
+        # Converters are heavy, multi-threaded processes. Word and soffice convert one
+        # document at a time, more slots would only wait on their lock.
+        "converter": 1
+        if backend in SINGLE_INSTANCE_BACKENDS
+        else max(1, min(cpu_count // 2, budget // STAGE_MEMORY_MB["converter"])),
+        "latex": max(1, min(cpu_count, budget // STAGE_MEMORY_MB["latex"])),
+        "merge": max(1, min(cpu_count, 4)),
+        "network": NETWORK_LIMIT,
+        "memory_mb": max(budget, MEMORY_UNIT_MB),
+    }
+    sizes.update(overrides)
+    return sizes
+
+
+def merge_memory_mb(pdf_paths: list[Any], streaming: bool = False) -> int:
+    """
+    Estimates the memory a merge of pdf_paths needs, from the sizes of the files.
+
+    :param list[Any] pdf_paths: Inputs of the merge. Anything but paths (e.g. open
+        readers) is already in memory and not counted.
+    :param bool streaming: Whether the merge streams pages out, defaults to False.
+    :return int: Estimate in MB.
+    """
+    total = sum(
+        Path(pdf).stat().st_size
+        for pdf in pdf_paths
+        if isinstance(pdf, (str, Path)) and Path(pdf).is_file()
+    )
+    factor = STREAMING_MERGE_MB_PER_INPUT_MB if streaming else MERGE_MB_PER_INPUT_MB
+    return math.ceil(total / 2**20 * factor)
+
+
+def _make(semaphore: Any, lock: Any, config: dict[str, Any] | None) -> dict[str, Any]:
+    sizes = limit_sizes(config)
+    memory_units = sizes.pop("memory_mb") // MEMORY_UNIT_MB
+    semaphores = {name: semaphore(size) for name, size in sizes.items()}
+    semaphores["memory"] = semaphore(memory_units)
+    semaphores["memory_units"] = memory_units
+    # Held while reserving memory, so two reservations can't each hold half the budget
+    semaphores["admission"] = lock()
+    return semaphores
+
+
+def make_limits(manager: SyncManager, config: dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Creates semaphores shared by processes, sized by limit_sizes.
+
+    :param SyncManager manager: Manager that owns the semaphores.
+    :param dict[str, Any] | None config: Loaded config.json, defaults to None.
+    :return dict[str, Any]: Semaphores by limit name, to pass to init_limits.
+    """
+    return _make(manager.Semaphore, manager.Lock, config)
+
+
+def init_limits(semaphores: dict[str, Any]) -> None:
+    """Makes limit() use semaphores in this process. Used as a pool initializer."""
+    _semaphores.clear()
+    _semaphores.update(semaphores)
+
+
+def ensure_limits(config: dict[str, Any] | None = None) -> None:
+    """Sets up limits for the threads of this process, unless limits are set up already."""
+    with _setup_lock:
+        if not _semaphores:
+            init_limits(_make(threading.Semaphore, threading.Lock, config))
+
+
+@contextmanager
+def limit(name: str, memory_mb: int = 0) -> Iterator[None]:
+    """
+    Holds a slot of the named limit, and memory_mb of the memory budget.
+
+    Does nothing if limits weren't set up in this process.
+
+    :param str name: Name of the limit, e.g. "network" or "converter".
+    :param int memory_mb: Memory the work is estimated to need, defaults to the
+        STAGE_MEMORY_MB of name. Work needing more than the whole budget runs alone.
+    """
+    semaphore = _semaphores.get(name)
+    if semaphore is None:
+        yield
+        return
+    memory_mb = memory_mb or STAGE_MEMORY_MB.get(name, 0)
+    units = min(math.ceil(memory_mb / MEMORY_UNIT_MB), _semaphores["memory_units"])
+    semaphore.acquire()
+    try:
+        with _semaphores["admission"]:
+            for _ in range(units):
+                _semaphores["memory"].acquire()
+        try:
+            yield
+        finally:
+            for _ in range(units):
+                _semaphores["memory"].release()
+    finally:
+        semaphore.release()
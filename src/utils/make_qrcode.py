@@ -2,6 +2,8 @@ from pathlib import Path
 
 import qrcode
 
+from src.utils.artifacts import atomic_path
+
 def make_qrcode(url: str, title: str, output_path: Path = Path("./")) -> Path:
     assert isinstance(output_path, Path)
 
@@ -16,5 +18,6 @@ def make_qrcode(url: str, title: str, output_path: Path = Path("./")) -> Path:
 
     img = qr.make_image(fill_color="black", back_color="white")
     path = output_path / Path(f"{title} QRCode.png")
-    img.save(str(path))
+    with atomic_path(path) as tmp_path:
+        img.save(str(tmp_path))
     return path
\ No newline at end of file
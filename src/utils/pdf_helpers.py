@@ -1,21 +1,203 @@
+from contextlib import AbstractContextManager, ExitStack, nullcontext
+from dataclasses import dataclass
 from pathlib import Path
 
-from pypdf import PdfWriter
+from pypdf import PdfReader, PdfWriter
+
+from src.add_footer_to_pdf import FooterStamper
+from src.utils.artifacts import artifact_lock, atomic_open, atomic_path
+from src.utils.limits import limit, merge_memory_mb
+from src.utils.pdf_index import PdfIndex
+from src.utils.pdf_splice import update_packet, write_manifest
+from src.utils.pdf_stream import StreamingPdfWriter, open_pdf
+
+
+@dataclass
+class MergeVariant:
+    """An output of mergePdfVariants and how it differs from the others."""
+
+    output_path: Path
+    merge_on_odd: bool = True
+    footer_text: str | None = None
+    image_dpi: int | None = None
+    keep_links: bool = True
 
 
 def mergePdfs(
-    pdf_paths: list[Path], output_path: Path, merge_on_odd: bool = True
+    pdf_paths: list[Path | PdfReader],
+    output_path: Path,
+    merge_on_odd: bool = True,
+    streaming: bool = False,
+    footer_text: str | None = None,
+    index: PdfIndex | None = None,
+    incremental: bool = False,
 ) -> Path:
+    """
+    Merges pdfs into one, optionally padding each to an even number of pages.
+
+    :param list[Path | PdfReader] pdf_paths: Pdfs to merge, in order. Falsy entries are
+        skipped. Pdfs that are merged into several outputs can be passed as readers, so
+        they are only parsed once.
+    :param Path output_path: Path to save the merged pdf to.
+    :param bool merge_on_odd: Add a blank page after a pdf that ends on an odd page,
+        so the next one starts on a new sheet, defaults to True.
+    :param bool streaming: Write pages out while merging, one input at a time, so peak
+        memory is bounded by the largest input rather than their total, defaults to False.
+    :param str | None footer_text: Footer to stamp on every page but the first two while
+        merging, with "{i}" (page) and "{n}" (total) fields. Requires streaming.
+    :param PdfIndex | None index: Index to take page counts from instead of parsing
+        the inputs, defaults to None.
+    :param bool incremental: If output_path was merged from the same pdfs before,
+        only replace the pages of the ones that changed (see pdf_splice), and record
+        a manifest for later updates otherwise. Requires streaming, defaults to False.
+    :return Path: output_path.
+    """
     assert isinstance(pdf_paths, list)
-    assert all([isinstance(path, Path) for path in pdf_paths])
+    assert all([isinstance(path, (Path, PdfReader)) for path in pdf_paths])
     assert isinstance(output_path, Path)
-    pdf_writer = PdfWriter()
+    assert footer_text is None or streaming, "footer_text requires streaming=True"
+    assert not incremental or streaming, "incremental requires streaming=True"
+    assert not incremental or all(
+        isinstance(path, Path) for path in pdf_paths
+    ), "incremental requires paths"
+    with limit("merge", memory_mb=merge_memory_mb(pdf_paths, streaming)):
+        return _mergePdfs(
+            pdf_paths, output_path, merge_on_odd, streaming, footer_text, index, incremental
+        )
+
+
+def _mergePdfs(
+    pdf_paths: list[Path | PdfReader],
+    output_path: Path,
+    merge_on_odd: bool,
+    streaming: bool,
+    footer_text: str | None,
+    index: PdfIndex | None,
+    incremental: bool,
+) -> Path:
+    # Held until the manifest is written, so it always describes the pdf next to it
+    with artifact_lock(output_path):
+        if incremental and update_packet(pdf_paths, output_path, merge_on_odd, footer_text, index):
+            return output_path
+        if streaming:
+            return _streamMergePdfs(
+                pdf_paths, output_path, merge_on_odd, footer_text, index, incremental
+            )
+        pdf_writer = PdfWriter()
+        for pdf in pdf_paths:
+            if not pdf:
+                continue
+            pdf_writer.append(pdf if isinstance(pdf, PdfReader) else str(pdf))
+            if merge_on_odd and len(pdf_writer.pages) % 2 == 1:
+                pdf_writer.add_blank_page()
+        with atomic_path(output_path) as tmp_path:
+            pdf_writer.write(str(tmp_path))
+        pdf_writer.close()
+        return output_path
+
+
+def mergePdfVariants(
+    pdf_paths: list[Path | PdfReader],
+    variants: list[MergeVariant],
+    index: PdfIndex | None = None,
+) -> list[Path]:
+    """
+    Merges the same pdfs into several differently configured outputs in one pass.
+
+    Every input is opened and parsed once and its pages are streamed to all outputs,
+    so writing a second variant costs little more than writing the first.
+
+    :param list[Path | PdfReader] pdf_paths: Pdfs to merge, in order. Falsy entries
+        are skipped.
+    :param list[MergeVariant] variants: Outputs to write, with their padding, footer,
+        image resolution and links.
+    :param PdfIndex | None index: Index to take page counts from, defaults to None.
+    :return list[Path]: Output paths, in the order of variants.
+    """
+    assert isinstance(pdf_paths, list)
+    assert all([isinstance(path, (Path, PdfReader)) for path in pdf_paths])
+    assert all([isinstance(variant, MergeVariant) for variant in variants])
+    with limit("merge", memory_mb=merge_memory_mb(pdf_paths, streaming=True)):
+        _streamMergeVariants(pdf_paths, variants, index)
+    return [variant.output_path for variant in variants]
+
+
+def countMergedPages(
+    pdf_paths: list[Path | PdfReader],
+    merge_on_odd: bool = True,
+    index: PdfIndex | None = None,
+) -> int:
+    """
+    Counts the pages mergePdfs will produce, without reading any page content.
+
+    :param list[Path | PdfReader] pdf_paths: Pdfs that will be merged. Falsy entries
+        are skipped.
+    :param bool merge_on_odd: Whether odd documents get padded, defaults to True.
+    :param PdfIndex | None index: Index to take page counts from, defaults to None.
+    :return int: Number of pages of the merged pdf.
+    """
+    num_pages = 0
     for pdf in pdf_paths:
         if not pdf:
             continue
-        pdf_writer.append(str(pdf))
-        if merge_on_odd and len(pdf_writer.pages) % 2 == 1:
-            pdf_writer.add_blank_page()
-    pdf_writer.write(str(output_path))
-    pdf_writer.close()
+        if isinstance(pdf, PdfReader):
+            num_pages += len(pdf.pages)
+        elif index is not None:
+            num_pages += index.get(pdf)["page_count"]
+        else:
+            with open_pdf(pdf) as reader:
+                num_pages += len(reader.pages)
+        if merge_on_odd and num_pages % 2 == 1:
+            num_pages += 1
+    return num_pages
+
+
+def _openPdf(pdf: Path | PdfReader) -> AbstractContextManager[PdfReader]:
+    return nullcontext(pdf) if isinstance(pdf, PdfReader) else open_pdf(pdf)
+
+
+def _streamMergePdfs(
+    pdf_paths: list[Path | PdfReader],
+    output_path: Path,
+    merge_on_odd: bool,
+    footer_text: str | None,
+    index: PdfIndex | None,
+    incremental: bool = False,
+) -> Path:
+    variant = MergeVariant(output_path, merge_on_odd=merge_on_odd, footer_text=footer_text)
+    ((pdf_writer, components),) = _streamMergeVariants(pdf_paths, [variant], index)
+    if incremental:
+        write_manifest(output_path, pdf_writer, components, footer_text, merge_on_odd, index)
     return output_path
+
+
+def _streamMergeVariants(
+    pdf_paths: list[Path | PdfReader], variants: list[MergeVariant], index: PdfIndex | None
+) -> list[tuple[StreamingPdfWriter, list[tuple[Path | PdfReader, int, int]]]]:
+    with ExitStack() as outputs:
+        writers = []
+        for variant in variants:
+            f = outputs.enter_context(atomic_open(variant.output_path))
+            pdf_writer = StreamingPdfWriter(
+                f, image_dpi=variant.image_dpi, keep_links=variant.keep_links
+            )
+            if variant.footer_text:
+                num_pages = countMergedPages(pdf_paths, variant.merge_on_odd, index)
+                pdf_writer.page_hook = FooterStamper(pdf_writer, num_pages, variant.footer_text)
+            writers.append((pdf_writer, []))
+
+        for pdf in pdf_paths:
+            if not pdf:
+                continue
+            # Parsed once, the reader's resolved objects are shared by all variants
+            with _openPdf(pdf) as reader:
+                for variant, (pdf_writer, components) in zip(variants, writers):
+                    start = pdf_writer.num_pages
+                    pdf_writer.append(reader)
+                    if variant.merge_on_odd and pdf_writer.num_pages % 2 == 1:
+                        pdf_writer.add_blank_page()
+                    components.append((pdf, start, pdf_writer.num_pages - start))
+
+        for pdf_writer, _ in writers:
+            pdf_writer.close()
+    return writers
@@ -0,0 +1,201 @@
+"""
+pdf_images.py
+Resampling of images embedded in pdfs.
+
+Images are resampled to the size they are drawn at, found by following the
+transformation matrix through the pages' content streams (like prepare_image does
+for docx images). Images that aren't drawn by a content stream are sized for a
+full page.
+
+Only plain 8-bit DeviceRGB and DeviceGray images (JPEG or flate compressed) are
+resampled. Images with other color spaces, bit depths or decode arrays are left
+as they are, since re-encoding them could change how they look.
+"""
+
+import io
+import math
+import zlib
+from collections.abc import Iterable
+
+from PIL import Image
+from pypdf import PageObject, PdfReader
+from pypdf.generic import (
+    ContentStream,
+    DictionaryObject,
+    EncodedStreamObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+# Longest side of a letter/A4 page in inches. An image can't be shown larger than
+# the page, so more pixels than this at the target dpi are never needed.
+MAX_PAGE_INCHES = 11.7
+JPEG_QUALITY = 80
+# Form XObjects nested deeper than this aren't searched for images.
+MAX_FORM_DEPTH = 4
+
+Matrix = tuple[float, float, float, float, float, float]
+IDENTITY: Matrix = (1, 0, 0, 1, 0, 0)
+
+COLOR_MODES = {"/DeviceRGB": "RGB", "/DeviceGray": "L"}
+LOSSLESS_FILTERS = ("/FlateDecode", "/ASCII85Decode", "/ASCIIHexDecode", "/LZWDecode")
+
+
+def _filters(image: StreamObject) -> list[str]:
+    filters = image.get("/Filter", [])
+    return [filters] if isinstance(filters, str) else list(filters)
+
+
+def _decode(image: StreamObject) -> Image.Image | None:
+    mode = COLOR_MODES.get(image.get("/ColorSpace"))
+    if (
+        mode is None
+        or image.get("/BitsPerComponent") != 8
+        or "/Decode" in image
+        or image.get("/ImageMask", False)
+    ):
+        return None
+    size = (int(image["/Width"]), int(image["/Height"]))
+    filters = _filters(image)
+    if filters[-1:] == ["/DCTDecode"]:
+        # pypdf passes JPEG data through, decoding only the filters before it
+        im = Image.open(io.BytesIO(image.get_data()))
+        return im if im.mode == mode else None
+    if all(f in LOSSLESS_FILTERS for f in filters):
+        return Image.frombytes(mode, size, image.get_data())
+    return None
+
+
+def _multiply(m: Matrix, n: Matrix) -> Matrix:
+    """Returns m concatenated with n, the CTM after "m cm" with n as the CTM."""
+    return (
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    )
+
+
+def _scan(
+    content: ContentStream,
+    resources: DictionaryObject,
+    ctm: Matrix,
+    sizes: dict[tuple[int, int], tuple[float, float]],
+    reader: PdfReader,
+    depth: int = 0,
+) -> None:
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else DictionaryObject()
+    saved: list[Matrix] = []
+    for operands, operator in content.operations:
+        if operator == b"q":
+            saved.append(ctm)
+        elif operator == b"Q" and saved:
+            ctm = saved.pop()
+        elif operator == b"cm" and len(operands) == 6:
+            ctm = _multiply(tuple(float(x) for x in operands), ctm)
+        elif operator == b"Do" and operands and operands[0] in xobjects:
+            ref = xobjects.raw_get(operands[0])
+            xobject = ref.get_object()
+            if not isinstance(xobject, StreamObject):
+                continue
+            if xobject.get("/Subtype") == "/Image" and isinstance(ref, IndirectObject):
+                # The image fills the unit square, so its size is the length of the axes
+                width = math.hypot(ctm[0], ctm[1]) / 72
+                height = math.hypot(ctm[2], ctm[3]) / 72
+                key = (ref.idnum, ref.generation)
+                placed = sizes.get(key, (0.0, 0.0))
+                sizes[key] = (max(placed[0], width), max(placed[1], height))
+            elif xobject.get("/Subtype") == "/Form" and depth < MAX_FORM_DEPTH:
+                matrix = tuple(float(x) for x in xobject.get("/Matrix", IDENTITY))
+                form_resources = xobject.get("/Resources")
+                _scan(
+                    ContentStream(xobject, reader),
+                    form_resources.get_object() if form_resources is not None else resources,
+                    _multiply(matrix, ctm),
+                    sizes,
+                    reader,
+                    depth + 1,
+                )
+
+
+def placed_image_sizes(pages: Iterable[PageObject]) -> dict[tuple[int, int], tuple[float, float]]:
+    """
+    Finds the largest size each image XObject is drawn at on pages.
+
+    :param Iterable[PageObject] pages: Pages to search, including form XObjects they draw.
+    :return dict: Width and height in inches, by (idnum, generation) of the image.
+    """
+    sizes: dict[tuple[int, int], tuple[float, float]] = {}
+    for page in pages:
+        try:
+            content = page.get_contents()
+            if content is None:
+                continue
+            resources = page.get("/Resources")
+            resources = resources.get_object() if resources is not None else DictionaryObject()
+            _scan(content, resources, IDENTITY, sizes, page.pdf)
+        except Exception:  # pages with broken content keep their images at full-page size
+            continue
+    return sizes
+
+
+def downsample_image(
+    image: StreamObject, dpi: int, placed_inches: tuple[float, float] | None = None
+) -> StreamObject:
+    """
+    Shrinks an image XObject so it has at most dpi pixels per inch of the size it is drawn at.
+
+    JPEG images are re-encoded as JPEG, others losslessly with flate.
+
+    :param StreamObject image: Image XObject, with its references already resolved
+        or remapped by the caller.
+    :param int dpi: Target resolution.
+    :param tuple[float, float] | None placed_inches: Largest width and height the image
+        is drawn at (see placed_image_sizes), defaults to None for a full page.
+    :return StreamObject: A resampled copy, or image itself if it is small enough
+        or can't be resampled safely.
+    """
+    width, height = int(image.get("/Width", 0)), int(image.get("/Height", 0))
+    if placed_inches is not None:
+        # Never upscaled, and at least a pixel in each direction
+        size = (
+            min(width, max(1, math.ceil(placed_inches[0] * dpi))),
+            min(height, max(1, math.ceil(placed_inches[1] * dpi))),
+        )
+    else:
+        max_pixels = round(dpi * MAX_PAGE_INCHES)
+        scale = min(1, max_pixels / max(width, height, 1))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if size == (width, height):
+        return image
+    try:
+        im = _decode(image)
+    except (OSError, ValueError):  # corrupt image data is left alone
+        return image
+    if im is None:
+        return image
+
+    im = im.resize(size, Image.LANCZOS)
+    if _filters(image)[-1:] == ["/DCTDecode"]:
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=JPEG_QUALITY)
+        data, image_filter = out.getvalue(), "/DCTDecode"
+    else:
+        data, image_filter = zlib.compress(im.tobytes()), "/FlateDecode"
+    if len(data) >= len(image._data):
+        return image
+
+    copy = EncodedStreamObject()
+    for key, value in image.items():
+        if key not in ("/DecodeParms", "/Length"):
+            copy[NameObject(key)] = value
+    copy[NameObject("/Filter")] = NameObject(image_filter)
+    copy[NameObject("/Width")] = NumberObject(im.width)
+    copy[NameObject("/Height")] = NumberObject(im.height)
+    copy._data = data
+    return copy
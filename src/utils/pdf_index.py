@@ -0,0 +1,184 @@
+"""
+pdf_index.py
+Persistent index of reading pdf metadata.
+
+Entries are keyed by the SHA-256 of the pdf, so they stay valid across runs,
+curricula and file names, and a changed reading is detected by its hash. A
+second table remembers the hash of each path by its size and modification time,
+so unchanged files aren't even re-hashed. Entries of files that were deleted or
+regenerated since are pruned when the index is saved.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Any
+
+from src.utils.artifacts import artifact_lock, atomic_write_text
+from src.utils.cache import get_cache_dir, hash_file
+from src.utils.pdf_stream import open_pdf
+
+INDEX_VERSION = 1
+
+
+def _read_metadata(pdf_path: Path) -> dict[str, Any]:
+    with open_pdf(pdf_path) as reader:
+        page_sizes = [
+            [round(float(page.mediabox.width), 2), round(float(page.mediabox.height), 2)]
+            for page in reader.pages
+        ]
+    return {
+        "page_count": len(page_sizes),
+        "page_sizes": page_sizes,
+        "byte_size": pdf_path.stat().st_size,
+    }
+
+
+class PdfIndex:
+    """
+    Metadata (page count, page sizes, byte size) of pdfs.
+
+    Usage:
+        index = PdfIndex(Path(".cache/pdf_index/index.json"))
+        index.get(Path("reading.pdf"))["page_count"]
+        index.save()
+    """
+
+    def __init__(self, index_path: Path) -> None:
+        assert isinstance(index_path, Path)
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.pdfs, self.paths = self._read()
+
+    def _read(self) -> tuple[dict[str, dict[str, Any]], dict[str, dict[str, Any]]]:
+        if self.index_path.exists():
+            try:
+                data = json.loads(self.index_path.read_text())
+            except ValueError:  # a corrupt index is rebuilt
+                data = {}
+            if data.get("version") == INDEX_VERSION:
+                return data["pdfs"], data["paths"]
+        return {}, {}
+
+    def hash(self, pdf_path: Path) -> str:
+        """
+        Returns the SHA-256 of a pdf, re-hashing it only if it changed on disk.
+
+        :param Path pdf_path: Pdf to hash.
+        :return str: Hex digest of the pdf.
+        """
+        stat = pdf_path.stat()
+        key = str(pdf_path.resolve())
+        with self.lock:
+            known = self.paths.get(key)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+        digest = hash_file(pdf_path)
+        with self.lock:
+            self.paths[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+            }
+            self.dirty = True
+        return digest
+
+    def get(self, pdf_path: Path) -> dict[str, Any]:
+        """
+        Returns the metadata of a pdf, parsing it only if it was never seen before.
+
+        :param Path pdf_path: Pdf to look up.
+        :return dict[str, Any]: sha256, page_count, page_sizes and byte_size.
+        """
+        assert isinstance(pdf_path, Path)
+        digest = self.hash(pdf_path)
+        with self.lock:
+            entry = self.pdfs.get(digest)
+        if entry is None:
+            entry = _read_metadata(pdf_path)
+            with self.lock:
+                self.pdfs[digest] = entry
+                self.dirty = True
+        return {"sha256": digest, **entry}
+
+    def has_changed(self, pdf_path: Path, previous_hash: str | None) -> bool:
+        """
+        Checks whether a pdf differs from the version with hash previous_hash.
+
+        :param Path pdf_path: Pdf to check.
+        :param str | None previous_hash: Hash recorded for it before.
+        :return bool: True if the pdf is missing, new or different.
+        """
+        if not pdf_path.exists():
+            return True
+        return previous_hash is None or self.hash(pdf_path) != previous_hash
+
+    def save(self) -> None:
+        """
+        Writes the index back to disk if anything was added.
+
+        Entries other processes saved in the meantime are kept. Paths that no longer
+        exist and pdfs no path has anymore (e.g. earlier versions of a regenerated
+        cover) are dropped.
+        """
+        with self.lock, artifact_lock(self.index_path):
+            if not self.dirty:
+                return
+            pdfs, paths = self._read()
+            self.paths = {
+                path: known
+                for path, known in {**paths, **self.paths}.items()
+                if Path(path).exists()
+            }
+            referenced = {known["sha256"] for known in self.paths.values()}
+            self.pdfs = {
+                digest: entry
+                for digest, entry in {**pdfs, **self.pdfs}.items()
+                if digest in referenced
+            }
+            atomic_write_text(
+                self.index_path,
+                json.dumps({"version": INDEX_VERSION, "pdfs": self.pdfs, "paths": self.paths}),
+            )
+            self.dirty = False
+
+
+_indexes: dict[Path, PdfIndex] = {}
+
+
+def get_pdf_index(config: dict[str, Any] | None = None) -> PdfIndex:
+    """
+    Returns the shared index stored in the cache directory of config.
+
+    :param dict[str, Any] | None config: Loaded config.json, defaults to None.
+    :return PdfIndex: The index, loaded once per process.
+    """
+    index_path = get_cache_dir("pdf_index", config) / "index.json"
+    if index_path not in _indexes:
+        _indexes[index_path] = PdfIndex(index_path)
+    return _indexes[index_path]
+
+
+def estimate_merged_size(
+    pdf_paths: list[Path], index: PdfIndex, merge_on_odd: bool = True
+) -> tuple[int, int]:
+    """
+    Estimates the size of merging pdfs from the index, without opening them.
+
+    :param list[Path] pdf_paths: Pdfs that will be merged. Falsy entries are skipped.
+    :param PdfIndex index: Index to look the pdfs up in.
+    :param bool merge_on_odd: Whether odd documents get padded, defaults to True.
+    :return tuple[int, int]: Number of pages and upper bound of the size in bytes.
+    """
+    num_pages = 0
+    num_bytes = 0
+    for pdf in pdf_paths:
+        if not pdf:
+            continue
+        entry = index.get(pdf)
+        num_pages += entry["page_count"]
+        num_bytes += entry["byte_size"]
+        if merge_on_odd and num_pages % 2 == 1:
+            num_pages += 1
+    return num_pages, num_bytes
@@ -0,0 +1,249 @@
+"""
+pdf_optimize.py
+Shrinks merged pdfs.
+
+Packets are merged from documents that each embed their own copy of the same
+logo, fonts and form XObjects. optimize_pdf rewrites a pdf so that identical
+objects are only stored once, uncompressed streams are flate-compressed and,
+if pikepdf is installed, objects are packed into object streams.
+
+linearize_pdf rewrites a pdf for "fast web view", so viewers can show the first
+page of a packet opened from a link before the rest has downloaded.
+"""
+
+import hashlib
+import logging
+import shutil
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    PdfObject,
+    StreamObject,
+)
+
+from src.utils.artifacts import atomic_path
+from src.utils.pdf_stream import StreamingPdfWriter, open_pdf
+
+try:
+    import pikepdf
+except ImportError:  # pikepdf is optional (the "pdf" extra), for object streams and linearizing
+    pikepdf = None
+
+logger = logging.getLogger("MopMan")
+
+# Objects that are tied to their place in the document and must never be merged.
+UNIQUE_TYPES = ("/Page", "/Pages", "/Catalog", "/Annot")
+# Deduplication is repeated so parents of merged objects can merge too.
+MAX_DEDUPE_PASSES = 5
+
+
+@dataclass
+class OptimizeReport:
+    input_bytes: int
+    output_bytes: int
+    deduplicated_objects: int
+    compressed_streams: int
+    object_streams: bool
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.input_bytes - self.output_bytes
+
+    def __str__(self) -> str:
+        return (
+            f"{self.input_bytes:,} -> {self.output_bytes:,} bytes "
+            f"({self.saved_bytes:,} saved, {self.deduplicated_objects} duplicate objects, "
+            f"{self.compressed_streams} streams compressed)"
+        )
+
+
+def _object_keys(reader: PdfReader) -> list[tuple[int, int]]:
+    keys = [(idnum, gen) for gen, entries in reader.xref.items() for idnum in entries]
+    keys += [(idnum, 0) for idnum in reader.xref_objStm]
+    return keys
+
+
+def _load(reader: PdfReader, key: tuple[int, int]) -> PdfObject | None:
+    try:
+        obj = reader.get_object(IndirectObject(key[0], key[1], reader))
+    except Exception:  # broken objects are left alone
+        obj = None
+    # Not kept in the reader's cache, so memory stays bounded by the largest object
+    reader.resolved_objects.pop((key[1], key[0]), None)
+    return obj
+
+
+def _group(obj: PdfObject | None) -> tuple[str, int] | None:
+    """Returns what an object must share with another to be a duplicate, None if it can't be."""
+    if isinstance(obj, StreamObject):
+        obj_type = str(obj.get("/Type", ""))
+        if obj_type in UNIQUE_TYPES:
+            return None
+        return obj_type, len(obj._data)
+    # Untyped dictionaries (e.g. /Link annotations) may belong to a single page
+    if isinstance(obj, DictionaryObject) and obj.get("/Type") not in (None, *UNIQUE_TYPES):
+        return str(obj["/Type"]), -1
+    return None
+
+
+def find_duplicates(reader: PdfReader) -> dict[tuple[int, int], tuple[int, int]]:
+    """
+    Finds objects of a pdf that are identical to another of its objects.
+
+    Two objects are identical if they serialize to the same bytes once references
+    to identical objects are treated as equal, so e.g. two copies of a font that
+    each point to their own (identical) font file are found as well. Candidates are
+    streams and typed dictionaries, grouped by type and stream length; only digests
+    are kept, objects are parsed again when compared.
+
+    :param PdfReader reader: Pdf to search.
+    :return dict: Maps the (idnum, generation) of each duplicate to the object kept.
+    """
+    groups: dict[tuple[str, int], list[tuple[int, int]]] = {}
+    for key in _object_keys(reader):
+        group = _group(_load(reader, key))
+        if group is not None:
+            groups.setdefault(group, []).append(key)
+    candidates = {
+        key: group for group, keys in groups.items() if len(keys) > 1 for key in keys
+    }
+    stream_digests: dict[tuple[int, int], bytes] = {}
+    aliases: dict[tuple[int, int], tuple[int, int]] = {}
+
+    def resolve(key: tuple[int, int]) -> tuple[int, int]:
+        while key in aliases:
+            key = aliases[key]
+        return key
+
+    def serialize(obj: PdfObject, out: list[bytes]) -> None:
+        if isinstance(obj, IndirectObject):
+            key = resolve((obj.idnum, obj.generation))
+            out.append(f"R{key[0]}.{key[1]}".encode())
+        elif isinstance(obj, DictionaryObject):
+            out.append(b"<<")
+            for k in sorted(obj):
+                out.append(k.encode())
+                serialize(obj.raw_get(k), out)
+            out.append(b">>")
+        elif isinstance(obj, ArrayObject):
+            out.append(b"[")
+            for value in obj:
+                serialize(value, out)
+            out.append(b"]")
+        else:
+            out.append(f"{type(obj).__name__}:{obj!r}".encode())
+
+    for _ in range(MAX_DEDUPE_PASSES):
+        seen: dict[tuple[tuple[str, int], bytes], tuple[int, int]] = {}
+        new_aliases = {}
+        for key, group in candidates.items():
+            if key in aliases:
+                continue
+            obj = _load(reader, key)
+            if isinstance(obj, StreamObject) and key not in stream_digests:
+                stream_digests[key] = hashlib.sha256(obj._data).digest()
+            out = [stream_digests.get(key, b"")]
+            serialize(obj, out)
+            digest = (group, hashlib.sha256(b"\0".join(out)).digest())
+            if digest in seen:
+                new_aliases[key] = seen[digest]
+            else:
+                seen[digest] = key
+        if not new_aliases:
+            break
+        aliases.update(new_aliases)
+    return {key: resolve(key) for key in aliases}
+
+
+def optimize_pdf(
+    input_path: Path, output_path: Path, object_streams: bool = False
+) -> OptimizeReport:
+    """
+    Rewrites a pdf with duplicate objects merged and its streams compressed.
+
+    input_path and output_path may be the same file, it is replaced at the end.
+
+    :param Path input_path: Pdf to optimize.
+    :param Path output_path: Path to save the optimized pdf to.
+    :param bool object_streams: Pack objects into compressed object streams. Needs
+        pikepdf, skipped with a warning if it isn't installed. Defaults to False.
+    :return OptimizeReport: Sizes before and after, and what was done.
+    """
+    assert isinstance(input_path, Path)
+    assert isinstance(output_path, Path)
+    input_bytes = input_path.stat().st_size
+    if object_streams and pikepdf is None:
+        logger.warning(
+            "pikepdf is not installed, writing without object streams. "
+            "Install the 'pdf' extra: pip install 'mopman-packetmaker[pdf]'"
+        )
+        object_streams = False
+
+    with atomic_path(output_path) as tmp_path:
+        with open_pdf(input_path) as reader, open(tmp_path, "wb") as f:
+            aliases = find_duplicates(reader)
+            writer = StreamingPdfWriter(f, compress=True)
+            writer.append(reader, aliases=aliases)
+            writer.close()
+        if object_streams:
+            with pikepdf.open(tmp_path, allow_overwriting_input=True) as pdf:
+                pdf.save(
+                    tmp_path,
+                    object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                    compress_streams=True,
+                )
+
+    return OptimizeReport(
+        input_bytes=input_bytes,
+        output_bytes=output_path.stat().st_size,
+        deduplicated_objects=len(aliases),
+        compressed_streams=writer.num_compressed,
+        object_streams=object_streams,
+    )
+
+
+def linearize_pdf(input_path: Path, output_path: Path) -> bool:
+    """
+    Rewrites a pdf linearized, with the first page and its hint table up front.
+
+    Uses pikepdf if it is installed, otherwise the qpdf command line tool. If neither
+    is available the pdf is left as is with a warning. input_path and output_path may
+    be the same file, it is replaced at the end.
+
+    :param Path input_path: Pdf to linearize.
+    :param Path output_path: Path to save the linearized pdf to.
+    :return bool: True if the pdf was linearized.
+    """
+    assert isinstance(input_path, Path)
+    assert isinstance(output_path, Path)
+    if pikepdf is None and not shutil.which("qpdf"):
+        logger.warning(
+            "Neither pikepdf nor qpdf is installed, writing without linearization. "
+            "Install the 'pdf' extra: pip install 'mopman-packetmaker[pdf]'"
+        )
+        return False
+
+    try:
+        with atomic_path(output_path) as tmp_path:
+            if pikepdf is not None:
+                with pikepdf.open(input_path) as pdf:
+                    pdf.save(tmp_path, linearize=True)
+            else:
+                result = subprocess.run(
+                    ["qpdf", "--linearize", str(input_path), str(tmp_path)], capture_output=True
+                )
+                # qpdf exits with 3 when it succeeded with warnings
+                if result.returncode not in (0, 3):
+                    raise subprocess.CalledProcessError(
+                        result.returncode, result.args, stderr=result.stderr
+                    )
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"qpdf could not linearize {input_path}: {e.stderr.decode()}")
+        return False
+    return True
@@ -0,0 +1,178 @@
+"""
+pdf_splice.py
+Incremental updates of merged packets.
+
+A streaming merge records in a manifest next to the packet which page slots each
+component (cover, reading, ...) occupies and the object numbers of those pages.
+When components change later but still fill the same number of slots, their
+pages are replaced by appending a pdf incremental update, so the static readings
+are neither re-read nor re-written and no other footer changes.
+
+Limitations:
+- If a changed component fills a different number of slots, the page numbers of
+  every later page shift. Their footers are not re-stamped in place; the packet is
+  merged again in full instead.
+- The update is appended to a copy of the packet that then replaces it, so readers
+  never see a half-written pdf. The copy costs a full read and write of the file.
+"""
+
+import json
+import shutil
+from pathlib import Path
+from typing import Any
+
+from src.add_footer_to_pdf import FooterStamper
+from src.utils.artifacts import artifact_lock, atomic_path, atomic_write_text
+from src.utils.cache import hash_file
+from src.utils.pdf_index import PdfIndex
+from src.utils.pdf_stream import PdfUpdateWriter, StreamingPdfWriter, open_pdf
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(pdf_path: Path) -> Path:
+    """Returns where the manifest of a merged pdf is stored."""
+    return pdf_path.with_name(pdf_path.name + ".manifest.json")
+
+
+def _hash(pdf_path: Path, index: PdfIndex | None) -> str:
+    return index.hash(pdf_path) if index is not None else hash_file(pdf_path)
+
+
+def _page_count(pdf_path: Path, index: PdfIndex | None) -> int:
+    if index is not None:
+        return index.get(pdf_path)["page_count"]
+    with open_pdf(pdf_path) as reader:
+        return len(reader.pages)
+
+
+def write_manifest(
+    output_path: Path,
+    writer: StreamingPdfWriter,
+    components: list[tuple[Path, int, int]],
+    footer_text: str | None,
+    merge_on_odd: bool,
+    index: PdfIndex | None = None,
+) -> Path:
+    """
+    Records the layout of a pdf that was just written by writer.
+
+    :param Path output_path: The merged pdf, already closed.
+    :param StreamingPdfWriter writer: Writer that wrote it.
+    :param list[tuple[Path, int, int]] components: Path, first page index and number
+        of page slots (padding included) of each merged pdf.
+    :param str | None footer_text: Footer that was stamped, if any.
+    :param bool merge_on_odd: Whether odd components were padded.
+    :param PdfIndex | None index: Index to hash the components with, defaults to None.
+    :return Path: Path of the manifest.
+    """
+    stat = output_path.stat()
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "footer_text": footer_text,
+        "merge_on_odd": merge_on_odd,
+        "page_nums": writer.page_nums,
+        "next_num": writer.next_num,
+        "startxref": writer.xref_offset,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "components": [
+            {"path": str(path), "sha256": _hash(path, index), "start": start, "span": span}
+            for path, start, span in components
+        ],
+    }
+    return atomic_write_text(manifest_path(output_path), json.dumps(manifest))
+
+
+def _load_manifest(output_path: Path) -> dict[str, Any] | None:
+    path = manifest_path(output_path)
+    if not path.exists() or not output_path.exists():
+        return None
+    try:
+        manifest = json.loads(path.read_text())
+    except ValueError:
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    # Something else (optimize, a legacy merge, ...) rewrote the pdf since
+    stat = output_path.stat()
+    if stat.st_size != manifest["size"] or stat.st_mtime_ns != manifest["mtime_ns"]:
+        return None
+    return manifest
+
+
+def update_packet(
+    pdf_paths: list[Path],
+    output_path: Path,
+    merge_on_odd: bool = True,
+    footer_text: str | None = None,
+    index: PdfIndex | None = None,
+) -> bool:
+    """
+    Brings a merged pdf up to date by replacing only the pages of changed components.
+
+    Only possible if the pdf and its manifest were written by a streaming merge of the
+    same components, and every changed component still fills as many page slots.
+
+    :param list[Path] pdf_paths: Pdfs that make up the merged pdf. Falsy entries are skipped.
+    :param Path output_path: The merged pdf to update.
+    :param bool merge_on_odd: Whether odd components are padded, defaults to True.
+    :param str | None footer_text: Footer stamped on the pages, defaults to None.
+    :param PdfIndex | None index: Index to hash and count pages with, defaults to None.
+    :return bool: True if the pdf is up to date, False if it has to be merged again.
+    """
+    manifest = _load_manifest(output_path)
+    pdf_paths = [pdf for pdf in pdf_paths if pdf]
+    if (
+        manifest is None
+        or manifest["footer_text"] != footer_text
+        or manifest["merge_on_odd"] != merge_on_odd
+        or [c["path"] for c in manifest["components"]] != [str(pdf) for pdf in pdf_paths]
+        or not all(pdf.exists() for pdf in pdf_paths)
+    ):
+        return False
+
+    changed = []
+    for pdf, component in zip(pdf_paths, manifest["components"]):
+        digest = _hash(pdf, index)
+        if digest == component["sha256"]:
+            continue
+        num_pages = _page_count(pdf, index)
+        padded = merge_on_odd and (component["start"] + num_pages) % 2 == 1
+        if num_pages + padded != component["span"]:
+            return False
+        changed.append((pdf, component, digest, padded))
+    if not changed:
+        return True
+
+    with artifact_lock(output_path):
+        # The update is appended to a copy, so readers never see a half-appended pdf.
+        # Copying is still far cheaper than merging again.
+        with atomic_path(output_path) as tmp_path:
+            shutil.copyfile(output_path, tmp_path)
+            with open(tmp_path, "r+b") as f:
+                writer = PdfUpdateWriter(
+                    f, manifest["page_nums"], manifest["next_num"], manifest["startxref"]
+                )
+                if footer_text:
+                    writer.page_hook = FooterStamper(
+                        writer, len(manifest["page_nums"]), footer_text
+                    )
+                for pdf, component, digest, padded in changed:
+                    writer.seek_page(component["start"])
+                    with open_pdf(pdf) as reader:
+                        writer.append(reader)
+                    if padded:
+                        writer.add_blank_page()
+                    component["sha256"] = digest
+                writer.close()
+
+        stat = output_path.stat()
+        manifest.update(
+            next_num=writer.next_num,
+            startxref=writer.xref_offset,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+        )
+        atomic_write_text(manifest_path(output_path), json.dumps(manifest))
+    return True
@@ -0,0 +1,423 @@
+"""
+pdf_stream.py
+Memory-bounded PDF writing.
+
+pypdf's PdfWriter keeps every object of every appended document in memory until
+write() is called. StreamingPdfWriter instead copies the pages of one input at a
+time and writes their objects out immediately, keeping only the page list and
+the xref offsets in memory. Peak memory is bounded by the largest single input.
+
+Outlines, forms and other document-level structures of the inputs are not
+carried over, only pages and everything they reference.
+"""
+
+import mmap
+import os
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    ContentStream,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    PdfObject,
+    StreamObject,
+)
+
+from src.utils.pdf_images import downsample_image, placed_image_sizes
+
+CATALOG_NUM = 1
+PAGES_NUM = 2
+
+
+def number(value: float) -> NumberObject | FloatObject:
+    """Wraps a number as the most compact pdf number object."""
+    return NumberObject(int(value)) if float(value).is_integer() else FloatObject(value)
+
+
+def _is_page_tree_node(obj: PdfObject) -> bool:
+    return isinstance(obj, DictionaryObject) and obj.get("/Type") in ("/Page", "/Pages")
+
+
+class OutputRef(IndirectObject):
+    """A reference that is already numbered in the output and must not be remapped."""
+
+    def __init__(self, idnum: int) -> None:
+        super().__init__(idnum, 0, None)
+
+
+# Called with the 1-based output page number, the page dictionary (already
+# remapped to output references) and its media box (left, bottom, right, top)
+# right before the page is written. The page's /Resources, /Font and /XObject
+# dictionaries are direct objects, so the hook can add resources to them, and
+# its /Contents is a direct array of content stream references.
+PageHook = Callable[[int, DictionaryObject, tuple[float, float, float, float]], None]
+
+
+@contextmanager
+def open_pdf(pdf_path: Path) -> Iterator[PdfReader]:
+    """
+    Opens a pdf for reading, memory-mapped when possible.
+
+    :param Path pdf_path: Pdf to open.
+    :yield PdfReader: Reader over the memory-mapped file.
+    """
+    with open(pdf_path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):  # empty files and special files can't be mapped
+            yield PdfReader(f)
+            return
+        try:
+            yield PdfReader(data)
+        finally:
+            data.close()
+
+
+class StreamingPdfWriter:
+    """
+    Writes a pdf incrementally, one copied object at a time.
+
+    Usage:
+        with open(output_path, "wb") as f:
+            writer = StreamingPdfWriter(f)
+            writer.append(reader)
+            writer.add_blank_page()
+            writer.close()
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        page_hook: PageHook | None = None,
+        compress: bool = False,
+        image_dpi: int | None = None,
+        keep_links: bool = True,
+    ) -> None:
+        """
+        :param BinaryIO stream: Binary stream to write the pdf to.
+        :param PageHook | None page_hook: Called on every page before it is written.
+        :param bool compress: Flate-compress streams that have no filter, defaults to False.
+        :param int | None image_dpi: Downsample images to this resolution (see
+            pdf_images.downsample_image), defaults to None (keep them as they are).
+        :param bool keep_links: Copy link annotations, defaults to True.
+        """
+        self.stream = stream
+        self.page_hook = page_hook
+        self.compress = compress
+        self.image_dpi = image_dpi
+        self.keep_links = keep_links
+        self.num_compressed = 0
+        self.offsets: dict[int, int] = {}
+        self.page_nums: list[int] = []
+        self.next_num = PAGES_NUM + 1
+        self.last_page_size: tuple[float, float] | None = None
+        self.xref_offset: int | None = None
+        self._start()
+
+    def _start(self) -> None:
+        self.stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def num_pages(self) -> int:
+        return len(self.page_nums)
+
+    def reserve(self) -> int:
+        """Reserves an object number in the output."""
+        num = self.next_num
+        self.next_num += 1
+        return num
+
+    def _next_page(self) -> tuple[int, int]:
+        """Returns the 1-based page number and the object number of the next page."""
+        num = self.reserve()
+        self.page_nums.append(num)
+        return len(self.page_nums), num
+
+    def write_object(self, num: int, obj: PdfObject) -> OutputRef:
+        """Writes obj to the output as object num."""
+        if self.compress and isinstance(obj, StreamObject) and "/Filter" not in obj:
+            obj = obj.flate_encode()
+            self.num_compressed += 1
+        self.offsets[num] = self.stream.tell()
+        self.stream.write(f"{num} 0 obj\n".encode())
+        obj.write_to_stream(self.stream)
+        self.stream.write(b"\nendobj\n")
+        return OutputRef(num)
+
+    def add_object(self, obj: PdfObject) -> OutputRef:
+        """Writes obj to the output under a new object number."""
+        return self.write_object(self.reserve(), obj)
+
+    def append(
+        self,
+        reader: PdfReader,
+        pages: range | None = None,
+        aliases: dict[tuple[int, int], tuple[int, int]] | None = None,
+    ) -> None:
+        """
+        Copies the pages of reader (and everything they reference) to the output.
+
+        :param PdfReader reader: Document to copy pages from.
+        :param range | None pages: Indices of the pages to copy, defaults to all of them.
+        :param dict | None aliases: Maps (idnum, generation) of objects in reader to an
+            identical object to copy instead, so duplicates are only written once.
+        """
+        ref_map: dict[tuple[int, int], int] = {}
+        queue: deque[IndirectObject] = deque()
+        aliases = aliases or {}
+
+        def out_ref(ref: IndirectObject) -> OutputRef:
+            key = (ref.idnum, ref.generation)
+            key = aliases.get(key, key)
+            if key not in ref_map:
+                ref_map[key] = self.reserve()
+                queue.append(IndirectObject(key[0], key[1], reader))
+            return OutputRef(ref_map[key])
+
+        def remap(obj: PdfObject) -> PdfObject:
+            if isinstance(obj, OutputRef):
+                return obj
+            if isinstance(obj, IndirectObject):
+                return out_ref(obj)
+            if isinstance(obj, StreamObject):
+                if isinstance(obj, ContentStream):
+                    copy = DecodedStreamObject()
+                    copy.set_data(obj.get_data())
+                    items = [(k, v) for k, v in obj.items() if k not in ("/Filter", "/DecodeParms")]
+                else:
+                    copy = obj.__class__()
+                    copy._data = obj._data
+                    items = obj.items()
+                for key, value in items:
+                    copy[key] = remap(value)
+                return copy
+            if isinstance(obj, DictionaryObject):
+                copy = DictionaryObject()
+                for key, value in obj.items():
+                    copy[key] = remap(value)
+                return copy
+            if isinstance(obj, ArrayObject):
+                return ArrayObject(remap(value) for value in obj)
+            return obj
+
+        page_indices = pages if pages is not None else range(len(reader.pages))
+        page_objects = [reader.pages[i] for i in page_indices]
+        # Images shared by several pages are written after the first, so every page is
+        # measured up front
+        placed = placed_image_sizes(page_objects) if self.image_dpi else {}
+        # Number the pages first, so links between them point at the copied pages.
+        page_slots = []
+        for page in page_objects:
+            ref = page.indirect_reference
+            page_number, num = self._next_page()
+            if ref is not None:
+                ref_map[(ref.idnum, ref.generation)] = num
+            page_slots.append((page_number, num))
+
+        def inline(obj: PdfObject) -> DictionaryObject:
+            obj = obj.get_object() if obj is not None else None
+            return DictionaryObject(obj) if isinstance(obj, DictionaryObject) else DictionaryObject()
+
+        for page, (page_number, num) in zip(page_objects, page_slots):
+            page_copy = DictionaryObject()
+            for key, value in page.items():
+                if key == "/Annots" and not self.keep_links:
+                    value = ArrayObject(
+                        annot
+                        for annot in value.get_object()
+                        if annot.get_object().get("/Subtype") != "/Link"
+                    )
+                if key == "/Parent" or (key == "/Contents" and self.page_hook):
+                    continue
+                page_copy[key] = remap(value)
+            if self.page_hook:
+                # Copy the resource dictionaries into the page so the hook can extend them
+                resources = inline(page.get("/Resources"))
+                for key in ("/Font", "/XObject"):
+                    if key in resources:
+                        resources[NameObject(key)] = inline(resources[key])
+                page_copy[NameObject("/Resources")] = remap(resources)
+                # ... and give it an array of content stream references to extend
+                contents = page.raw_get("/Contents") if "/Contents" in page else None
+                resolved = contents.get_object() if contents is not None else None
+                if isinstance(resolved, ArrayObject):
+                    page_copy[NameObject("/Contents")] = remap(ArrayObject(resolved))
+                elif isinstance(resolved, StreamObject):
+                    if not isinstance(contents, IndirectObject):
+                        contents = self.add_object(remap(contents))
+                    page_copy[NameObject("/Contents")] = ArrayObject([remap(contents)])
+                else:
+                    page_copy[NameObject("/Contents")] = ArrayObject()
+            box = page.mediabox
+            self._write_page(
+                page_number,
+                num,
+                page_copy,
+                (float(box.left), float(box.bottom), float(box.right), float(box.top)),
+            )
+            while queue:
+                ref = queue.popleft()
+                obj = ref.get_object()
+                if obj is None or _is_page_tree_node(obj):
+                    # Pages that weren't copied (and the source page tree) are dropped
+                    obj = NullObject()
+                obj = remap(obj)
+                if (
+                    self.image_dpi
+                    and isinstance(obj, StreamObject)
+                    and obj.get("/Subtype") == "/Image"
+                ):
+                    obj = downsample_image(
+                        obj, self.image_dpi, placed.get((ref.idnum, ref.generation))
+                    )
+                self.write_object(ref_map[(ref.idnum, ref.generation)], obj)
+
+    def add_blank_page(
+        self, width: float | None = None, height: float | None = None
+    ) -> None:
+        """Adds a blank page, the size of the last page unless given."""
+        if width is None or height is None:
+            width, height = self.last_page_size or (612, 792)
+        page = DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Page"),
+                NameObject("/MediaBox"): ArrayObject(
+                    [NumberObject(0), NumberObject(0), number(width), number(height)]
+                ),
+                NameObject("/Resources"): DictionaryObject(),
+            }
+        )
+        page_number, num = self._next_page()
+        self._write_page(page_number, num, page, (0, 0, width, height))
+
+    def _write_page(
+        self,
+        page_number: int,
+        num: int,
+        page: DictionaryObject,
+        box: tuple[float, float, float, float],
+    ) -> None:
+        page[NameObject("/Parent")] = OutputRef(PAGES_NUM)
+        self.last_page_size = (box[2] - box[0], box[3] - box[1])
+        if self.page_hook:
+            self.page_hook(page_number, page, box)
+        self.write_object(num, page)
+
+    def close(self) -> None:
+        """Writes the page tree, catalog, xref table and trailer."""
+        self.write_object(
+            PAGES_NUM,
+            DictionaryObject(
+                {
+                    NameObject("/Type"): NameObject("/Pages"),
+                    NameObject("/Kids"): ArrayObject(OutputRef(num) for num in self.page_nums),
+                    NameObject("/Count"): NumberObject(len(self.page_nums)),
+                }
+            ),
+        )
+        self.write_object(
+            CATALOG_NUM,
+            DictionaryObject(
+                {
+                    NameObject("/Type"): NameObject("/Catalog"),
+                    NameObject("/Pages"): OutputRef(PAGES_NUM),
+                }
+            ),
+        )
+        xref_offset = self.xref_offset = self.stream.tell()
+        self.stream.write(f"xref\n0 {self.next_num}\n".encode())
+        self.stream.write(b"0000000000 65535 f\r\n")
+        for num in range(1, self.next_num):
+            if num in self.offsets:
+                self.stream.write(f"{self.offsets[num]:010d} 00000 n\r\n".encode())
+            else:
+                self.stream.write(b"0000000000 00000 f\r\n")
+        self.stream.write(
+            f"trailer\n<< /Size {self.next_num} /Root {CATALOG_NUM} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+
+class PdfUpdateWriter(StreamingPdfWriter):
+    """
+    Appends an incremental update to a pdf written by StreamingPdfWriter.
+
+    Pages are replaced in place: the new pages are written under the object numbers
+    of the pages they replace, so the page tree and every page before and after
+    them stay untouched. Only the objects of the update are appended, followed by
+    an xref section pointing back to the previous one.
+
+    Usage:
+        with open(pdf_path, "r+b") as f:
+            writer = PdfUpdateWriter(f, page_nums, next_num, prev_xref)
+            writer.seek_page(10)
+            writer.append(reader)
+            writer.close()
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        page_nums: list[int],
+        next_num: int,
+        prev_xref: int,
+        page_hook: PageHook | None = None,
+        compress: bool = False,
+    ) -> None:
+        """
+        :param BinaryIO stream: The pdf to update, opened for reading and writing.
+        :param list[int] page_nums: Object numbers of the pages of the pdf, in order.
+        :param int next_num: First object number not used by the pdf yet.
+        :param int prev_xref: Offset of the pdf's last xref section.
+        :param PageHook | None page_hook: Called on every page before it is written.
+        :param bool compress: Flate-compress streams that have no filter, defaults to False.
+        """
+        super().__init__(stream, page_hook, compress)
+        self.page_nums = list(page_nums)
+        self.next_num = next_num
+        self.prev_xref = prev_xref
+        self.cursor = 0
+
+    def _start(self) -> None:
+        self.stream.seek(0, os.SEEK_END)
+
+    def seek_page(self, index: int) -> None:
+        """Makes the next page written replace the page at index (0-based)."""
+        assert 0 <= index < len(self.page_nums)
+        self.cursor = index
+
+    def _next_page(self) -> tuple[int, int]:
+        assert self.cursor < len(self.page_nums), "updates can't add pages"
+        num = self.page_nums[self.cursor]
+        self.cursor += 1
+        return self.cursor, num
+
+    def close(self) -> None:
+        """Writes the xref section of the update and its trailer."""
+        self.xref_offset = self.stream.tell()
+        self.stream.write(b"xref\n")
+        nums = sorted(self.offsets)
+        start = 0
+        while start < len(nums):
+            end = start
+            while end + 1 < len(nums) and nums[end + 1] == nums[end] + 1:
+                end += 1
+            self.stream.write(f"{nums[start]} {end - start + 1}\n".encode())
+            for num in nums[start : end + 1]:
+                self.stream.write(f"{self.offsets[num]:010d} 00000 n\r\n".encode())
+            start = end + 1
+        self.stream.write(
+            f"trailer\n<< /Size {self.next_num} /Root {CATALOG_NUM} 0 R /Prev {self.prev_xref} >>\n"
+            f"startxref\n{self.xref_offset}\n%%EOF\n".encode()
+        )
@@ -0,0 +1,94 @@
+from pathlib import Path
+
+from PIL import Image
+
+from src.utils.artifacts import atomic_path
+from src.utils.cache import hash_file
+
+DEFAULT_DPI = 300
+JPEG_QUALITY = 85
+# Images with at most this many colors are line art (logos, QR codes) and stay PNG.
+MAX_PALETTE_COLORS = 256
+
+
+def _target_size(
+    im: Image.Image, width_in: float, height_in: float | None, dpi: int
+) -> tuple[int, int]:
+    """
+    Computes the pixel size an image needs to be printed at dpi.
+
+    The aspect ratio is kept and images are never upscaled.
+
+    :param Image.Image im: Image to resize.
+    :param float width_in: Width the image is placed at, in inches.
+    :param float | None height_in: Height the image is placed at, in inches.
+    :param int dpi: Target resolution.
+    :return tuple[int, int]: New (width, height) in pixels.
+    """
+    max_width = max(1, round(width_in * dpi))
+    max_height = max(1, round(height_in * dpi)) if height_in else im.height
+    scale = min(max_width / im.width, max_height / im.height, 1.0)
+    return max(1, round(im.width * scale)), max(1, round(im.height * scale))
+
+
+def _is_line_art(im: Image.Image) -> bool:
+    if im.mode in ("1", "P", "RGBA", "LA", "PA") or "transparency" in im.info:
+        return True
+    return im.getcolors(maxcolors=MAX_PALETTE_COLORS) is not None
+
+
+def prepare_image(
+    image_path: Path,
+    width_in: float,
+    height_in: float | None = None,
+    dpi: int = DEFAULT_DPI,
+    cache_dir: Path = Path(".cache/images"),
+) -> Path:
+    """
+    Resamples an image to the size it is embedded at and caches the result.
+
+    Photos are re-encoded as JPEG. Line art, QR codes and images with
+    transparency stay PNG, and two-tone images are resampled without smoothing
+    so QR codes stay sharp. Results are cached by content hash, size and dpi,
+    so the same logo is only prepared once across documents and runs.
+
+    :param Path image_path: Image to prepare.
+    :param float width_in: Width the image is placed at, in inches.
+    :param float | None height_in: Height the image is placed at, in inches, defaults to None.
+    :param int dpi: Target resolution, defaults to DEFAULT_DPI.
+    :param Path cache_dir: Directory to cache prepared images in.
+    :return Path: Path to the prepared image, or image_path if it could not be prepared.
+    """
+    assert isinstance(image_path, Path)
+    assert isinstance(cache_dir, Path)
+    key = f"{hash_file(image_path)[:32]}_{width_in:.3f}x{height_in or 0:.3f}_{dpi}"
+    for cached_path in (cache_dir / f"{key}.png", cache_dir / f"{key}.jpg"):
+        if cached_path.exists():
+            return cached_path
+
+    try:
+        with Image.open(image_path) as im:
+            im.load()
+            line_art = _is_line_art(im)
+            size = _target_size(im, width_in, height_in, dpi)
+            if im.mode == "1" or (im.mode == "L" and im.getcolors(maxcolors=2)):
+                resample = Image.Resampling.NEAREST
+            else:
+                resample = Image.Resampling.LANCZOS
+            if im.mode not in ("1", "L", "RGB", "RGBA"):
+                im = im.convert("RGBA" if line_art else "RGB")
+            if size != im.size:
+                im = im.resize(size, resample)
+
+            if line_art:
+                prepared_path = cache_dir / f"{key}.png"
+                with atomic_path(prepared_path) as tmp_path:
+                    im.save(tmp_path, optimize=True)
+            else:
+                prepared_path = cache_dir / f"{key}.jpg"
+                with atomic_path(prepared_path) as tmp_path:
+                    im.save(tmp_path, quality=JPEG_QUALITY, optimize=True)
+    except (OSError, ValueError) as e:
+        print(f"Could not prepare {image_path}: {e}")
+        return image_path
+    return prepared_path
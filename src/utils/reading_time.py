@@ -0,0 +1,155 @@
+"""
+reading_time.py
+Estimates how long readings take to read.
+
+Text is extracted from each pdf in a process pool, and words and figures are
+counted. Results are cached by the pdf's content hash, so only new or changed
+readings are ever extracted again. Pdfs without a text layer on their first
+pages (scans) are estimated from their page count instead.
+"""
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from pypdf.generic import DictionaryObject
+
+from src.utils.artifacts import atomic_write_text
+from src.utils.cache import get_cache_dir
+from src.utils.pdf_index import get_pdf_index
+from src.utils.pdf_stream import open_pdf
+
+# Pages checked for a text layer before a pdf is considered scanned.
+TEXT_CHECK_PAGES = 3
+WORDS_PER_MINUTE = 200
+MINUTES_PER_FIGURE = 1.0
+MINUTES_PER_SCANNED_PAGE = 4.0
+# Placeholder used when a reading has no pdf to estimate from.
+DEFAULT_READING_TIME = 30
+
+
+def _count_figures(page: DictionaryObject) -> int:
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if not xobjects:
+        return 0
+    return sum(
+        1
+        for xobject in xobjects.get_object().values()
+        if xobject.get_object().get("/Subtype") == "/Image"
+    )
+
+
+def analyze_pdf(pdf_path: Path) -> dict[str, Any]:
+    """
+    Counts the words and figures of a pdf, and checks whether it has a text layer.
+
+    :param Path pdf_path: Pdf to analyze.
+    :return dict[str, Any]: Number of pages, words and figures, and text_extractable,
+        whether any of the first TEXT_CHECK_PAGES pages has text.
+    """
+    words = figures = 0
+    text_extractable = False
+    with open_pdf(pdf_path) as reader:
+        for i, page in enumerate(reader.pages):
+            try:
+                page_words = len(page.extract_text().split())
+            except Exception:  # a broken text layer counts as no text
+                page_words = 0
+            words += page_words
+            text_extractable |= i < TEXT_CHECK_PAGES and page_words > 0
+            figures += _count_figures(page)
+        return {
+            "pages": len(reader.pages),
+            "words": words,
+            "figures": figures,
+            "text_extractable": text_extractable,
+        }
+
+
+def reading_minutes(stats: dict[str, Any], config: dict[str, Any] | None = None) -> int:
+    """
+    Converts the counts of analyze_pdf into minutes, using the rates in config.
+
+    :param dict[str, Any] stats: Pages, words and figures (and whether the pdf has text).
+    :param dict[str, Any] | None config: Loaded config.json, defaults to None.
+    :return int: Estimated reading time in whole minutes, at least 1.
+    """
+    rates = (config or {}).get("reading_time", {})
+    words_per_minute = rates.get("words_per_minute", WORDS_PER_MINUTE)
+    minutes_per_figure = rates.get("minutes_per_figure", MINUTES_PER_FIGURE)
+    minutes_per_scanned_page = rates.get("minutes_per_scanned_page", MINUTES_PER_SCANNED_PAGE)
+    if not stats.get("text_extractable", True):
+        minutes = stats["pages"] * minutes_per_scanned_page
+    else:
+        minutes = stats["words"] / words_per_minute + stats["figures"] * minutes_per_figure
+    return max(1, round(minutes))
+
+
+def estimate_reading_times(
+    pdf_paths: list[Path], config: dict[str, Any] | None = None, max_workers: int | None = None
+) -> list[dict[str, Any]]:
+    """
+    Estimates the reading time of pdfs, extracting only those not seen before.
+
+    :param list[Path] pdf_paths: Pdfs to estimate.
+    :param dict[str, Any] | None config: Loaded config.json, defaults to None.
+    :param int | None max_workers: Processes to extract text with, defaults to one per CPU.
+    :return list[dict[str, Any]]: Pages, words, figures, figures_per_page and minutes
+        of each pdf, in order.
+    """
+    assert all([isinstance(path, Path) for path in pdf_paths])
+    index = get_pdf_index(config)
+    cache_dir = get_cache_dir("reading_time", config)
+
+    stats: dict[str, dict[str, Any]] = {}
+    missing: dict[str, Path] = {}
+    digests = [index.hash(pdf) for pdf in pdf_paths]
+    for pdf, digest in zip(pdf_paths, digests):
+        cache_path = cache_dir / f"{digest}.json"
+        if digest in stats or digest in missing:
+            continue
+        cached = json.loads(cache_path.read_text()) if cache_path.exists() else {}
+        # Entries cached before text layers were checked are analyzed again
+        if "text_extractable" in cached:
+            stats[digest] = cached
+        else:
+            missing[digest] = pdf
+
+    if len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(analyze_pdf, missing.values())
+            stats.update(zip(missing, results))
+    else:
+        stats.update((digest, analyze_pdf(pdf)) for digest, pdf in missing.items())
+    for digest in missing:
+        atomic_write_text(cache_dir / f"{digest}.json", json.dumps(stats[digest]))
+    index.save()
+
+    estimates = []
+    for digest in digests:
+        pdf_stats = stats[digest]
+        estimates.append(
+            {
+                **pdf_stats,
+                "figures_per_page": round(pdf_stats["figures"] / max(1, pdf_stats["pages"]), 2),
+                "minutes": reading_minutes(pdf_stats, config),
+            }
+        )
+    return estimates
+
+
+def add_reading_times(precontext: dict[str, Any], config: dict[str, Any] | None = None) -> None:
+    """
+    Adds "reading_time_min" to every core reading with a trimmed pdf, and the total
+    as "total_reading_time_min", for templates and the progress bar.
+
+    :param dict[str, Any] precontext: Precontext to update in place.
+    :param dict[str, Any] | None config: Loaded config.json, defaults to None.
+    """
+    readings = [r for r in precontext["core_readings"] if r.get("trimmed_pdf")]
+    estimates = estimate_reading_times([Path(r["trimmed_pdf"]) for r in readings], config)
+    for reading, estimate in zip(readings, estimates):
+        reading["reading_time_min"] = estimate["minutes"]
+    precontext["total_reading_time_min"] = sum(estimate["minutes"] for estimate in estimates)
@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+import pytest
+from PIL import Image, ImageDraw
+
+from src.utils import adjust_logo as module
+from src.utils.adjust_logo import adjust_logo, trim
+
+def make_logo(mode, size=(400, 300), background="white", box=(50, 40, 310, 221)):
+    colors = {"L": 0, "RGB": (180, 20, 200), "RGBA": (180, 20, 200, 255)}
+    im = Image.new(mode, size, background)
+    ImageDraw.Draw(im).rectangle(box, fill=colors[mode])
+    return im
+
+def trimmed(im, numpy):
+    # Small images use numpy too if the threshold is 0, and Pillow if np is None
+    with patch.object(module, "NUMPY_MIN_PIXELS", 0), patch.object(module, "np", numpy):
+        cropped = trim(im)
+    return cropped.size, cropped.tobytes()
+
+@pytest.mark.parametrize(
+    "mode, background",
+    [("L", 255), ("RGB", "white"), ("RGBA", (255, 255, 255, 255)), ("RGBA", (0, 0, 0, 0))],
+)
+def test_trim_crops_border(mode, background):
+    cropped = trim(make_logo(mode, background=background))
+    assert cropped.size == (261, 182)
+
+@pytest.mark.parametrize(
+    "mode, background",
+    [("L", 255), ("RGB", "white"), ("RGBA", (255, 255, 255, 255)), ("RGBA", (0, 0, 0, 0))],
+)
+def test_numpy_and_pillow_find_the_same_box(mode, background):
+    np = pytest.importorskip("numpy")
+    for box in [(0, 0, 10, 10), (390, 290, 399, 299), (5, 100, 6, 101), (1, 1, 398, 298)]:
+        im = make_logo(mode, background=background, box=box)
+        assert trimmed(im, np) == trimmed(im, None)
+
+def test_trim_ignores_small_differences():
+    im = make_logo("RGB", background=(200, 200, 200))
+    ImageDraw.Draw(im).rectangle((0, 250, 399, 299), fill=(230, 200, 170))
+    assert trim(im).size == (261, 182)
+
+def test_blank_logo_trims_to_none():
+    assert trim(Image.new("RGB", (50, 50), "white")) is None
+    assert trim(Image.new("RGBA", (50, 50), (0, 0, 0, 0))) is None
+
+def test_adjust_logo_caches_by_content(tmp_path):
+    logo = tmp_path / "logo.png"
+    make_logo("RGB").save(logo)
+    first = adjust_logo(logo, tmp_path / "first", cache_dir=tmp_path / "cache")
+    with patch.object(module, "trim") as trim_again:
+        second = adjust_logo(logo, tmp_path / "second", cache_dir=tmp_path / "cache")
+    trim_again.assert_not_called()
+    assert second.read_bytes() == first.read_bytes()
+    with Image.open(second) as im:
+        assert im.size == (261, 182)
@@ -0,0 +1,56 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from src.utils import artifacts
+from src.utils.artifacts import artifact_lock, atomic_path, atomic_write_bytes
+
+def _write_many(path, data, count):
+    for _ in range(count):
+        atomic_write_bytes(path, data)
+
+def test_failed_write_keeps_old_file(tmp_path):
+    path = tmp_path / "Packet.pdf"
+    atomic_write_bytes(path, b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as tmp:
+            assert tmp.suffix == ".pdf"
+            tmp.write_bytes(b"half")
+            raise RuntimeError("crash")
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["Packet.pdf"]
+
+def test_concurrent_writers_never_show_partial_files(tmp_path):
+    path = tmp_path / "Packet.pdf"
+    payloads = [bytes([i]) * 200_000 for i in (1, 2)]
+    writers = [
+        multiprocessing.Process(target=_write_many, args=(path, payload, 20))
+        for payload in payloads
+    ]
+    for writer in writers:
+        writer.start()
+    while any(writer.is_alive() for writer in writers):
+        if path.exists():
+            assert path.read_bytes() in payloads
+    for writer in writers:
+        writer.join()
+        assert writer.exitcode == 0
+    assert path.read_bytes() in payloads
+
+def test_lock_is_exclusive_and_reentrant(tmp_path):
+    path = tmp_path / "Cover.pdf"
+    order = []
+
+    def other():
+        with artifact_lock(path):
+            order.append("other")
+
+    with artifact_lock(path), artifact_lock(path):
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join(0.2)
+        order.append("first")
+    thread.join()
+    assert order == ["first", "other"]
+    assert path.resolve() not in artifacts._locks
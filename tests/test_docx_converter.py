@@ -0,0 +1,48 @@
+import multiprocessing
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from src.utils.docx_converter import _backend_lock, convert_docx
+
+def hold_backend(started):
+    with _backend_lock("libreoffice"):
+        started.set()
+        time.sleep(0.3)
+
+def test_backend_lock_is_shared_across_processes():
+    started = multiprocessing.Event()
+    other = multiprocessing.Process(target=hold_backend, args=(started,))
+    other.start()
+    assert started.wait(5)
+    start = time.perf_counter()
+    with _backend_lock("libreoffice"):
+        waited = time.perf_counter() - start
+    other.join()
+    assert waited > 0.1
+
+def fake_run(command, **kwargs):
+    if command[0] == "unoconvert":
+        Path(command[-1]).write_bytes(b"%PDF from " + kwargs["input"])
+    else:
+        docx_path = Path(command[-1])
+        (Path(command[command.index("--outdir") + 1]) / f"{docx_path.stem}.pdf").write_bytes(
+            b"%PDF from " + docx_path.read_bytes()
+        )
+
+def test_unoserver_streams_the_docx_on_stdin(tmp_path):
+    output_path = tmp_path / "Cover.pdf"
+    with patch("subprocess.run", side_effect=fake_run) as run:
+        assert convert_docx(b"docx", output_path, backend="unoserver") == output_path
+
+    command = run.call_args.args[0]
+    assert command[:4] == ["unoconvert", "--convert-to", "pdf", "-"]
+    assert "--input-filter" not in command
+    assert output_path.read_bytes() == b"%PDF from docx"
+    assert [p.name for p in tmp_path.iterdir() if ".tmp" in p.name] == []
+
+def test_libreoffice_converts_in_memory_docx(tmp_path):
+    output_path = tmp_path / "Cover.pdf"
+    with patch("subprocess.run", side_effect=fake_run):
+        convert_docx(b"docx", output_path, backend="libreoffice")
+    assert output_path.read_bytes() == b"%PDF from docx"
@@ -1,9 +1,16 @@
+import io
 import pytest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 from bs4 import BeautifulSoup
+from PIL import Image
 
-from src.favicon_downloader import _get_favicon_url, _download_favicon, get_favicon_from_website
+from src.utils.favicon_downloader import (
+    _get_favicon_url,
+    _download_favicon,
+    _read_html_head,
+    get_favicon_from_website,
+)
 
 @pytest.fixture
 def mock_soup():
@@ -22,44 +29,85 @@ def test_get_favicon_url(mock_soup):
     assert favicon_url == "https://example.com/favicon.ico"
 
 @patch('requests.get')
-def test_download_favicon(mock_get):
+def test_download_favicon(mock_get, tmp_path):
+    ico = io.BytesIO()
+    Image.new("RGBA", (16, 16), "red").save(ico, format="ICO")
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.content = b'fake_image_content'
+    mock_response.content = ico.getvalue()
     mock_get.return_value = mock_response
 
-    with patch('builtins.open', create=True) as mock_open, \
-         patch('PIL.Image.open') as mock_image_open:
-        mock_image = MagicMock()
-        mock_image_open.return_value = mock_image
+    output_path = tmp_path / "test_favicon"
+    _download_favicon("https://example.com/favicon.ico", output_path)
 
-        output_path = Path("./test_favicon")
-        _download_favicon("https://example.com/favicon.ico", output_path)
-
-        mock_open.assert_called_with(f"{output_path}.ico", "wb")
-        mock_image.save.assert_called_with(f"{output_path}.png")
+    assert Path(f"{output_path}.ico").read_bytes() == ico.getvalue()
+    with Image.open(f"{output_path}.png") as png:
+        assert png.format == "PNG"
+    # Only the lock files are left next to them
+    assert not [p for p in tmp_path.iterdir() if ".tmp" in p.name]
 
 @patch('requests.get')
-@patch('src.favicon_downloader.BeautifulSoup')
-@patch('src.favicon_downloader.download_favicon')
-def test_get_favicon_from_website(mock_download_favicon, mock_bs, mock_get):
+@patch('src.utils.favicon_downloader._download_favicon')
+def test_get_favicon_from_website(mock_download_favicon, mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.text = "<html></html>"
-    mock_get.return_value = mock_response
+    mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+    mock_response.encoding = "utf-8"
+    mock_response.iter_content.return_value = iter(
+        [b'<html><head><link rel="icon" href="/static/icon.png">', b"</head><body>"]
+    )
+    mock_get.return_value.__enter__.return_value = mock_response
+
+    url = "https://example.com/blog/post"
+    output_path = Path("./test_favicon")
+    result = get_favicon_from_website(url, output_path)
+
+    assert result == output_path.with_suffix(".png")
+    mock_get.assert_called_once_with(url, stream=True)
+    mock_download_favicon.assert_called_once_with("https://example.com/static/icon.png", output_path)
+
+def test_read_html_head_stops_at_end_of_head():
+    body_chunks = [b"<html><head><title>t</title>", b"</HEAD><body>", b"x" * 10_000]
+    chunks_read = []
+
+    def iter_content(chunk_size):
+        for chunk in body_chunks:
+            chunks_read.append(chunk)
+            yield chunk
+
+    mock_response = MagicMock()
+    mock_response.encoding = "utf-8"
+    mock_response.iter_content.side_effect = iter_content
 
-    mock_soup = MagicMock()
-    mock_bs.return_value = mock_soup
+    head = _read_html_head(mock_response)
+
+    assert head == "<html><head><title>t</title></head>"
+    assert len(chunks_read) == 2
+
+@patch('requests.get')
+@patch('src.utils.favicon_downloader._download_favicon')
+def test_get_favicon_from_website_skips_pdf(mock_download_favicon, mock_get):
+    url = "https://arxiv.org/pdf/2310.01405.pdf"
+    output_path = Path("./test_favicon")
+    result = get_favicon_from_website(url, output_path)
+
+    assert result == output_path.with_suffix(".png")
+    mock_get.assert_not_called()
+    mock_download_favicon.assert_called_once_with("https://arxiv.org/favicon.ico", output_path)
+
+@patch('requests.get')
+@patch('src.utils.favicon_downloader._download_favicon')
+def test_get_favicon_from_website_non_html_content_type(mock_download_favicon, mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.headers = {"Content-Type": "application/pdf"}
+    mock_get.return_value.__enter__.return_value = mock_response
 
-    with patch('src.favicon_downloader.get_favicon_url') as mock_get_favicon_url:
-        mock_get_favicon_url.return_value = "https://example.com/favicon.ico"
-        
-        url = "https://example.com"
-        output_path = Path("./test_favicon")
-        result = get_favicon_from_website(url, output_path)
+    output_path = Path("./test_favicon")
+    get_favicon_from_website("https://example.com/download?id=3", output_path)
 
-        assert result == output_path.with_suffix(".png")
-        mock_download_favicon.assert_called_once_with("https://example.com/favicon.ico", output_path)
+    mock_response.iter_content.assert_not_called()
+    mock_download_favicon.assert_called_once_with("https://example.com/favicon.ico", output_path)
 
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
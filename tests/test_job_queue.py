@@ -0,0 +1,50 @@
+import threading
+
+from src.job_queue import JobQueue, run_worker
+
+def test_jobs_are_claimed_once(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite")
+    for i in range(20):
+        queue.submit(f"Meeting {i}", {"record_id": f"rec{i}", "make_packet": True})
+    assert queue.submit("Meeting 0", {}) == 1
+
+    ran = []
+    lock = threading.Lock()
+
+    def run_job(job):
+        with lock:
+            ran.append(job["curriculum"])
+        return {"error": None, "log": None}
+
+    workers = [
+        threading.Thread(
+            target=run_worker,
+            args=(JobQueue(tmp_path / "queue.sqlite"), run_job, f"worker{i}"),
+            kwargs={"exit_when_empty": True},
+        )
+        for i in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(ran) == sorted(f"Meeting {i}" for i in range(20))
+    assert {job["status"] for job in queue.jobs()} == {"done"}
+
+def test_expired_leases_are_requeued(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite", lease_seconds=0.05, max_attempts=2)
+    job_id = queue.submit("Meeting 1", {"record_id": "rec1"})
+
+    crashed = queue.claim("crashed")
+    assert crashed["id"] == job_id and queue.claim("other") is None
+    threading.Event().wait(0.1)
+    retry = queue.claim("other")
+    assert retry["id"] == job_id and retry["attempts"] == 1
+    # The crashed worker can't renew or finish a job it lost
+    assert not queue.heartbeat(job_id, "crashed")
+    assert not queue.finish(job_id, "crashed")
+
+    threading.Event().wait(0.1)
+    assert queue.claim("third") is None
+    assert queue.jobs()[0]["status"] == "failed"
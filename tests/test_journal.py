@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from src.journal import RunJournal
+
+def test_resume_reuses_unchanged_stages(tmp_path):
+    cover = tmp_path / "Cover.pdf"
+    cover.write_bytes(b"%PDF cover")
+    guide = tmp_path / "Guide.pdf"
+    guide.write_bytes(b"%PDF guide")
+
+    journal = RunJournal(tmp_path)
+    journal.record("precontext", {"title": "Meeting 1"})
+    journal.record("cover", cover)
+    journal.record("ta_guide:cohort_1", guide)
+    # A crash while writing leaves a partial line behind
+    with open(journal.path, "a") as f:
+        f.write('{"stage": "packet", "res')
+
+    guide.write_bytes(b"%PDF guide, half written")
+    resumed = RunJournal(tmp_path, resume=True)
+    assert resumed.lookup("precontext")["result"] == {"title": "Meeting 1"}
+    assert resumed.lookup("cover")["result"] == cover
+    assert isinstance(resumed.lookup("cover")["result"], Path)
+    assert resumed.lookup("ta_guide:cohort_1") is None
+    assert resumed.lookup("packet") is None
+    assert not resumed.finished()
+
+    # The resumed run's records survive the partial line
+    resumed.record("ta_guide:cohort_1", guide)
+    again = RunJournal(tmp_path, resume=True)
+    assert again.lookup("ta_guide:cohort_1")["result"] == guide
+    assert again.lookup("cover")["result"] == cover
+
+    # Without resume, the next run starts over
+    assert RunJournal(tmp_path).lookup("cover") is None
+    assert not (tmp_path / "journal.jsonl").exists()
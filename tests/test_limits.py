@@ -0,0 +1,62 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.utils.limits import init_limits, limit, limit_sizes, make_limits
+
+def convert(_: int) -> tuple[float, float]:
+    with limit("converter"):
+        start = time.perf_counter()
+        time.sleep(0.1)
+        return start, time.perf_counter()
+
+def test_limits_are_shared_across_processes():
+    with multiprocessing.Manager() as manager:
+        semaphores = make_limits(manager, {"concurrency": {"converter": 1}})
+        with ProcessPoolExecutor(
+            max_workers=3, initializer=init_limits, initargs=(semaphores,)
+        ) as executor:
+            spans = sorted(executor.map(convert, range(3)))
+
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
+
+def test_limit_without_setup_is_a_no_op():
+    with limit("network"):
+        pass
+
+def test_limits_are_sized_from_the_machine():
+    unoserver = {"converter": {"backend": "unoserver"}}
+    small = limit_sizes(unoserver, cpu_count=2, memory_mb=1000)
+    assert small["converter"] == 1 and small["latex"] == 2 and small["memory_mb"] == 750
+    big = limit_sizes(unoserver, cpu_count=16, memory_mb=64000)
+    assert big["converter"] == 8 and big["latex"] == 16
+    assert limit_sizes({"concurrency": {"converter": 3}}, cpu_count=16)["converter"] == 3
+    # Word and soffice only convert one document at a time
+    assert limit_sizes(cpu_count=16, memory_mb=64000)["converter"] == 1
+    libreoffice = {"converter": {"backend": "libreoffice"}}
+    assert limit_sizes(libreoffice, cpu_count=16, memory_mb=64000)["converter"] == 1
+
+def test_memory_budget_limits_big_merges():
+    spans = []
+
+    def merge():
+        with limit("merge", memory_mb=600):
+            start = time.perf_counter()
+            time.sleep(0.1)
+            spans.append((start, time.perf_counter()))
+
+    with multiprocessing.Manager() as manager:
+        # Room for 4 merges at once, but memory for only one of 600 MB
+        init_limits(make_limits(manager, {"concurrency": {"merge": 4, "memory_mb": 1000}}))
+        try:
+            threads = [threading.Thread(target=merge) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            init_limits({})
+
+    spans.sort()
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
@@ -0,0 +1,23 @@
+from unittest.mock import patch
+
+from src.DocumentGenerator import logger
+from src.main import run_curriculum_job
+
+def test_job_log_keeps_printed_lines_and_log_records(tmp_path):
+    def process(*args, **kwargs):
+        for i in range(50):
+            # Long enough to be flushed while the job runs
+            print(f"printed line {i}", "." * 500)
+            logger.info(f"log record {i}")
+
+    with patch("src.main.process_curriculum", side_effect=process):
+        result = run_curriculum_job("Meeting 1", {}, tmp_path)
+
+    assert result["ok"]
+    lines = result["log"].read_text().splitlines()
+    assert [line for line in lines if line.startswith("printed")] == [
+        f"printed line {i} " + "." * 500 for i in range(50)
+    ]
+    assert [line.split(" - ")[-1] for line in lines if " - " in line] == [
+        f"log record {i}" for i in range(50)
+    ]
@@ -0,0 +1,181 @@
+import pytest
+from pathlib import Path
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, NameObject
+from reportlab.pdfgen import canvas
+
+from src.utils.pdf_helpers import MergeVariant, mergePdfVariants, mergePdfs
+from src.utils.pdf_stream import open_pdf
+
+def make_pdf(path: Path, sizes: list[tuple[float, float]]) -> Path:
+    writer = PdfWriter()
+    for width, height in sizes:
+        writer.add_blank_page(width, height)
+    writer.write(str(path))
+    return path
+
+@pytest.fixture
+def pdfs(tmp_path):
+    return [
+        make_pdf(tmp_path / "cover.pdf", [(612, 792)]),
+        make_pdf(tmp_path / "reading.pdf", [(595, 842)] * 3),
+        make_pdf(tmp_path / "further.pdf", [(612, 792)] * 2),
+    ]
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_merge_pads_odd_documents(pdfs, tmp_path, streaming):
+    output_path = mergePdfs(pdfs, tmp_path / "packet.pdf", streaming=streaming)
+
+    reader = PdfReader(output_path)
+    # 1 + blank, 3 + blank, 2
+    assert len(reader.pages) == 8
+    assert [float(page.mediabox.width) for page in reader.pages] == [
+        612, 612, 595, 595, 595, 595, 612, 612
+    ]
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_merge_without_padding(pdfs, tmp_path, streaming):
+    output_path = mergePdfs(
+        pdfs, tmp_path / "packet.pdf", merge_on_odd=False, streaming=streaming
+    )
+
+    assert len(PdfReader(output_path).pages) == 6
+
+def test_streaming_merge_keeps_content(tmp_path):
+    source = tmp_path / "source.pdf"
+    c = canvas.Canvas(str(source))
+    for i in range(2):
+        c.drawString(100, 700, f"Reading page {i + 1}")
+        c.showPage()
+    c.save()
+
+    output_path = mergePdfs([source, source], tmp_path / "packet.pdf", streaming=True)
+
+    reader = PdfReader(output_path, strict=True)
+    assert [page.extract_text().strip() for page in reader.pages] == [
+        "Reading page 1", "Reading page 2"
+    ] * 2
+
+def test_streaming_merge_stamps_footer(pdfs, tmp_path):
+    output_path = mergePdfs(
+        pdfs, tmp_path / "packet.pdf", streaming=True, footer_text="MAIA — Page {i} of {n}"
+    )
+
+    texts = [page.extract_text() for page in PdfReader(output_path, strict=True).pages]
+    assert texts[0] == texts[1] == ""
+    assert [text.replace("\n", "") for text in texts[2:]] == [
+        f"MAIA — Page {i} of 8" for i in range(3, 9)
+    ]
+
+def test_footer_keeps_indirect_content_arrays(tmp_path):
+    source = tmp_path / "source.pdf"
+    c = canvas.Canvas(str(source))
+    for i in range(3):
+        c.drawString(100, 700, f"Reading page {i + 1}")
+        c.showPage()
+    c.save()
+    writer = PdfWriter(clone_from=source)
+    page = writer.pages[2]
+    extra = DecodedStreamObject()
+    extra.set_data(b"BT /F1 12 Tf 100 600 Td (continued) Tj ET")
+    parts = ArrayObject([page.raw_get("/Contents"), writer._add_object(extra)])
+    page[NameObject("/Contents")] = writer._add_object(parts)
+    writer.write(str(source))
+
+    output_path = mergePdfs(
+        [source], tmp_path / "packet.pdf", streaming=True, footer_text="MAIA — Page {i}"
+    )
+
+    page = PdfReader(output_path, strict=True).pages[2]
+    assert page.get_contents() is not None
+    text = page.extract_text().replace("\n", "")
+    assert text.startswith("Reading page 3") and "continued" in text
+    assert text.endswith("MAIA — Page 3")
+
+def test_footer_without_page_number(pdfs, tmp_path):
+    output_path = mergePdfs(pdfs, tmp_path / "packet.pdf", streaming=True, footer_text="MAIA")
+
+    texts = [page.extract_text() for page in PdfReader(output_path, strict=True).pages]
+    assert texts[2:] == ["MAIA"] * 6
+
+def test_incremental_merge_replaces_changed_pages(tmp_path):
+    def make_text_pdf(path: Path, lines: list[str]) -> Path:
+        c = canvas.Canvas(str(path))
+        for line in lines:
+            c.drawString(100, 700, line)
+            c.showPage()
+        c.save()
+        return path
+
+    cover = make_text_pdf(tmp_path / "cover.pdf", ["Cover"])
+    reading = make_text_pdf(tmp_path / "reading.pdf", ["Reading 1", "Reading 2", "Reading 3"])
+    further = make_text_pdf(tmp_path / "further.pdf", ["Further v1"])
+    pdfs = [cover, reading, further]
+    output_path = tmp_path / "packet.pdf"
+    footer_text = "MAIA — Page {i} of {n}"
+
+    mergePdfs(pdfs, output_path, streaming=True, footer_text=footer_text, incremental=True)
+    original = output_path.read_bytes()
+
+    # Same page count: only the further reading's pages are appended as an update
+    make_text_pdf(further, ["Further v2"])
+    mergePdfs(pdfs, output_path, streaming=True, footer_text=footer_text, incremental=True)
+    assert output_path.read_bytes().startswith(original)
+    reader = PdfReader(output_path, strict=True)
+    assert len(reader.pages) == 8
+    assert reader.pages[6].extract_text().startswith("Further v2")
+    assert reader.pages[6].extract_text().replace("\n", "").endswith("Page 7 of 8")
+    assert reader.pages[2].extract_text().startswith("Reading 1")
+
+    # A different page count needs a full rebuild
+    make_text_pdf(further, ["Further v3", "Further v3 continued", "Further v3 end"])
+    mergePdfs(pdfs, output_path, streaming=True, footer_text=footer_text, incremental=True)
+    reader = PdfReader(output_path, strict=True)
+    assert len(reader.pages) == 10
+    assert reader.pages[8].extract_text().replace("\n", "").endswith("Page 9 of 10")
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_merge_reuses_shared_readers(pdfs, tmp_path, streaming):
+    cover, reading, further = pdfs
+    with open_pdf(reading) as shared:
+        for i in range(2):
+            output_path = mergePdfs(
+                [cover, shared, further], tmp_path / f"guide{i}.pdf", streaming=streaming
+            )
+            assert len(PdfReader(output_path, strict=True).pages) == 8
+
+def test_merge_variants_in_one_pass(tmp_path):
+    photo = tmp_path / "photo.jpg"
+    Image.effect_noise((1600, 1000), 64).convert("RGB").save(photo)
+    source = tmp_path / "reading.pdf"
+    c = canvas.Canvas(str(source))
+    c.drawImage(str(photo), 50, 300, 500, 333)
+    c.linkURL("https://example.com", (50, 300, 550, 633))
+    c.showPage()
+    c.save()
+
+    print_path, screen_path = mergePdfVariants(
+        [source, source],
+        [
+            MergeVariant(tmp_path / "print.pdf"),
+            MergeVariant(
+                tmp_path / "screen.pdf", merge_on_odd=False, image_dpi=50, keep_links=False
+            ),
+        ],
+    )
+
+    print_pdf = PdfReader(print_path, strict=True)
+    assert len(print_pdf.pages) == 4
+    assert len(print_pdf.pages[0]["/Annots"]) == 1
+    print_image = print_pdf.pages[0]["/Resources"]["/XObject"]
+    assert print_image[list(print_image)[0]]["/Width"] == 1600
+
+    screen_pdf = PdfReader(screen_path, strict=True)
+    assert len(screen_pdf.pages) == 2
+    assert len(screen_pdf.pages[0].get("/Annots", [])) == 0
+    screen_image = screen_pdf.pages[0]["/Resources"]["/XObject"]
+    screen_image = screen_image[list(screen_image)[0]]
+    # Drawn at 500x333 pt, so 6.94x4.63 in at 50 dpi
+    assert (screen_image["/Width"], screen_image["/Height"]) == (348, 232)
+    assert screen_path.stat().st_size < print_path.stat().st_size / 2
@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from pypdf import PdfWriter
+
+from src.utils.pdf_index import PdfIndex, estimate_merged_size
+
+def make_pdf(path: Path, num_pages: int) -> Path:
+    writer = PdfWriter()
+    for _ in range(num_pages):
+        writer.add_blank_page(595, 842)
+    writer.write(str(path))
+    return path
+
+def test_index_persists_metadata(tmp_path):
+    pdf = make_pdf(tmp_path / "reading.pdf", 3)
+
+    index = PdfIndex(tmp_path / "index.json")
+    entry = index.get(pdf)
+    assert entry["page_count"] == 3
+    assert entry["page_sizes"] == [[595, 842]] * 3
+    assert entry["byte_size"] == pdf.stat().st_size
+    index.save()
+
+    # A new index reads everything back without parsing or hashing again
+    with patch("src.utils.pdf_index._read_metadata") as read, patch(
+        "src.utils.pdf_index.hash_file"
+    ) as hash_file:
+        reloaded = PdfIndex(tmp_path / "index.json")
+        assert reloaded.get(pdf) == entry
+    read.assert_not_called()
+    hash_file.assert_not_called()
+
+def test_save_prunes_replaced_and_deleted_pdfs(tmp_path):
+    cover = make_pdf(tmp_path / "Cover.pdf", 1)
+    reading = make_pdf(tmp_path / "reading.pdf", 2)
+    index = PdfIndex(tmp_path / "index.json")
+    old_cover = index.get(cover)["sha256"]
+    index.get(reading)
+    index.save()
+
+    make_pdf(cover, 3)
+    os.utime(cover, ns=(0, 0))
+    new_cover = index.get(cover)["sha256"]
+    reading.unlink()
+    index.save()
+
+    reloaded = PdfIndex(tmp_path / "index.json")
+    assert list(reloaded.pdfs) == [new_cover]
+    assert list(reloaded.paths) == [str(cover.resolve())]
+    assert old_cover != new_cover
+
+def test_index_detects_changes(tmp_path):
+    pdf = make_pdf(tmp_path / "reading.pdf", 1)
+    index = PdfIndex(tmp_path / "index.json")
+    digest = index.get(pdf)["sha256"]
+    assert not index.has_changed(pdf, digest)
+
+    make_pdf(pdf, 2)
+    os.utime(pdf, ns=(0, 0))
+    assert index.has_changed(pdf, digest)
+    assert index.get(pdf)["page_count"] == 2
+
+def test_estimate_merged_size(tmp_path):
+    pdfs = [make_pdf(tmp_path / f"{n}.pdf", n) for n in (1, 3, 2)]
+    index = PdfIndex(tmp_path / "index.json")
+
+    num_pages, num_bytes = estimate_merged_size(pdfs, index)
+
+    assert num_pages == 8
+    assert num_bytes == sum(pdf.stat().st_size for pdf in pdfs)
@@ -0,0 +1,70 @@
+import pytest
+from pathlib import Path
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject, NumberObject, TextStringObject
+from reportlab.pdfgen import canvas
+
+from src.utils.pdf_helpers import mergePdfs
+from src.utils.pdf_optimize import find_duplicates, linearize_pdf, optimize_pdf
+from src.utils.pdf_stream import open_pdf
+
+def make_page_with_logo(path: Path, logo: Path) -> Path:
+    c = canvas.Canvas(str(path), pageCompression=0)
+    c.drawImage(str(logo), 100, 500, 200, 200)
+    c.drawString(100, 400, path.stem)
+    c.showPage()
+    c.save()
+    return path
+
+def test_optimize_dedupes_images_across_documents(tmp_path):
+    logo = tmp_path / "logo.png"
+    Image.effect_noise((200, 200), 64).convert("RGB").save(logo)
+    pdfs = [make_page_with_logo(tmp_path / f"page{i}.pdf", logo) for i in range(3)]
+    packet = mergePdfs(pdfs, tmp_path / "packet.pdf", merge_on_odd=False, streaming=True)
+
+    report = optimize_pdf(packet, packet)
+
+    assert report.deduplicated_objects > 0
+    assert report.compressed_streams > 0
+    assert report.output_bytes == packet.stat().st_size < report.input_bytes
+    reader = PdfReader(packet, strict=True)
+    assert [page.extract_text().strip() for page in reader.pages] == ["page0", "page1", "page2"]
+    images = [page["/Resources"]["/XObject"] for page in reader.pages]
+    assert len({xobjects.raw_get(name).idnum for xobjects in images for name in xobjects}) == 1
+
+def test_linearize_pdf(tmp_path):
+    pikepdf = pytest.importorskip("pikepdf")
+    logo = tmp_path / "logo.png"
+    Image.effect_noise((200, 200), 64).convert("RGB").save(logo)
+    pdfs = [make_page_with_logo(tmp_path / f"page{i}.pdf", logo) for i in range(3)]
+    packet = mergePdfs(pdfs, tmp_path / "packet.pdf", merge_on_odd=False, streaming=True)
+
+    assert linearize_pdf(packet, packet)
+
+    with pikepdf.open(packet) as pdf:
+        assert pdf.is_linearized
+        assert len(pdf.pages) == 3
+
+def test_untyped_dictionaries_are_not_merged(tmp_path):
+    writer = PdfWriter()
+    for _ in range(2):
+        page = writer.add_blank_page(612, 792)
+        link = DictionaryObject(
+            {
+                NameObject("/Subtype"): NameObject("/Link"),
+                NameObject("/Rect"): ArrayObject([NumberObject(0)] * 4),
+                NameObject("/URI"): TextStringObject("https://example.com"),
+            }
+        )
+        page[NameObject("/Annots")] = ArrayObject([writer._add_object(link)])
+    packet = tmp_path / "packet.pdf"
+    writer.write(packet)
+
+    with open_pdf(packet) as reader:
+        assert find_duplicates(reader) == {}
+        # Objects aren't kept around while searching
+        assert len(reader.resolved_objects) < 5
+    optimize_pdf(packet, packet)
+    reader = PdfReader(packet, strict=True)
+    assert len({page["/Annots"][0].idnum for page in reader.pages}) == 2
@@ -0,0 +1,40 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.pipeline import pipeline
+
+def overlap(span, other):
+    return span[0] < other[1] and other[0] < span[1]
+
+def test_fetching_overlaps_rendering():
+    spans = {"fetch": {}, "render": {}}
+
+    def fetch(name):
+        start = time.perf_counter()
+        time.sleep(0.1)
+        spans["fetch"][name] = (start, time.perf_counter())
+        if name == "broken":
+            raise ValueError("no precontext")
+        return name.upper()
+
+    def render(name, payload):
+        start = time.perf_counter()
+        time.sleep(0.1)
+        spans["render"][name] = (start, time.perf_counter())
+        return {"curriculum": name, "ok": True, "seconds": 0.1, "error": None, "log": payload}
+
+    names = ["a", "b", "broken", "c", "d"]
+    with ThreadPoolExecutor(2) as fetch_executor, ThreadPoolExecutor(1) as render_executor:
+        results = asyncio.run(pipeline(names, fetch, render, fetch_executor, render_executor))
+
+    # Some curriculum renders while a later one is still being fetched
+    assert any(
+        overlap(spans["render"][name], spans["fetch"][later])
+        for i, name in enumerate(names)
+        if name in spans["render"]
+        for later in names[i + 1 :]
+    )
+    assert [result["curriculum"] for result in results] == names
+    assert [result["log"] for result in results if result["ok"]] == ["A", "B", "C", "D"]
+    assert not results[2]["ok"] and "no precontext" in results[2]["error"]
@@ -0,0 +1,113 @@
+from contextlib import ExitStack
+from copy import deepcopy
+from unittest.mock import patch
+
+from src.main import build_graph
+from src.packet.packet import packet_paths
+from src.planner import (
+    Change,
+    Plan,
+    load_build_state,
+    plan_rebuild,
+    save_build_state,
+    stale_outputs,
+)
+
+def make_precontext(tmp_path):
+    logo = tmp_path / "logo.png"
+    logo.write_bytes(b"logo")
+    reading = tmp_path / "reading.pdf"
+    reading.write_bytes(b"%PDF reading")
+    return {
+        "curriculum_name": "Meeting 1",
+        "logo_path": str(logo),
+        "program_name": "AISST",
+        "title": "Meeting 1",
+        "color_primary": "#B48BFF",
+        "core_readings": [
+            {"title": "Reading A", "trimmed_pdf": str(reading), "read_on_device": False, "subsection": ""},
+            {"title": "Reading B", "trimmed_pdf": None, "read_on_device": True, "subsection": ""},
+        ],
+        "further_readings": [{"title": "Further A", "url": "https://example.com"}],
+        "cohorts": [{"name": "Cohort 1", "global_cohort_i": 1, "num_members": 5}],
+        "meeting_ta_guide_pdf": None,
+        "base_ta_guide_pdf": None,
+    }
+
+def plan_after(tmp_path, edit):
+    config = {"templates": {}, "generate": {"cover": True}}
+    precontext = make_precontext(tmp_path)
+    save_build_state(tmp_path, precontext, config, {"packet": tmp_path / "Packet.pdf"})
+    new = deepcopy(precontext)
+    edit(new)
+    return plan_rebuild(load_build_state(tmp_path), new, config)
+
+def test_new_cohort_only_needs_its_guide(tmp_path):
+    plan = plan_after(
+        tmp_path,
+        lambda p: p["cohorts"].append({"name": "Cohort 2", "global_cohort_i": 2, "num_members": 4}),
+    )
+    assert plan.artifacts == {"ta_guide:cohort_2"}
+    assert not plan.needs("packet")
+
+def test_retitled_further_reading_needs_further_page_and_packet(tmp_path):
+    plan = plan_after(tmp_path, lambda p: p["further_readings"][0].update(title="Further B"))
+    assert plan.artifacts == {"further", "packet"}
+
+def test_changes_map_to_dependents(tmp_path):
+    assert not plan_after(tmp_path, lambda p: None).changes
+    # The logo is on everything
+    plan = plan_after(tmp_path, lambda p: open(p["logo_path"], "wb").write(b"new logo"))
+    assert {"cover", "further", "packet", "device_reading:reading_b", "ta_guide:cohort_1"} <= plan.artifacts
+    # A new trimmed pdf only changes the packet
+    plan = plan_after(tmp_path, lambda p: open(p["core_readings"][0]["trimmed_pdf"], "wb").write(b"%PDF v2"))
+    assert plan.artifacts == {"packet"}
+    # Editing a device reading regenerates it, and what lists it
+    plan = plan_after(tmp_path, lambda p: p["core_readings"][1].update(author="Someone"))
+    assert plan.artifacts == {"cover", "packet", "device_reading:reading_b", "ta_guide:cohort_1"}
+
+def test_first_build_is_full(tmp_path):
+    plan = plan_rebuild(None, make_precontext(tmp_path), {"templates": {}})
+    assert plan.full and plan.needs("cover")
+    assert plan.reusable("packet") is None
+
+def test_outputs_of_removed_artifacts_are_stale(tmp_path):
+    precontext = make_precontext(tmp_path)
+    precontext["cohorts"].append({"name": "Cohort 2", "global_cohort_i": 2, "num_members": 4})
+    outputs = {
+        "packet": tmp_path / "Packet.pdf",
+        "ta_guide:cohort_1": tmp_path / "TA Guides" / "Cohort 1.pdf",
+        "ta_guide:cohort_2": tmp_path / "TA Guides" / "Cohort 2.pdf",
+    }
+    save_build_state(tmp_path, precontext, {"templates": {}}, outputs)
+    state = load_build_state(tmp_path)
+
+    precontext["cohorts"].pop()
+    # The packet wasn't generated this time (e.g. disabled), but is still kept
+    produced = {"ta_guide:cohort_1": outputs["ta_guide:cohort_1"]}
+    assert stale_outputs(state, precontext, produced) == [outputs["ta_guide:cohort_2"]]
+    assert stale_outputs(None, precontext, {}) == []
+
+
+def test_shared_ta_guides_are_only_opened_for_planned_guides(tmp_path):
+    precontext = make_precontext(tmp_path)
+    guide = tmp_path / "Cohort 1.pdf"
+    guide.write_bytes(b"%PDF guide")
+    precontext["base_ta_guide_pdf"] = str(guide)
+    config = {"generate": {"device_readings": False, "tas_guides": True}}
+    with patch("src.main.get_config", return_value=config), ExitStack() as stack:
+        unchanged = Plan(outputs={"ta_guide:cohort_1": str(guide)})
+        assert "ta_guides_shared" not in build_graph(precontext, tmp_path, stack, unchanged).tasks
+        added = Plan([Change("cohort added", {"ta_guide:cohort_1"})], outputs=unchanged.outputs)
+        assert "ta_guides_shared" in build_graph(precontext, tmp_path, stack, added).tasks
+
+def test_packet_is_only_kept_with_all_its_variants(tmp_path):
+    precontext = make_precontext(tmp_path)
+    config = {"pdf": {"variants": {"print": {"suffix": ""}, "screen": {"suffix": " (screen)"}}}}
+    paths = packet_paths(precontext, tmp_path, config)
+    assert [path.name for path in paths] == ["meeting_1.pdf", "meeting_1 (screen).pdf"]
+    plan = Plan(outputs={"packet": str(paths[0])}, companions={"packet": paths})
+    paths[0].write_bytes(b"%PDF print")
+    assert plan.reusable("packet") is None
+    paths[1].write_bytes(b"%PDF screen")
+    assert plan.reusable("packet") == paths[0]
@@ -0,0 +1,57 @@
+import json
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from src.cli import cli
+from src.preflight import check_precontext
+
+def make_precontext(tmp_path):
+    logo = tmp_path / "logo.png"
+    logo.write_bytes(b"logo")
+    return {
+        "logo_path": str(logo),
+        "core_readings": [
+            {"title": "Reading A", "trimmed_pdf": None, "read_on_device": False},
+            {"title": "Reading B", "trimmed_pdf": str(tmp_path / "B.pdf"), "read_on_device": False},
+        ],
+        "cohorts": [],
+    }
+
+def test_reading_checks_need_readings_to_be_generated(tmp_path):
+    precontext = make_precontext(tmp_path)
+    generate = {"cover": True, "device_readings": False, "packet": False, "tas_guides": False}
+    assert check_precontext(precontext, {"generate": generate}) == []
+
+    problems = check_precontext(precontext, {"generate": {**generate, "packet": True}})
+    assert problems == [
+        "reading 'Reading A' has no trimmed pdf and is not labeled as read_on_device",
+        f"trimmed pdf of 'Reading B' not found at {tmp_path / 'B.pdf'}",
+    ]
+
+def test_read_on_device_needs_device_readings(tmp_path):
+    precontext = make_precontext(tmp_path)
+    precontext["core_readings"] = [
+        {"title": "Reading C", "trimmed_pdf": None, "read_on_device": True}
+    ]
+    generate = {"device_readings": False, "packet": True}
+    assert check_precontext(precontext, {"generate": generate}) == [
+        "reading 'Reading C' is read_on_device but device readings are disabled"
+    ]
+    assert check_precontext(precontext, {"generate": {**generate, "device_readings": True}}) == []
+
+def test_preflight_command_reports_every_problem(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"curriculum": {}, "generate": {}, "output_dir": str(tmp_path)}))
+    result = CliRunner().invoke(cli, ["preflight", "--config", str(config)])
+    assert result.exit_code == 1
+    assert "Preflight found 2 problem(s)" in result.output
+    assert "config: missing 'error_pdf'" in result.output
+
+def test_preflight_command_reports_unexpected_errors(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"output_dir": str(tmp_path)}))
+    with patch("src.preflight.run_preflight", side_effect=OSError("Airtable unreachable")):
+        result = CliRunner().invoke(cli, ["preflight", "--config", str(config)])
+    assert result.exit_code == 1
+    assert result.output == "Error: Airtable unreachable\n"
@@ -0,0 +1,51 @@
+from PIL import Image
+
+from src.utils.prepare_image import _target_size, prepare_image
+
+def make_photo(path, size=(1200, 800)):
+    im = Image.merge("RGB", [Image.effect_noise(size, 64) for _ in range(3)])
+    im.save(path)
+    return path
+
+def test_target_size_keeps_aspect_and_never_upscales():
+    im = Image.new("RGB", (1200, 800))
+    assert _target_size(im, 2, None, 300) == (600, 400)
+    # The height limit wins if it is tighter than the width
+    assert _target_size(im, 2, 1, 300) == (450, 300)
+    assert _target_size(im, 2, 1, 150) == (225, 150)
+    assert _target_size(im, 10, None, 300) == (1200, 800)
+    assert _target_size(im, 0.001, None, 300) == (1, 1)
+
+def test_photos_become_jpegs_and_line_art_stays_png(tmp_path):
+    photo = make_photo(tmp_path / "photo.png")
+    qr = tmp_path / "qr.png"
+    Image.new("1", (900, 900), 1).save(qr)
+
+    prepared_photo = prepare_image(photo, 2, dpi=300, cache_dir=tmp_path / "cache")
+    prepared_qr = prepare_image(qr, 1, dpi=300, cache_dir=tmp_path / "cache")
+
+    assert prepared_photo.suffix == ".jpg"
+    with Image.open(prepared_photo) as im:
+        assert im.size == (600, 400)
+    assert prepared_qr.suffix == ".png"
+    with Image.open(prepared_qr) as im:
+        assert (im.mode, im.size) == ("1", (300, 300))
+
+def test_cache_key_is_content_size_and_dpi(tmp_path):
+    cache_dir = tmp_path / "cache"
+    photo = make_photo(tmp_path / "photo.png")
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(photo.read_bytes())
+
+    prepared = prepare_image(photo, 2, dpi=300, cache_dir=cache_dir)
+    # The same content under another name is found in the cache
+    assert prepare_image(copy, 2, dpi=300, cache_dir=cache_dir) == prepared
+    others = {
+        prepare_image(photo, 1, dpi=300, cache_dir=cache_dir),
+        prepare_image(photo, 2, 1, dpi=300, cache_dir=cache_dir),
+        prepare_image(photo, 2, dpi=150, cache_dir=cache_dir),
+        prepare_image(make_photo(copy, (1000, 800)), 2, dpi=300, cache_dir=cache_dir),
+    }
+    assert len(others) == 4
+    assert prepared not in others
+    assert len(list(cache_dir.glob("*.jpg"))) == 5
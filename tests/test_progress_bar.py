@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.pdfgen import canvas
+
+from src.progress_bar.vector_progress_bar import (
+    progress_bar_svg,
+    render_progress_bars,
+    stamp_progress_bar,
+)
+
+READINGS = [
+    {"title": "Concrete Problems in AI Safety", "reading_time_min": 40},
+    {"title": "Risks from Learned Optimization", "reading_time_min": 20},
+    {"title": "Specification gaming & <friends>"},
+]
+
+def test_render_progress_bars_renders_each_bar_once_and_caches(tmp_path):
+    bars = {f"Curriculum {i}": READINGS[: i % 3 + 1] for i in range(30)}
+
+    with patch(
+        "src.progress_bar.vector_progress_bar.canvas.Canvas", wraps=canvas.Canvas
+    ) as Canvas:
+        paths = render_progress_bars(bars, tmp_path, svg=True)
+    # 30 curricula share 3 different bars
+    assert Canvas.call_count == 3
+
+    assert len(set(paths.values())) == 3
+    text = PdfReader(paths["Curriculum 2"]).pages[0].extract_text()
+    assert "Concrete Problems in AI Safety (40 min)" in text
+    assert "(30 min)" in text  # placeholder for readings without an estimate
+    with patch("src.progress_bar.vector_progress_bar.canvas.Canvas") as Canvas:
+        assert render_progress_bars(bars, tmp_path) == paths
+    Canvas.assert_not_called()
+
+def test_progress_bar_svg():
+    svg = progress_bar_svg(READINGS)
+
+    assert svg.count("<rect") == 3
+    assert "&lt;friends&gt;" in svg
+
+def test_stamp_progress_bar(tmp_path):
+    cover = tmp_path / "cover.pdf"
+    writer = PdfWriter()
+    writer.add_blank_page(612, 792)
+    writer.write(str(cover))
+    bar_path = render_progress_bars({"MAIA": READINGS}, tmp_path)["MAIA"]
+
+    stamp_progress_bar(cover, bar_path, (54, 54, 504, 168))
+
+    page = PdfReader(cover).pages[0]
+    assert "Risks from Learned Optimization (20 min)" in page.extract_text()
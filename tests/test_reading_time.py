@@ -0,0 +1,55 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from pypdf import PdfWriter
+from reportlab.pdfgen import canvas
+
+from src.utils.reading_time import add_reading_times, estimate_reading_times
+
+def make_text_pdf(path: Path, num_pages: int, words_per_page: int) -> Path:
+    c = canvas.Canvas(str(path))
+    for _ in range(num_pages):
+        text = c.beginText(50, 750)
+        for line in range(words_per_page // 10):
+            text.textLine(" ".join(["word"] * 10))
+        c.drawText(text)
+        c.showPage()
+    c.save()
+    return path
+
+def test_estimate_reading_times(tmp_path):
+    config = {"cache_dir": str(tmp_path / "cache"), "reading_time": {"words_per_minute": 100}}
+    long_reading = make_text_pdf(tmp_path / "long.pdf", 5, 400)
+    short_reading = make_text_pdf(tmp_path / "short.pdf", 1, 200)
+    scan = tmp_path / "scan.pdf"
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(612, 792)
+    writer.write(str(scan))
+
+    estimates = estimate_reading_times([long_reading, short_reading, scan], config)
+
+    assert [estimate["words"] for estimate in estimates] == [2000, 200, 0]
+    assert [estimate["minutes"] for estimate in estimates] == [20, 2, 12]
+    assert [estimate["text_extractable"] for estimate in estimates] == [True, True, False]
+
+    # Everything is cached by content hash now
+    with patch("src.utils.reading_time.analyze_pdf") as analyze_pdf:
+        assert estimate_reading_times([long_reading, short_reading, scan], config) == estimates
+    analyze_pdf.assert_not_called()
+
+def test_add_reading_times(tmp_path):
+    config = {"cache_dir": str(tmp_path / "cache")}
+    reading = make_text_pdf(tmp_path / "reading.pdf", 2, 1000)
+    precontext = {
+        "core_readings": [
+            {"title": "On paper", "trimmed_pdf": str(reading)},
+            {"title": "On device", "trimmed_pdf": None, "read_on_device": True},
+        ]
+    }
+
+    add_reading_times(precontext, config)
+
+    assert precontext["core_readings"][0]["reading_time_min"] == 10
+    assert "reading_time_min" not in precontext["core_readings"][1]
+    assert precontext["total_reading_time_min"] == 10
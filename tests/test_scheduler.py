@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+from src.scheduler import Scheduler, SchedulerError, Task
+
+def test_independent_tasks_run_concurrently():
+    scheduler = Scheduler(max_workers=4)
+    scheduler.add(Task("precontext", lambda deps: 1))
+    scheduler.add(Task("slow_a", lambda deps: time.sleep(0.2) or deps["precontext"] + 1, deps=["precontext"]))
+    scheduler.add(Task("slow_b", lambda deps: time.sleep(0.2) or deps["precontext"] + 2, deps=["precontext"]))
+    scheduler.add(Task("merge", lambda deps: deps["slow_a"] + deps["slow_b"], deps=["slow_a", "slow_b"]))
+
+    start = time.perf_counter()
+    results = scheduler.run()
+
+    assert time.perf_counter() - start < 0.35
+    assert results["merge"] == 5
+    path = [task.name for task in scheduler.critical_path()]
+    assert path[0] == "precontext" and path[-1] == "merge" and len(path) == 3
+    assert "Critical path" in scheduler.report()
+
+def test_failure_stops_dependents():
+    ran = []
+    scheduler = Scheduler()
+    scheduler.add(Task("fails", lambda deps: 1 / 0))
+    scheduler.add(Task("after", lambda deps: ran.append("after"), deps=["fails"]))
+
+    with pytest.raises(ZeroDivisionError):
+        scheduler.run()
+    assert ran == []
+
+def test_invalid_graphs():
+    scheduler = Scheduler()
+    scheduler.add(Task("a", lambda deps: None, deps=["b"]))
+    scheduler.add(Task("b", lambda deps: None, deps=["a"]))
+    with pytest.raises(SchedulerError, match="cycle"):
+        scheduler.run()
+
+    scheduler = Scheduler()
+    scheduler.add(Task("a", lambda deps: None, deps=["missing"]))
+    with pytest.raises(SchedulerError, match="unknown"):
+        scheduler.run()
@@ -0,0 +1,80 @@
+import io
+import json
+import threading
+from wsgiref.util import setup_testing_defaults
+
+from src.config import CONFIG_PATH, get_config, set_config_path
+from src.server import GenerationService, create_app
+
+def request(app, method, path, body=None, query=""):
+    data = json.dumps(body).encode() if body is not None else b""
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "CONTENT_LENGTH": str(len(data)),
+        "wsgi.input": io.BytesIO(data),
+    }
+    setup_testing_defaults(environ)
+    response = {}
+
+    def start_response(status, headers):
+        response["status"] = int(status.split()[0])
+        response["headers"] = dict(headers)
+
+    response["body"] = b"".join(app(environ, start_response))
+    return response
+
+def test_job_lifecycle(tmp_path):
+    release = threading.Event()
+    packet = tmp_path / "Packet.pdf"
+    packet.write_bytes(b"%PDF-1.7 packet")
+
+    def run_job(job, config):
+        release.wait(5)
+        return {"packet": packet, "cover": None}
+
+    config = {"curriculum": {"Meeting 1": {"make_packet": True, "record_id": "rec1"}}}
+    app = GenerationService(config, run_job)
+
+    response = request(app, "POST", "/jobs", {"curriculum_id": "rec1"})
+    assert response["status"] == 202
+    job = json.loads(response["body"])
+    assert job["curriculum"] == "Meeting 1" and response["headers"]["Location"] == f"/jobs/{job['id']}"
+    # The same curriculum isn't queued twice
+    again = request(app, "POST", "/jobs", {"curriculum_id": "rec1"})
+    assert again["status"] == 200 and json.loads(again["body"])["id"] == job["id"]
+    assert request(app, "GET", f"/jobs/{job['id']}/download")["status"] == 409
+
+    release.set()
+    app.close()
+    status = json.loads(request(app, "GET", f"/jobs/{job['id']}")["body"])
+    assert status["status"] == "done" and status["outputs"] == {"packet": str(packet)}
+    download = request(app, "GET", f"/jobs/{job['id']}/download")
+    assert download["status"] == 200 and download["body"] == b"%PDF-1.7 packet"
+    assert request(app, "GET", f"/jobs/{job['id']}/download", query="artifact=cover")["status"] == 404
+
+def test_bad_requests():
+    def fail(job, config):
+        raise RuntimeError("converter crashed")
+
+    app = GenerationService({"curriculum": {}}, fail)
+    assert request(app, "POST", "/jobs", {"record": "rec1"})["status"] == 400
+    assert request(app, "GET", "/jobs/nope")["status"] == 404
+    assert request(app, "DELETE", "/jobs")["status"] == 405
+
+    job = json.loads(request(app, "POST", "/jobs", {"curriculum_id": "rec2"})["body"])
+    app.close()
+    status = json.loads(request(app, "GET", f"/jobs/{job['id']}")["body"])
+    assert status["status"] == "failed" and "converter crashed" in status["error"]
+    assert json.loads(request(app, "GET", "/health")["body"])["jobs"] == {"failed": 1}
+
+def test_jobs_use_the_service_config(tmp_path):
+    config_path = tmp_path / "service.json"
+    config_path.write_text(json.dumps({"curriculum": {}, "output_dir": str(tmp_path)}))
+    try:
+        app = create_app(config_path, warm=False)
+        assert get_config() is app.config
+        assert get_config()["output_dir"] == str(tmp_path)
+    finally:
+        set_config_path(CONFIG_PATH)
@@ -0,0 +1,31 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = [
+    "airtable", "bs4", "docx2pdf", "docxtpl", "PIL", "pypdf", "qrcode", "reportlab", "rich",
+    "src.main",
+]
+SCRIPT = """
+import json, sys
+from src.cli import cli
+cli(["--help"], standalone_mode=False)
+print(json.dumps({"loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+def test_help_loads_no_heavy_modules_secrets_or_config(tmp_path):
+    # An empty working directory: no config.json and no secrets/.env
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT % HEAVY_MODULES],
+        cwd=tmp_path,
+        env={"PYTHONPATH": str(REPO)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "generate-all" in result.stdout
+    report = json.loads(result.stdout.splitlines()[-1])
+    # Heavy modules are what made --help slow
+    assert report["loaded"] == []
@@ -0,0 +1,44 @@
+from contextlib import ExitStack
+from pathlib import Path
+from unittest.mock import patch
+
+from pypdf import PdfReader, PdfWriter
+
+from src.ta_guide import generate_ta_guide, open_shared_ta_guides
+
+def make_pdf(path: Path, num_pages: int, bookmarks: bool = False) -> Path:
+    writer = PdfWriter()
+    for _ in range(num_pages):
+        writer.add_blank_page(612, 792)
+    if bookmarks:
+        writer.add_outline_item("Running the meeting", 0)
+        writer.add_named_destination("facilitation", 1)
+    writer.write(path)
+    return path
+
+class FakeGuide:
+    def __init__(self, template_path, output_dir, precontext, overwrite=False):
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.pdf_path = make_pdf(output_dir / "guide.pdf", 1)
+
+def test_cohort_guides_keep_base_guide_bookmarks(tmp_path):
+    precontext = {
+        "meeting_ta_guide_pdf": None,
+        "base_ta_guide_pdf": str(make_pdf(tmp_path / "base.pdf", 2, bookmarks=True)),
+    }
+    config = {"pdf": {"streaming_merge": True}, "templates": {"tas_guide": "guide.docx"}}
+    with ExitStack() as stack, patch("src.ta_guide.GuideGenerator", FakeGuide):
+        shared_pdfs = open_shared_ta_guides(precontext, stack)
+        paths = [
+            generate_ta_guide(
+                precontext, {"name": name, "num_members": 4}, tmp_path, config, shared_pdfs
+            )
+            for name in ("Cohort 1", "Cohort 2")
+        ]
+
+    for path in paths:
+        reader = PdfReader(path)
+        assert len(reader.pages) == 4
+        assert [item.title for item in reader.outline] == ["Running the meeting"]
+        assert reader.get_destination_page_number(reader.outline[0]) == 2
+        assert "facilitation" in reader.named_destinations